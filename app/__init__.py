@@ -1,5 +1,4 @@
 import os
-import logging
 from flask import Flask
 from flask_cors import CORS
 from config import config
@@ -18,18 +17,8 @@ def create_app(config_name=None):
     
     # Configure logging
     if not app.debug and not app.testing:
-        if app.config.get('LOG_TO_STDOUT'):
-            stream_handler = logging.StreamHandler()
-            stream_handler.setLevel(logging.INFO)
-            app.logger.addHandler(stream_handler)
-        else:
-            if not os.path.exists('logs'):
-                os.mkdir('logs')
-            file_handler = logging.FileHandler('logs/app.log')
-            file_handler.setLevel(logging.INFO)
-            app.logger.addHandler(file_handler)
-        
-        app.logger.setLevel(logging.INFO)
+        import logging_setup
+        logging_setup.configure_logging(app)
         app.logger.info('Application startup')
     
     # Configure CORS
@@ -38,8 +27,6 @@ def create_app(config_name=None):
     # Register blueprints
     from blueprints.main import main
     from blueprints.static import static_bp
-    from blueprints.api import api
-    from blueprints.api_v1 import api_v1
     from blueprints.errors import errors
     from blueprints.contacts import contacts
     from blueprints.game import game
@@ -54,6 +41,8 @@ def create_app(config_name=None):
     
     # Only register API blueprints if enabled
     if app.config.get('ENABLE_API', True):
+        from blueprints.api import api
+        from blueprints.api_v1 import api_v1
         app.register_blueprint(api)
         app.register_blueprint(api_v1)  # New consolidated API v1
     
@@ -67,6 +56,46 @@ def create_app(config_name=None):
     import database
     database.init_app(app)
     
+    # Publish database writes to live event streams
+    import events
+    events.init_app(app)
+    
+    # Refresh nginx micro-cache entries made stale by writes
+    import http_cache
+    http_cache.init_app(app)
+    
+    # Serve random affirmations from a snapshot shared between workers
+    import snapshot
+    snapshot.init_app(app)
+    
+    # Weighted, non-repeating choice of affirmations
+    import sampling
+    sampling.init_app(app)
+    
+    # Contact autocomplete from an in-memory prefix index
+    import suggest
+    suggest.init_app(app)
+    
+    # Dashboard statistics counters, updated on every write
+    import stats
+    stats.init_app(app)
+    
+    # Shed load on database-backed routes before MongoDB slowness spreads
+    import concurrency
+    concurrency.init_app(app)
+    
+    # Load templates through the bytecode cache and precompiled bundle
+    import templating
+    templating.init_app(app)
+    
+    # Compile templates now and serve /ready once the worker is warm
+    import warmup
+    warmup.init_app(app)
+    
+    # Opt-in request profiling (wraps the WSGI app, so install it last)
+    import profiling
+    profiling.init_app(app)
+    
     return app
 
 
@@ -0,0 +1,178 @@
+"""Dispatch of batched API sub-requests.
+
+``POST /api/v1/batch`` takes a list of sub-requests and runs each one through
+the application's full WSGI stack in-process, so sub-requests behave exactly
+like separate API calls (validation, error handlers) but cost the client a
+single round trip. The batch holds one concurrency slot (see concurrency.py)
+and its sub-requests run under it, so a batch never sheds its own requests.
+
+Consecutive ``GET`` sub-requests are independent and run concurrently on a
+shared thread pool. Any other method is a barrier: it runs alone, after the
+reads before it and before the requests after it, so a batch can read its
+own writes.
+
+Sub-requests carry the client's cookies, updated by the ``Set-Cookie``
+headers of the sub-responses before them: a read after a write in the same
+batch goes to the primary and sees the session as the write left it. Those
+headers are also returned on the batch response.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import CookieError, SimpleCookie
+
+from flask import current_app, request
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+from encoding import available_types, decode
+
+ALLOWED_METHODS = {'GET', 'POST', 'PUT', 'DELETE'}
+PATH_PREFIX = '/api/v1/'
+# Recursive batches and never-ending streams cannot be dispatched
+EXCLUDED_PATHS = {'/api/v1/batch', '/api/v1/stream'}
+# Headers copied from the batch request to every sub-request
+FORWARDED_HEADERS = ('Accept', 'Authorization', 'Cookie', 'User-Agent', 'X-Real-IP', 'X-Forwarded-For')
+# WSGI environ key marking a sub-request, which concurrency.py does not limit
+SUBREQUEST_KEY = 'batch.subrequest'
+
+_executor = None
+
+
+class BatchError(ValueError):
+    """The batch request is malformed."""
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=current_app.config['BATCH_MAX_WORKERS'],
+            thread_name_prefix='batch'
+        )
+    return _executor
+
+
+def validate(items):
+    """Check the sub-requests of a batch and normalize their methods."""
+    if not isinstance(items, list) or not items:
+        raise BatchError('requests must be a non-empty list')
+    if len(items) > current_app.config['BATCH_MAX_REQUESTS']:
+        raise BatchError(f"At most {current_app.config['BATCH_MAX_REQUESTS']} requests are allowed per batch")
+
+    normalized = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise BatchError(f'Request {index}: path is required')
+        method = str(item.get('method', 'GET')).upper()
+        path = item['path']
+        if method not in ALLOWED_METHODS:
+            raise BatchError(f'Request {index}: method {method} is not allowed')
+        if not path.startswith(PATH_PREFIX) or path.split('?', 1)[0] in EXCLUDED_PATHS:
+            raise BatchError(f'Request {index}: path {path} cannot be batched')
+        normalized.append({'method': method, 'path': path, 'body': item.get('body')})
+    return normalized
+
+
+def _dispatch(app, item, headers):
+    """Run one sub-request through the WSGI app and capture its response."""
+    builder = EnvironBuilder(
+        path=item['path'],
+        method=item['method'],
+        headers=headers,
+        json=item['body'] if item['body'] is not None else None,
+        environ_overrides={SUBREQUEST_KEY: True}
+    )
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+
+    app_iter, status, response_headers = run_wsgi_app(app, environ)
+    try:
+        body = b''.join(app_iter)
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+
+    # Sub-responses are decoded so the batch response can re-encode them in
+    # the negotiated format
+    content_type = response_headers.get('Content-Type', '')
+    mimetype = content_type.split(';', 1)[0].strip()
+    if mimetype in available_types():
+        body = decode(body, mimetype)
+    else:
+        body = body.decode('utf-8', errors='replace')
+    return {
+        'status': int(status.split(' ', 1)[0]),
+        'content_type': content_type,
+        'body': body
+    }, response_headers.getlist('Set-Cookie')
+
+
+def _failed(app, item, error):
+    """The response of a sub-request that raised instead of responding."""
+    app.logger.error(f"Batch sub-request {item['method']} {item['path']} failed: {error!r}")
+    return {
+        'status': 500,
+        'content_type': 'application/json',
+        'body': {'status': 'error', 'message': str(error)}
+    }, []
+
+
+def _update_jar(jar, set_cookies):
+    for header in set_cookies:
+        cookie = SimpleCookie()
+        try:
+            cookie.load(header)
+        except CookieError:
+            continue
+        for name, morsel in cookie.items():
+            if morsel['max-age'] == '0' or not morsel.value:
+                jar.pop(name, None)
+            else:
+                jar[name] = morsel.value
+
+
+def run_batch(items):
+    """Dispatch validated sub-requests.
+
+    Returns their responses in order, and the ``Set-Cookie`` headers to
+    send back with the batch response.
+    """
+    app = current_app._get_current_object()
+    headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+    jar = dict(request.cookies)
+    executor = _get_executor()
+
+    results = [None] * len(items)
+    set_cookies = []
+    pending_reads = []
+
+    def record(index, outcome):
+        results[index], cookies = outcome
+        if cookies:
+            set_cookies.extend(cookies)
+            _update_jar(jar, cookies)
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in jar.items())
+
+    def dispatch(index):
+        try:
+            return _dispatch(app, items[index], dict(headers))
+        except Exception as e:
+            return _failed(app, items[index], e)
+
+    def flush_reads():
+        if len(pending_reads) == 1:
+            record(pending_reads[0], dispatch(pending_reads[0]))
+        elif pending_reads:
+            futures = {index: executor.submit(dispatch, index) for index in pending_reads}
+            for index, future in futures.items():
+                record(index, future.result())
+        pending_reads.clear()
+
+    for index, item in enumerate(items):
+        if item['method'] == 'GET':
+            pending_reads.append(index)
+        else:
+            flush_reads()
+            record(index, dispatch(index))
+    flush_reads()
+    return results, set_cookies
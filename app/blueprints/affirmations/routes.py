@@ -2,9 +2,11 @@
 from flask import render_template, jsonify, request
 from datetime import datetime
 from bson import ObjectId
-import random
 from . import affirmations
 from database import get_db, insert_document, find_documents, update_document, delete_document
+from sampling import next_affirmation
+from sync import record_tombstone
+from serializers import serialize_document, serialize_documents
 
 
 @affirmations.route('/')
@@ -18,16 +20,10 @@ def list_affirmations():
     """API endpoint to get all affirmations."""
     try:
         # Get all affirmations from database
-        affirmations_list = find_documents('affirmations')
+        affirmations_list = find_documents('affirmations', read='secondary')
         
-        # Convert ObjectId to string for JSON serialization
-        for affirmation in affirmations_list:
-            affirmation['_id'] = str(affirmation['_id'])
-            # Convert datetime objects to ISO format strings
-            if 'created_at' in affirmation and affirmation['created_at']:
-                affirmation['created_at'] = affirmation['created_at'].isoformat()
-            if 'updated_at' in affirmation and affirmation['updated_at']:
-                affirmation['updated_at'] = affirmation['updated_at'].isoformat()
+        # Convert ObjectId and datetime fields for JSON serialization
+        serialize_documents(affirmations_list)
         
         return jsonify({
             'status': 'success',
@@ -150,6 +146,7 @@ def delete_affirmation(affirmation_id):
         deleted_count = delete_document('affirmations', {'_id': obj_id})
         
         if deleted_count > 0:
+            record_tombstone('affirmations', obj_id)
             return jsonify({
                 'status': 'success',
                 'message': 'Affirmation deleted successfully'
@@ -171,25 +168,21 @@ def delete_affirmation(affirmation_id):
 def get_random_affirmation():
     """API endpoint to get a random affirmation."""
     try:
-        # Get all affirmations from database
-        affirmations_list = find_documents('affirmations')
+        # Weighted by category; ?rotate=true avoids repeats per session
+        random_affirmation = next_affirmation(
+            request.args.get('campaign'),
+            rotate=request.args.get('rotate', '').lower() in ('1', 'true')
+        )
         
-        if not affirmations_list:
+        if random_affirmation is None:
             return jsonify({
                 'status': 'success',
                 'affirmation': None,
                 'message': 'No affirmations found'
             })
         
-        # Select a random affirmation
-        random_affirmation = random.choice(affirmations_list)
-        
-        # Convert ObjectId to string
-        random_affirmation['_id'] = str(random_affirmation['_id'])
-        if 'created_at' in random_affirmation and random_affirmation['created_at']:
-            random_affirmation['created_at'] = random_affirmation['created_at'].isoformat()
-        if 'updated_at' in random_affirmation and random_affirmation['updated_at']:
-            random_affirmation['updated_at'] = random_affirmation['updated_at'].isoformat()
+        # Convert ObjectId and datetime fields
+        serialize_document(random_affirmation)
         
         return jsonify({
             'status': 'success',
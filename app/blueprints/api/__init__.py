@@ -1,5 +1,10 @@
 from flask import Blueprint
+from ..lazy import add_lazy_url_rule
 
 api = Blueprint('api', __name__, url_prefix='/api/v1')
 
-from . import routes
\ No newline at end of file
+# Legacy endpoints, superseded by api_v1: routes.py is imported by the first
+# request to one of them
+add_lazy_url_rule(api, '/status', 'blueprints.api.routes.api_status')
+add_lazy_url_rule(api, '/echo', 'blueprints.api.routes.echo', methods=['POST'])
+add_lazy_url_rule(api, '/users', 'blueprints.api.routes.get_users', methods=['GET'])
\ No newline at end of file
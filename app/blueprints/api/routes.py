@@ -1,8 +1,7 @@
+"""Legacy API views, routed lazily in ``__init__.py``."""
 from flask import jsonify, request
-from . import api
 
 
-@api.route('/status')
 def api_status():
     """API status endpoint."""
     return jsonify({
@@ -12,7 +11,6 @@ def api_status():
     })
 
 
-@api.route('/echo', methods=['POST'])
 def echo():
     """Echo endpoint for testing - returns the posted JSON data."""
     data = request.get_json()
@@ -26,7 +24,6 @@ def echo():
 
 
 # Example endpoint structure for future development
-@api.route('/users', methods=['GET'])
 def get_users():
     """Example users endpoint - to be implemented."""
     # This is a placeholder for future implementation
@@ -2,12 +2,23 @@
 Consolidated API v1 routes.
 This blueprint unifies all API endpoints under /api/v1/ structure.
 """
-from flask import jsonify, request
+from flask import current_app, request
 from datetime import datetime
 from bson import ObjectId
-import random
 from . import api_v1
-from database import test_connection, get_db, insert_document, find_documents, update_document, delete_document
+from database import test_connection, get_db, insert_document, find_documents, search_documents, update_document, delete_document, coalescing_snapshot
+from batch import BatchError, run_batch, validate as validate_batch
+from concurrency import get_limiters
+from dedup import apply_merges, contact_keys, duplicate_conflict, find_proposals, key_changes
+from diagnostics import mongodb_test as run_mongodb_test
+from encoding import api_response, wants_native
+from events import stream_response
+from sync import SyncTokenExpired, changes_since, record_tombstone
+from sampling import next_affirmation
+from suggest import get_index, prefix_query
+from snapshot import snapshot_status
+from stats import METRICS, get_stats
+from serializers import CONTACT_FIELDS, PUBLIC_PROJECTIONS, normalize_contact, serialize_document, serialize_documents
 
 
 # ============================================================================
@@ -34,54 +45,192 @@ def health():
 @api_v1.route('/system/status')
 def system_status():
     """API system status endpoint."""
-    return jsonify({
+    return api_response({
         'status': 'active',
         'version': '1.0.0',
         'message': 'API v1 is running',
-        'timestamp': datetime.utcnow().isoformat()
+        'timestamp': datetime.utcnow().isoformat(),
+        'concurrency': {name: limiter.snapshot() for name, limiter in get_limiters().items()},
+        'coalescing': coalescing_snapshot(),
+        'affirmations_snapshot': snapshot_status()
     })
 
 
 @api_v1.route('/system/mongodb-test')
 def mongodb_test():
-    """Test MongoDB connection and demonstrate basic operations."""
+    """Test MongoDB connection and demonstrate basic operations.
+
+    ``?mode=read`` measures the round trips without writing.
+    """
     try:
-        # Test connection
-        connected, message = test_connection()
-        
-        if connected:
-            # Insert a test document
-            test_doc = {
-                'type': 'test',
-                'timestamp': datetime.utcnow(),
-                'message': 'MongoDB integration test - API v1'
-            }
-            doc_id = insert_document('test_collection', test_doc)
-            
-            # Retrieve recent test documents
-            recent_tests = find_documents('test_collection', {'type': 'test'}, limit=5)
-            
-            return jsonify({
-                'status': 'success',
-                'connection': message,
-                'inserted_id': str(doc_id),
-                'recent_tests': [
-                    {
-                        'id': str(doc.get('_id')),
-                        'timestamp': doc.get('timestamp').isoformat() if doc.get('timestamp') else None,
-                        'message': doc.get('message')
-                    }
-                    for doc in recent_tests
-                ]
-            })
-        else:
-            return jsonify({
-                'status': 'error',
-                'connection': message
-            }), 503
-            
+        payload, status = run_mongodb_test('MongoDB integration test - API v1')
+        return api_response(payload), status
+    except Exception as e:
+        return api_response({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+# ============================================================================
+# LIVE EVENTS
+# ============================================================================
+
+@api_v1.route('/stream')
+def stream():
+    """Server-Sent Events stream of contact and affirmation changes."""
+    return stream_response(request.headers.get('Last-Event-ID'))
+
+
+# ============================================================================
+# BATCH REQUESTS
+# ============================================================================
+
+@api_v1.route('/batch', methods=['POST'])
+def batch():
+    """Dispatch several API requests in one round trip.
+    
+    Body: ``{"requests": [{"method": "GET", "path": "/api/v1/health"}, ...]}``.
+    Responses come back in request order, each with its own status code.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        items = validate_batch(data.get('requests'))
+    except BatchError as e:
+        return api_response({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    
+    responses, set_cookies = run_batch(items)
+    response = api_response({
+        'status': 'success',
+        'responses': responses
+    })
+    for header in set_cookies:
+        response.headers.add('Set-Cookie', header)
+    return response
+
+
+# ============================================================================
+# DELTA SYNC
+# ============================================================================
+
+def _changes_response(collection_name):
+    """Build the response for a ``/<collection>/changes?since=`` request."""
+    try:
+        result = changes_since(collection_name, request.args.get('since'))
+    except ValueError as e:
+        return api_response({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except SyncTokenExpired:
+        return api_response({
+            'status': 'error',
+            'message': 'Sync token expired, a full sync is required'
+        }), 410
+    except Exception as e:
+        return api_response({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+    
+    # Convert ObjectId and datetime fields for JSON serialization;
+    # MessagePack and CBOR encode them natively
+    if not wants_native():
+        serialize_documents(result['changes'])
+    
+    return api_response({
+        'status': 'success',
+        collection_name: result['changes'],
+        'deleted': result['deleted'],
+        'next_token': result['next_token'],
+        'full_sync': result['full_sync'],
+        'count': len(result['changes'])
+    })
+
+
+# ============================================================================
+# STATISTICS
+# ============================================================================
+
+@api_v1.route('/stats')
+def stats():
+    """Dashboard counters: contacts per company, signups per day, affirmations per category."""
+    metric = request.args.get('metric')
+    if metric is not None and metric not in METRICS:
+        return api_response({
+            'status': 'error',
+            'message': f"metric must be one of {', '.join(METRICS)}"
+        }), 400
+    if not current_app.config['STATS_ENABLED']:
+        return api_response({
+            'status': 'error',
+            'message': 'Statistics are disabled'
+        }), 404
+    try:
+        return api_response({
+            'status': 'success',
+            'stats': get_stats(metric)
+        })
+    except Exception as e:
+        return api_response({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+# ============================================================================
+# SEARCH
+# ============================================================================
+
+# Fields returned per search type: enough to list a result, not the whole document
+SEARCH_PROJECTIONS = {
+    'contacts': {'first_name': 1, 'last_name': 1, 'email': 1, 'company': 1, 'notes': 1},
+    'affirmations': {'text': 1, 'author': 1, 'category': 1}
+}
+
+
+@api_v1.route('/search')
+def search():
+    """Ranked full-text search: ``?q=&type=contacts|affirmations&page=&per_page=``."""
+    query = request.args.get('q', '').strip()
+    search_type = request.args.get('type', 'contacts')
+    max_per_page = current_app.config['SEARCH_MAX_PER_PAGE']
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 20))
+    except ValueError:
+        page = per_page = 0
+    if not query or search_type not in SEARCH_PROJECTIONS or page < 1 or not 1 <= per_page <= max_per_page:
+        return api_response({
+            'status': 'error',
+            'message': f"q is required, type must be contacts or affirmations, page must be at least 1 "
+                       f"and per_page between 1 and {max_per_page}"
+        }), 400
+    
+    try:
+        # One more than a page tells whether there is a next one
+        results = search_documents(
+            search_type, query, skip=(page - 1) * per_page, limit=per_page + 1,
+            read='secondary', projection=SEARCH_PROJECTIONS[search_type]
+        )
+        has_more = len(results) > per_page
+        results = results[:per_page]
+        if not wants_native():
+            serialize_documents(results)
+        return api_response({
+            'status': 'success',
+            'type': search_type,
+            'results': results,
+            'count': len(results),
+            'page': page,
+            'per_page': per_page,
+            'has_more': has_more
+        })
     except Exception as e:
-        return jsonify({
+        return api_response({
             'status': 'error',
             'message': str(e)
         }), 500
@@ -96,24 +245,60 @@ def list_contacts():
     """Get all contacts."""
     try:
         # Get all contacts from database
-        contacts_list = find_documents('contacts')
-        
-        # Convert ObjectId to string for JSON serialization
-        for contact in contacts_list:
-            contact['_id'] = str(contact['_id'])
-            # Convert datetime objects to ISO format strings
-            if 'created_at' in contact and contact['created_at']:
-                contact['created_at'] = contact['created_at'].isoformat()
-            if 'updated_at' in contact and contact['updated_at']:
-                contact['updated_at'] = contact['updated_at'].isoformat()
-        
-        return jsonify({
+        contacts_list = find_documents('contacts', read='secondary', projection=PUBLIC_PROJECTIONS['contacts'])
+        
+        # Convert ObjectId and datetime fields for JSON serialization;
+        # MessagePack and CBOR encode them natively
+        if not wants_native():
+            serialize_documents(contacts_list)
+        
+        return api_response({
             'status': 'success',
             'contacts': contacts_list,
             'count': len(contacts_list)
         })
     except Exception as e:
-        return jsonify({
+        return api_response({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+@api_v1.route('/contacts/changes', methods=['GET'])
+def contacts_changes():
+    """Get contacts created, updated or deleted since a sync token."""
+    return _changes_response('contacts')
+
+
+@api_v1.route('/contacts/suggest', methods=['GET'])
+def suggest_contacts():
+    """Suggest contacts whose names, email or company start with ``q``."""
+    if 'contact_suggest' not in current_app.extensions:
+        return api_response({
+            'status': 'error',
+            'message': 'Contact suggestions are disabled'
+        }), 404
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= current_app.config['CONTACT_SUGGEST_MAX_LIMIT']:
+        return api_response({
+            'status': 'error',
+            'message': f"limit must be between 1 and {current_app.config['CONTACT_SUGGEST_MAX_LIMIT']}"
+        }), 400
+    try:
+        # From the database while the index is loading or too large
+        index = get_index()
+        query = request.args.get('q', '')
+        suggestions = index.suggest(query, limit) if index is not None else prefix_query(query, limit)
+        return api_response({
+            'status': 'success',
+            'suggestions': suggestions,
+            'count': len(suggestions)
+        })
+    except Exception as e:
+        return api_response({
             'status': 'error',
             'message': str(e)
         }), 500
@@ -130,34 +315,84 @@ def create_contact():
         required_fields = ['first_name', 'last_name', 'email']
         for field in required_fields:
             if not data.get(field):
-                return jsonify({
+                return api_response({
                     'status': 'error',
                     'message': f'{field} is required'
                 }), 400
         
         # Create contact document
-        contact = {
-            'first_name': data.get('first_name', '').strip(),
-            'last_name': data.get('last_name', '').strip(),
-            'email': data.get('email', '').strip().lower(),
-            'phone': data.get('phone', '').strip(),
-            'company': data.get('company', '').strip(),
-            'notes': data.get('notes', '').strip(),
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
-        }
+        contact = normalize_contact(data, datetime.utcnow())
+        contact.update(contact_keys(contact))
+        
+        # Indexed duplicate check; ?allow_duplicate=true skips it
+        conflict = duplicate_conflict(contact)
+        if conflict:
+            return api_response(conflict), 409
         
         # Insert into database
         contact_id = insert_document('contacts', contact)
         
-        return jsonify({
+        return api_response({
             'status': 'success',
             'message': 'Contact added successfully',
             'contact_id': str(contact_id)
         }), 201
         
     except Exception as e:
-        return jsonify({
+        return api_response({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+@api_v1.route('/contacts/duplicates', methods=['GET'])
+def contact_duplicates():
+    """Propose merges of duplicate contacts."""
+    try:
+        proposals, skipped_blocks = find_proposals()
+        return api_response({
+            'status': 'success',
+            'proposals': proposals,
+            'count': len(proposals),
+            'skipped_blocks': skipped_blocks
+        })
+    except Exception as e:
+        return api_response({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+@api_v1.route('/contacts/merge', methods=['POST'])
+def merge_contacts():
+    """Apply approved merge proposals in bulk."""
+    try:
+        data = request.get_json()
+        merges = data.get('merges') if isinstance(data, dict) else None
+        if not isinstance(merges, list) or not merges:
+            return api_response({
+                'status': 'error',
+                'message': 'merges must be a non-empty list of proposals'
+            }), 400
+        if len(merges) > current_app.config['DEDUP_MAX_MERGES']:
+            return api_response({
+                'status': 'error',
+                'message': f"At most {current_app.config['DEDUP_MAX_MERGES']} merges per request"
+            }), 400
+        
+        results = apply_merges(merges)
+        return api_response({
+            'status': 'success',
+            'results': results,
+            'merged': sum(1 for result in results if result['status'] == 'merged')
+        })
+    except ValueError as e:
+        return api_response({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return api_response({
             'status': 'error',
             'message': str(e)
         }), 500
@@ -174,13 +409,13 @@ def update_contact(contact_id):
         update_data = {}
         
         # Only update fields that are provided
-        fields = ['first_name', 'last_name', 'email', 'phone', 'company', 'notes']
-        for field in fields:
+        for field in CONTACT_FIELDS:
             if field in data:
                 update_data[field] = data[field].strip() if isinstance(data[field], str) else data[field]
         
-        # Add updated timestamp
+        # Add updated timestamp and the match keys of changed names, etc.
         update_data['updated_at'] = datetime.utcnow()
+        update_data.update(key_changes(ObjectId(contact_id), update_data))
         
         # Update the document
         modified_count = update_document(
@@ -190,18 +425,18 @@ def update_contact(contact_id):
         )
         
         if modified_count > 0:
-            return jsonify({
+            return api_response({
                 'status': 'success',
                 'message': 'Contact updated successfully'
             })
         else:
-            return jsonify({
+            return api_response({
                 'status': 'error',
                 'message': 'Contact not found'
             }), 404
             
     except Exception as e:
-        return jsonify({
+        return api_response({
             'status': 'error',
             'message': str(e)
         }), 500
@@ -218,18 +453,19 @@ def delete_contact(contact_id):
         )
         
         if deleted_count > 0:
-            return jsonify({
+            record_tombstone('contacts', contact_id)
+            return api_response({
                 'status': 'success',
                 'message': 'Contact deleted successfully'
             })
         else:
-            return jsonify({
+            return api_response({
                 'status': 'error',
                 'message': 'Contact not found'
             }), 404
             
     except Exception as e:
-        return jsonify({
+        return api_response({
             'status': 'error',
             'message': str(e)
         }), 500
@@ -244,29 +480,31 @@ def list_affirmations():
     """Get all affirmations."""
     try:
         # Get all affirmations from database
-        affirmations_list = find_documents('affirmations')
-        
-        # Convert ObjectId to string for JSON serialization
-        for affirmation in affirmations_list:
-            affirmation['_id'] = str(affirmation['_id'])
-            # Convert datetime objects to ISO format strings
-            if 'created_at' in affirmation and affirmation['created_at']:
-                affirmation['created_at'] = affirmation['created_at'].isoformat()
-            if 'updated_at' in affirmation and affirmation['updated_at']:
-                affirmation['updated_at'] = affirmation['updated_at'].isoformat()
-        
-        return jsonify({
+        affirmations_list = find_documents('affirmations', read='secondary')
+        
+        # Convert ObjectId and datetime fields for JSON serialization;
+        # MessagePack and CBOR encode them natively
+        if not wants_native():
+            serialize_documents(affirmations_list)
+        
+        return api_response({
             'status': 'success',
             'affirmations': affirmations_list,
             'count': len(affirmations_list)
         })
     except Exception as e:
-        return jsonify({
+        return api_response({
             'status': 'error',
             'message': str(e)
         }), 500
 
 
+@api_v1.route('/affirmations/changes', methods=['GET'])
+def affirmations_changes():
+    """Get affirmations created, updated or deleted since a sync token."""
+    return _changes_response('affirmations')
+
+
 @api_v1.route('/affirmations', methods=['POST'])
 def create_affirmation():
     """Create a new affirmation."""
@@ -276,7 +514,7 @@ def create_affirmation():
         
         # Validate required fields
         if not data or 'text' not in data:
-            return jsonify({
+            return api_response({
                 'status': 'error',
                 'message': 'Text field is required'
             }), 400
@@ -293,13 +531,13 @@ def create_affirmation():
         # Insert into database
         doc_id = insert_document('affirmations', affirmation)
         
-        return jsonify({
+        return api_response({
             'status': 'success',
             'message': 'Affirmation added successfully',
             'id': str(doc_id)
         })
     except Exception as e:
-        return jsonify({
+        return api_response({
             'status': 'error',
             'message': str(e)
         }), 500
@@ -309,32 +547,29 @@ def create_affirmation():
 def get_random_affirmation():
     """Get a random affirmation."""
     try:
-        # Get all affirmations from database
-        affirmations_list = find_documents('affirmations')
+        # Weighted by category; ?rotate=true avoids repeats per session
+        random_affirmation = next_affirmation(
+            request.args.get('campaign'),
+            rotate=request.args.get('rotate', '').lower() in ('1', 'true')
+        )
         
-        if not affirmations_list:
-            return jsonify({
+        if random_affirmation is None:
+            return api_response({
                 'status': 'success',
                 'affirmation': None,
                 'message': 'No affirmations found'
             })
         
-        # Select a random affirmation
-        random_affirmation = random.choice(affirmations_list)
-        
-        # Convert ObjectId to string
-        random_affirmation['_id'] = str(random_affirmation['_id'])
-        if 'created_at' in random_affirmation and random_affirmation['created_at']:
-            random_affirmation['created_at'] = random_affirmation['created_at'].isoformat()
-        if 'updated_at' in random_affirmation and random_affirmation['updated_at']:
-            random_affirmation['updated_at'] = random_affirmation['updated_at'].isoformat()
+        # Convert ObjectId and datetime fields unless encoded natively
+        if not wants_native():
+            serialize_document(random_affirmation)
         
-        return jsonify({
+        return api_response({
             'status': 'success',
             'affirmation': random_affirmation
         })
     except Exception as e:
-        return jsonify({
+        return api_response({
             'status': 'error',
             'message': str(e)
         }), 500
@@ -351,7 +586,7 @@ def update_affirmation(affirmation_id):
         try:
             obj_id = ObjectId(affirmation_id)
         except:
-            return jsonify({
+            return api_response({
                 'status': 'error',
                 'message': 'Invalid affirmation ID'
             }), 400
@@ -366,7 +601,7 @@ def update_affirmation(affirmation_id):
             update_data['category'] = data['category'].strip()
         
         if not update_data:
-            return jsonify({
+            return api_response({
                 'status': 'error',
                 'message': 'No valid fields to update'
             }), 400
@@ -377,18 +612,18 @@ def update_affirmation(affirmation_id):
         modified_count = update_document('affirmations', {'_id': obj_id}, update_data)
         
         if modified_count > 0:
-            return jsonify({
+            return api_response({
                 'status': 'success',
                 'message': 'Affirmation updated successfully'
             })
         else:
-            return jsonify({
+            return api_response({
                 'status': 'error',
                 'message': 'Affirmation not found'
             }), 404
             
     except Exception as e:
-        return jsonify({
+        return api_response({
             'status': 'error',
             'message': str(e)
         }), 500
@@ -402,7 +637,7 @@ def delete_affirmation(affirmation_id):
         try:
             obj_id = ObjectId(affirmation_id)
         except:
-            return jsonify({
+            return api_response({
                 'status': 'error',
                 'message': 'Invalid affirmation ID'
             }), 400
@@ -411,18 +646,19 @@ def delete_affirmation(affirmation_id):
         deleted_count = delete_document('affirmations', {'_id': obj_id})
         
         if deleted_count > 0:
-            return jsonify({
+            record_tombstone('affirmations', obj_id)
+            return api_response({
                 'status': 'success',
                 'message': 'Affirmation deleted successfully'
             })
         else:
-            return jsonify({
+            return api_response({
                 'status': 'error',
                 'message': 'Affirmation not found'
             }), 404
             
     except Exception as e:
-        return jsonify({
+        return api_response({
             'status': 'error',
             'message': str(e)
         }), 500
\ No newline at end of file
@@ -4,6 +4,9 @@ from datetime import datetime
 from bson import ObjectId
 from . import contacts
 from database import get_db, insert_document, find_documents, update_document, delete_document
+from dedup import contact_keys, duplicate_conflict, key_changes
+from sync import record_tombstone
+from serializers import CONTACT_FIELDS, PUBLIC_PROJECTIONS, normalize_contact, serialize_documents
 
 
 @contacts.route('/')
@@ -17,16 +20,10 @@ def list_contacts():
     """API endpoint to get all contacts."""
     try:
         # Get all contacts from database
-        contacts_list = find_documents('contacts')
+        contacts_list = find_documents('contacts', read='secondary', projection=PUBLIC_PROJECTIONS['contacts'])
         
-        # Convert ObjectId to string for JSON serialization
-        for contact in contacts_list:
-            contact['_id'] = str(contact['_id'])
-            # Convert datetime objects to ISO format strings
-            if 'created_at' in contact and contact['created_at']:
-                contact['created_at'] = contact['created_at'].isoformat()
-            if 'updated_at' in contact and contact['updated_at']:
-                contact['updated_at'] = contact['updated_at'].isoformat()
+        # Convert ObjectId and datetime fields for JSON serialization
+        serialize_documents(contacts_list)
         
         return jsonify({
             'status': 'success',
@@ -57,16 +54,13 @@ def add_contact():
                 }), 400
         
         # Create contact document
-        contact = {
-            'first_name': data.get('first_name', '').strip(),
-            'last_name': data.get('last_name', '').strip(),
-            'email': data.get('email', '').strip().lower(),
-            'phone': data.get('phone', '').strip(),
-            'company': data.get('company', '').strip(),
-            'notes': data.get('notes', '').strip(),
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
-        }
+        contact = normalize_contact(data, datetime.utcnow())
+        contact.update(contact_keys(contact))
+        
+        # Indexed duplicate check; ?allow_duplicate=true skips it
+        conflict = duplicate_conflict(contact)
+        if conflict:
+            return jsonify(conflict), 409
         
         # Insert into database
         contact_id = insert_document('contacts', contact)
@@ -95,13 +89,13 @@ def update_contact(contact_id):
         update_data = {}
         
         # Only update fields that are provided
-        fields = ['first_name', 'last_name', 'email', 'phone', 'company', 'notes']
-        for field in fields:
+        for field in CONTACT_FIELDS:
             if field in data:
                 update_data[field] = data[field].strip() if isinstance(data[field], str) else data[field]
         
-        # Add updated timestamp
+        # Add updated timestamp and the match keys of changed names, etc.
         update_data['updated_at'] = datetime.utcnow()
+        update_data.update(key_changes(ObjectId(contact_id), update_data))
         
         # Update the document
         modified_count = update_document(
@@ -139,6 +133,7 @@ def delete_contact(contact_id):
         )
         
         if deleted_count > 0:
+            record_tombstone('contacts', contact_id)
             return jsonify({
                 'status': 'success',
                 'message': 'Contact deleted successfully'
@@ -1,5 +1,7 @@
 from flask import Blueprint
+from ..lazy import add_lazy_url_rule
 
 game = Blueprint('game', __name__)
 
-from . import routes
\ No newline at end of file
+# Rarely visited: routes.py is imported by the first request
+add_lazy_url_rule(game, '/game', 'blueprints.game.routes.squeaky_toy_game')
\ No newline at end of file
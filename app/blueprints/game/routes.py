@@ -1,8 +1,7 @@
+"""Game views, routed lazily in ``__init__.py``."""
 from flask import render_template
-from . import game
 
 
-@game.route('/game')
 def squeaky_toy_game():
     """Squeaky Toy Challenge game page."""
     return render_template('game.html')
\ No newline at end of file
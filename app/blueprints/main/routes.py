@@ -1,7 +1,7 @@
-from flask import render_template, jsonify
+from flask import current_app, render_template, jsonify, request
 from . import main
-from database import test_connection, find_documents
-import random
+from database import test_connection
+from sampling import next_affirmation
 
 
 @main.route('/')
@@ -10,9 +10,10 @@ def index():
     # Get a random affirmation
     random_affirmation = None
     try:
-        affirmations = find_documents('affirmations')
-        if affirmations:
-            random_affirmation = random.choice(affirmations)
+        # No repeats until the visitor has seen them all, for visitors who
+        # already have a session; other views stay free of Set-Cookie
+        rotate = current_app.config['SESSION_COOKIE_NAME'] in request.cookies
+        random_affirmation = next_affirmation(request.args.get('campaign'), rotate=rotate)
     except Exception as e:
         # If there's an error fetching affirmations, just continue without one
         pass
@@ -37,47 +38,17 @@ def health():
 
 @main.route('/mongodb-test')
 def mongodb_test():
-    """Test MongoDB connection and demonstrate basic operations."""
-    from database import get_db, insert_document, find_documents
-    import datetime
+    """Test MongoDB connection and demonstrate basic operations.
+
+    ``?mode=read`` measures the round trips without writing.
+    """
+    from diagnostics import mongodb_test as run_mongodb_test
     
     try:
-        # Test connection
-        connected, message = test_connection()
-        
-        if connected:
-            # Insert a test document
-            test_doc = {
-                'type': 'test',
-                'timestamp': datetime.datetime.utcnow(),
-                'message': 'MongoDB integration test'
-            }
-            doc_id = insert_document('test_collection', test_doc)
-            
-            # Retrieve recent test documents
-            recent_tests = find_documents('test_collection', {'type': 'test'}, limit=5)
-            
-            return jsonify({
-                'status': 'success',
-                'connection': message,
-                'inserted_id': str(doc_id),
-                'recent_tests': [
-                    {
-                        'id': str(doc.get('_id')),
-                        'timestamp': doc.get('timestamp').isoformat() if doc.get('timestamp') else None,
-                        'message': doc.get('message')
-                    }
-                    for doc in recent_tests
-                ]
-            })
-        else:
-            return jsonify({
-                'status': 'error',
-                'connection': message
-            }), 503
-            
+        payload, status = run_mongodb_test('MongoDB integration test')
+        return jsonify(payload), status
     except Exception as e:
         return jsonify({
             'status': 'error',
             'message': str(e)
-        }), 500
\ No newline at end of file
+        }), 500
@@ -0,0 +1,211 @@
+"""Adaptive concurrency limits and load shedding for database-backed routes.
+
+Requests are grouped into route classes (``read``, ``write`` and ``static``)
+and each class gets its own limiter. When MongoDB slows down, the limits for
+``read`` and ``write`` shrink and excess requests are answered immediately
+with ``503 Service Unavailable`` and a ``Retry-After`` header instead of
+queueing, so worker threads stay available for static pages and ``/health``.
+
+Two limit algorithms are available:
+
+``aimd``
+    Additive increase while latency stays under ``CONCURRENCY_LATENCY_TARGET_MS``,
+    multiplicative decrease when it is exceeded.
+``vegas``
+    Estimates the queue from the ratio of the minimum observed latency to the
+    current latency (as in TCP Vegas) and grows or shrinks the limit by one
+    to keep that queue small.
+"""
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+
+from batch import SUBREQUEST_KEY
+
+# Blueprints whose routes read or write MongoDB
+DATABASE_BLUEPRINTS = {'api_v1', 'contacts', 'affirmations'}
+DATABASE_ENDPOINTS = {'main.index', 'main.mongodb_test'}
+
+# Cheap or long-lived routes inside database blueprints that must never be shed
+EXEMPT_ENDPOINTS = {
+    'main.health',
+    'api_v1.health',
+    'api_v1.system_status',
+    'api_v1.stream',
+    'contacts.index',
+    'affirmations.index'
+}
+
+# Classified by its sub-requests, which it runs under one slot
+BATCH_ENDPOINT = 'api_v1.batch'
+
+
+class AdaptiveLimiter:
+    """Thread-safe concurrency limiter whose limit adapts to latency."""
+
+    def __init__(self, name, initial_limit, min_limit=1, max_limit=64,
+                 algorithm='vegas', latency_target=0.25, backoff=0.9,
+                 alpha=3, beta=6):
+        if algorithm not in ('aimd', 'vegas'):
+            raise ValueError(f'Unknown concurrency algorithm: {algorithm}')
+        self.name = name
+        self.algorithm = algorithm
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.alpha = alpha
+        self.beta = beta
+        self.limit = float(initial_limit)
+        self.in_flight = 0
+        self.min_latency = None
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Reserve a slot; return False if the class is at its limit."""
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, latency, failed=False):
+        """Free a slot and feed the observed latency (seconds) to the algorithm."""
+        with self._lock:
+            self.in_flight -= 1
+            if failed:
+                # Errors are usually fast and say nothing about queueing
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+            elif self.algorithm == 'aimd':
+                self._update_aimd(latency)
+            else:
+                self._update_vegas(latency)
+
+    def _update_aimd(self, latency):
+        if latency > self.latency_target:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif self.in_flight + 1 >= int(self.limit):
+            # Only grow when the limit is actually being used
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def _update_vegas(self, latency):
+        if self.min_latency is None or latency < self.min_latency:
+            self.min_latency = latency
+        if latency <= 0 or (self.in_flight + 1) * 2 < self.limit:
+            # Not enough traffic to say anything about queueing
+            return
+        queue = self.limit * (1 - self.min_latency / latency)
+        if queue < self.alpha:
+            self.limit = min(self.max_limit, self.limit + 1)
+        elif queue > self.beta:
+            self.limit = max(self.min_limit, self.limit - 1)
+
+    def snapshot(self):
+        """Return the limiter state for diagnostics."""
+        with self._lock:
+            return {
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'rejected': self.rejected,
+                'min_latency_ms': round(self.min_latency * 1000, 2) if self.min_latency else None
+            }
+
+
+def _batch_class():
+    # A batch holds one slot for all its sub-requests: a write slot if any
+    # of them writes
+    data = request.get_json(silent=True)
+    items = data.get('requests') if isinstance(data, dict) else None
+    if isinstance(items, list) and all(
+        isinstance(item, dict) and str(item.get('method', 'GET')).upper() == 'GET' for item in items
+    ):
+        return 'read'
+    return 'write'
+
+
+def classify_request():
+    """Return the route class of the current request."""
+    endpoint = request.endpoint
+    if endpoint is None or endpoint in EXEMPT_ENDPOINTS:
+        return 'static'
+    if endpoint == BATCH_ENDPOINT:
+        return _batch_class()
+    if request.blueprint in DATABASE_BLUEPRINTS or endpoint in DATABASE_ENDPOINTS:
+        return 'read' if request.method in ('GET', 'HEAD') else 'write'
+    return 'static'
+
+
+def get_limiters():
+    """Return the limiters of the current app, keyed by route class."""
+    return current_app.extensions.get('concurrency', {})
+
+
+def _shed_response(route_class):
+    retry_after = current_app.config['CONCURRENCY_RETRY_AFTER']
+    response = jsonify({
+        'status': 'error',
+        'message': f'Server is busy ({route_class} capacity exhausted), please retry'
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def _before_request():
+    # Sub-requests of a batch run under the batch's slot
+    if request.method == 'OPTIONS' or request.environ.get(SUBREQUEST_KEY):
+        return None
+    route_class = classify_request()
+    limiter = get_limiters().get(route_class)
+    if limiter is None:
+        return None
+    if not limiter.try_acquire():
+        current_app.logger.warning(
+            f'Shedding {request.method} {request.path}: {route_class} limit {int(limiter.limit)} reached'
+        )
+        return _shed_response(route_class)
+    g.concurrency_slot = (limiter, time.perf_counter())
+    return None
+
+
+def _after_request(response):
+    # Error responses rendered by a handler never reach teardown as errors
+    if 'concurrency_slot' in g and response.status_code >= 500:
+        g.concurrency_failed = True
+    return response
+
+
+def _teardown_request(error=None):
+    slot = g.pop('concurrency_slot', None)
+    if slot is not None:
+        limiter, started = slot
+        failed = error is not None or g.pop('concurrency_failed', False)
+        limiter.release(time.perf_counter() - started, failed=failed)
+
+
+def init_app(app):
+    """Install per-route-class concurrency limits if enabled."""
+    if not app.config.get('CONCURRENCY_LIMITS_ENABLED'):
+        return
+
+    algorithm = app.config['CONCURRENCY_ALGORITHM']
+    latency_target = app.config['CONCURRENCY_LATENCY_TARGET_MS'] / 1000.0
+    app.extensions['concurrency'] = {
+        route_class: AdaptiveLimiter(
+            route_class,
+            initial_limit=settings['initial'],
+            min_limit=settings.get('min', 1),
+            max_limit=settings.get('max', settings['initial']),
+            algorithm=algorithm,
+            latency_target=latency_target
+        )
+        for route_class, settings in app.config['CONCURRENCY_LIMITS'].items()
+        if settings
+    }
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.logger.info(f'Concurrency limits enabled ({algorithm}): {sorted(app.extensions["concurrency"])}')
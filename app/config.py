@@ -1,4 +1,6 @@
+import json
 import os
+import tempfile
 from datetime import timedelta
 
 
@@ -21,7 +23,11 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     
-    # Database configuration (for future use)
+    # Storage backend for database.py: 'mongodb', 'sqlite' or 'memory' (see
+    # storage/). The sqlite backend uses SQLALCHEMY_DATABASE_URI.
+    DATABASE_BACKEND = os.environ.get('DATABASE_BACKEND', 'mongodb')
+    
+    # Database configuration
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.db')
@@ -29,6 +35,136 @@ class Config:
     # MongoDB configuration
     MONGODB_URI = os.environ.get('MONGODB_URI') or 'mongodb://localhost:27017/openai_outreach'
     MONGODB_DATABASE = os.environ.get('MONGODB_DATABASE') or 'openai_outreach'
+    MONGODB_MAX_POOL_SIZE = int(os.environ.get('MONGODB_MAX_POOL_SIZE', 50))
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 30000))
+    # Routing of reads that tolerate lag (see database.py). MongoDB requires
+    # a max staleness of at least 90 seconds; -1 means no limit.
+    MONGODB_SECONDARY_READ_MODE = os.environ.get('MONGODB_SECONDARY_READ_MODE', 'secondaryPreferred')
+    MONGODB_MAX_STALENESS_SECONDS = int(os.environ.get('MONGODB_MAX_STALENESS_SECONDS', 90))
+    MONGODB_READ_YOUR_WRITES_SECONDS = int(os.environ.get('MONGODB_READ_YOUR_WRITES_SECONDS', 10))
+    
+    # Share one query between identical concurrent find_documents() calls
+    # (see singleflight.py); per-key counters for the most recent keys
+    DATABASE_COALESCE_READS = os.environ.get('DATABASE_COALESCE_READS', 'false').lower() == 'true'
+    DATABASE_COALESCE_MAX_KEYS = int(os.environ.get('DATABASE_COALESCE_MAX_KEYS', 256))
+    
+    # Random affirmations from a snapshot shared by the workers of a host
+    # (see snapshot.py). A write marks it stale within the poll interval.
+    AFFIRMATIONS_SNAPSHOT_ENABLED = os.environ.get('AFFIRMATIONS_SNAPSHOT_ENABLED', 'true').lower() == 'true'
+    AFFIRMATIONS_SNAPSHOT_PATH = os.environ.get('AFFIRMATIONS_SNAPSHOT_PATH') or os.path.join(
+        '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+        f'{MONGODB_DATABASE}-affirmations.snapshot')
+    AFFIRMATIONS_SNAPSHOT_INTERVAL_SECONDS = float(os.environ.get('AFFIRMATIONS_SNAPSHOT_INTERVAL_SECONDS', 60))
+    AFFIRMATIONS_SNAPSHOT_POLL_SECONDS = float(os.environ.get('AFFIRMATIONS_SNAPSHOT_POLL_SECONDS', 0.5))
+    
+    # Weighted random affirmations (see sampling.py): weight per category
+    # (default 1, 0 leaves it out) and campaigns overriding some weights,
+    # as JSON, e.g. {"spring": {"growth": 3, "focus": 0}}
+    AFFIRMATION_CATEGORY_WEIGHTS = json.loads(os.environ.get('AFFIRMATION_CATEGORY_WEIGHTS') or '{}')
+    AFFIRMATION_CAMPAIGNS = json.loads(os.environ.get('AFFIRMATION_CAMPAIGNS') or '{}')
+    
+    # Contact deduplication (see dedup.py): check creates against the match
+    # keys, skip larger match blocks in scans, bound bulk merges
+    DEDUP_CHECK_ON_CREATE = os.environ.get('DEDUP_CHECK_ON_CREATE', 'true').lower() == 'true'
+    DEDUP_MAX_BLOCK_SIZE = int(os.environ.get('DEDUP_MAX_BLOCK_SIZE', 50))
+    DEDUP_MAX_MERGES = int(os.environ.get('DEDUP_MAX_MERGES', 500))
+    
+    # Contact autocomplete from an in-memory prefix index per worker (see
+    # suggest.py); other workers' writes are picked up this often
+    CONTACT_SUGGEST_ENABLED = os.environ.get('CONTACT_SUGGEST_ENABLED', 'true').lower() == 'true'
+    CONTACT_SUGGEST_SYNC_SECONDS = float(os.environ.get('CONTACT_SUGGEST_SYNC_SECONDS', 2))
+    CONTACT_SUGGEST_MAX_LIMIT = int(os.environ.get('CONTACT_SUGGEST_MAX_LIMIT', 50))
+    # Each worker holds its own index, about 800 bytes per contact; larger
+    # collections are answered by database prefix queries (0 for no limit)
+    CONTACT_SUGGEST_MAX_CONTACTS = int(os.environ.get('CONTACT_SUGGEST_MAX_CONTACTS', 200000))
+    
+    # Dashboard counters kept current by the write helpers (see stats.py);
+    # reconcile them nightly with ``python stats.py reconcile``
+    STATS_ENABLED = os.environ.get('STATS_ENABLED', 'true').lower() == 'true'
+    
+    # Delta sync (see sync.py). Clients whose token is older than the
+    # tombstone retention must do a full resync.
+    SYNC_TOMBSTONE_TTL_DAYS = int(os.environ.get('SYNC_TOMBSTONE_TTL_DAYS', 30))
+    SYNC_SAFETY_WINDOW_MS = int(os.environ.get('SYNC_SAFETY_WINDOW_MS', 2000))
+    
+    # Live change events (see events.py)
+    EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND', 'memory')
+    EVENTS_FILE = os.environ.get('EVENTS_FILE') or \
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'events.jsonl')
+    EVENTS_FILE_MAX_BYTES = int(os.environ.get('EVENTS_FILE_MAX_BYTES', 10 * 1024 * 1024))
+    EVENTS_BUFFER_SIZE = int(os.environ.get('EVENTS_BUFFER_SIZE', 1000))
+    EVENTS_HEARTBEAT_SECONDS = int(os.environ.get('EVENTS_HEARTBEAT_SECONDS', 15))
+    EVENTS_MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS', 5000))
+    EVENTS_MAX_THREADED_STREAMS = int(os.environ.get('EVENTS_MAX_THREADED_STREAMS', 2))
+    EVENTS_COLLECTIONS = ['contacts', 'affirmations']
+    
+    # nginx micro-cache refresh (see http_cache.py). Paths cached by nginx,
+    # keyed by the collection whose writes make them stale.
+    HTTP_CACHE_REFRESH_URL = os.environ.get('HTTP_CACHE_REFRESH_URL', '')
+    HTTP_CACHE_REFRESH_TIMEOUT = float(os.environ.get('HTTP_CACHE_REFRESH_TIMEOUT', 2.0))
+    HTTP_CACHE_PATHS = {
+        'affirmations': ['/api/v1/affirmations', '/api/v1/affirmations/random']
+    }
+    
+    # Template loading (see templating.py); empty values disable a layer
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jinja'))
+    JINJA_TEMPLATE_BUNDLE = os.environ.get('JINJA_TEMPLATE_BUNDLE',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates_compiled'))
+    
+    # Worker warm-up before taking traffic (see warmup.py). The timeout must
+    # stay below gunicorn's worker timeout.
+    WARMUP_ENABLED = os.environ.get('WARMUP_ENABLED', 'true').lower() == 'true'
+    WARMUP_TIMEOUT_SECONDS = float(os.environ.get('WARMUP_TIMEOUT_SECONDS', 10))
+    WARMUP_PATHS = ['/', '/contacts/', '/api/v1/affirmations', '/api/v1/affirmations/random']
+    
+    # Batched API requests (see batch.py)
+    BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', 20))
+    BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', 4))
+    
+    # Indexes created at startup by database.init_app()
+    MONGODB_INDEXES = [
+        {'collection': 'contacts', 'keys': [('updated_at', 1)]},
+        {'collection': 'contacts', 'keys': [('email_key', 1)]},
+        {'collection': 'contacts', 'keys': [('phone_key', 1)]},
+        {'collection': 'contacts', 'keys': [('name_key', 1)]},
+        # Prefix queries of /api/v1/contacts/suggest without its index
+        {'collection': 'contacts', 'keys': [('first_name', 1)]},
+        {'collection': 'contacts', 'keys': [('last_name', 1)]},
+        {'collection': 'contacts', 'keys': [('email', 1)]},
+        {'collection': 'contacts', 'keys': [('company', 1)]},
+        {'collection': 'affirmations', 'keys': [('updated_at', 1)]},
+        {'collection': 'tombstones', 'keys': [('collection', 1), ('deleted_at', 1)]},
+        {'collection': 'stats', 'keys': [('metric', 1)]},
+        {'collection': 'test_collection', 'keys': [('type', 1), ('timestamp', -1)]}
+    ]
+    
+    # Full-text search (/api/v1/search): a weighted text index per
+    # collection, added to MONGODB_INDEXES. A match in a field counts
+    # ``weight`` times as much as one in a field of weight 1.
+    SEARCH_WEIGHTS = {
+        'contacts': {'first_name': 10, 'last_name': 10, 'company': 5, 'notes': 1},
+        'affirmations': {'text': 5, 'author': 3}
+    }
+    MONGODB_INDEXES += [
+        {'collection': collection, 'keys': [(field, 'text') for field in weights],
+         'options': {'weights': weights, 'name': f'{collection}_text'}}
+        for collection, weights in SEARCH_WEIGHTS.items()
+    ]
+    SEARCH_MAX_PER_PAGE = int(os.environ.get('SEARCH_MAX_PER_PAGE', 50))
+    
+    # Collections of disposable documents, expired by a TTL or capped (see
+    # lifecycle.py). The TTL indexes are added to MONGODB_INDEXES.
+    TEST_COLLECTION_TTL_SECONDS = int(os.environ.get('TEST_COLLECTION_TTL_SECONDS', 86400))
+    EPHEMERAL_COLLECTIONS = {
+        'test_collection': {'ttl_field': 'timestamp', 'ttl_seconds': TEST_COLLECTION_TTL_SECONDS},
+        # Deletions older than this are no longer synced (see sync.py)
+        'tombstones': {'ttl_field': 'deleted_at', 'ttl_seconds': SYNC_TOMBSTONE_TTL_DAYS * 86400}
+    }
+    
+    # MongoDB test endpoints: 'write' inserts a test document, 'read' only
+    # measures round trips; either can be asked for with ?mode=
+    MONGODB_TEST_MODE = os.environ.get('MONGODB_TEST_MODE', 'write')
     
     # API configuration (for future use)
     API_TITLE = 'Landing OAI OR API'
@@ -38,10 +174,45 @@ class Config:
     # CORS configuration (for future API use)
     CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*').split(',')
     
+    # Logging configuration (see logging_setup.py)
+    LOG_TO_STDOUT = os.environ.get('LOG_TO_STDOUT', 'false').lower() == 'true'
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10240000))
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 10))
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    ACCESS_LOG_ENABLED = os.environ.get('ACCESS_LOG_ENABLED', 'true').lower() == 'true'
+    ACCESS_LOG_SAMPLE_RATE = float(os.environ.get('ACCESS_LOG_SAMPLE_RATE', 0.1))
+    ACCESS_LOG_SLOW_MS = int(os.environ.get('ACCESS_LOG_SLOW_MS', 500))
+    
+    # On-demand request profiling (see profiling.py)
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0.0))
+    PROFILING_MODE = os.environ.get('PROFILING_MODE', 'sampler')
+    PROFILING_SAMPLER_INTERVAL_MS = float(os.environ.get('PROFILING_SAMPLER_INTERVAL_MS', 5))
+    PROFILING_DIR = os.environ.get('PROFILING_DIR') or \
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+    
     # Feature flags
     ENABLE_API = os.environ.get('ENABLE_API', 'true').lower() == 'true'
     ENABLE_ADMIN = os.environ.get('ENABLE_ADMIN', 'false').lower() == 'true'
     
+    # Concurrency limits and load shedding (see concurrency.py)
+    CONCURRENCY_LIMITS_ENABLED = os.environ.get('CONCURRENCY_LIMITS_ENABLED', 'false').lower() == 'true'
+    CONCURRENCY_ALGORITHM = os.environ.get('CONCURRENCY_ALGORITHM', 'vegas')
+    CONCURRENCY_LATENCY_TARGET_MS = int(os.environ.get('CONCURRENCY_LATENCY_TARGET_MS', 250))
+    CONCURRENCY_RETRY_AFTER = int(os.environ.get('CONCURRENCY_RETRY_AFTER', 1))
+    # Per route class limits; a class without settings is never limited. Each
+    # limit starts at 'initial' and adapts between 'min' and 'max'. Keep the
+    # initial read + write below GUNICORN_THREADS so cheap routes find a thread.
+    CONCURRENCY_LIMITS = {
+        'read': {'initial': int(os.environ.get('CONCURRENCY_READ_LIMIT', 3)), 'min': 1,
+                 'max': int(os.environ.get('CONCURRENCY_READ_MAX_LIMIT', os.environ.get('GUNICORN_THREADS', 4)))},
+        'write': {'initial': int(os.environ.get('CONCURRENCY_WRITE_LIMIT', 1)), 'min': 1,
+                  'max': int(os.environ.get('CONCURRENCY_WRITE_MAX_LIMIT', os.environ.get('GUNICORN_THREADS', 4)))},
+        'static': None
+    }
+    
     @staticmethod
     def init_app(app):
         """Initialize application with this config."""
@@ -70,22 +241,12 @@ class ProductionConfig(Config):
     DEBUG = False
     TESTING = False
     SESSION_COOKIE_SECURE = True
+    CONCURRENCY_LIMITS_ENABLED = os.environ.get('CONCURRENCY_LIMITS_ENABLED', 'true').lower() == 'true'
     
     @staticmethod
     def init_app(app):
         Config.init_app(app)
-        # Production-specific initialization
-        import logging
-        from logging.handlers import RotatingFileHandler
-        if not app.logger.handlers:
-            if not os.path.exists('logs'):
-                os.mkdir('logs')
-            file_handler = RotatingFileHandler('logs/app.log', maxBytes=10240000, backupCount=10)
-            file_handler.setFormatter(logging.Formatter(
-                '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-            ))
-            file_handler.setLevel(logging.INFO)
-            app.logger.addHandler(file_handler)
+        # Log handlers are installed by logging_setup.configure_logging()
 
 
 class TestingConfig(Config):
@@ -94,6 +255,11 @@ class TestingConfig(Config):
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    # Tests and benchmarks run without a MongoDB server
+    DATABASE_BACKEND = os.environ.get('DATABASE_BACKEND', 'memory')
+    WARMUP_ENABLED = False
+    JINJA_BYTECODE_CACHE_DIR = ''
+    AFFIRMATIONS_SNAPSHOT_ENABLED = False
 
 
 # Configuration dictionary
@@ -1,93 +1,303 @@
-"""MongoDB database connection and utilities."""
+"""Database access helpers.
+
+``insert_document``, ``find_documents``, ``update_document`` and
+``delete_document`` go through the storage backend selected by
+``DATABASE_BACKEND`` (see the ``storage`` package). ``get_client`` and
+``get_db`` give direct access to MongoDB and only work with that backend.
+
+Reads go to the MongoDB primary unless a call passes ``read='secondary'``,
+which routes it by ``MONGODB_SECONDARY_READ_MODE`` (``secondaryPreferred``
+by default) within ``MONGODB_MAX_STALENESS_SECONDS``. Use it for reads that
+tolerate replication lag, such as listings. A client that just wrote keeps
+reading from the primary for ``MONGODB_READ_YOUR_WRITES_SECONDS`` (a cookie),
+so it sees its own writes.
+
+With ``DATABASE_COALESCE_READS`` (or ``coalesce=True`` per call), identical
+concurrent ``find_documents`` calls share one database query (see
+``singleflight.py``).
+"""
+import functools
 import os
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
-from flask import current_app, g
+import threading
+import time
+from blinker import Namespace
+from flask import after_this_request, current_app, g, has_app_context, has_request_context, request
+
+from singleflight import SingleFlight, make_key
+
+
+# Signals sent after a write changed a collection. The sender is the
+# collection name; receivers get ``document_id`` plus ``document`` (insert),
+# ``changes`` (update) or nothing else (delete). Updates and deletes of a
+# collection registered with ``track_previous`` also carry ``previous``.
+_signals = Namespace()
+document_inserted = _signals.signal('document-inserted')
+document_updated = _signals.signal('document-updated')
+document_deleted = _signals.signal('document-deleted')
+
+# Fields read before an update or delete, per collection (see track_previous)
+_tracked_fields = {}
+
+# Values of the ``read`` argument of the read helpers
+READ_PRIMARY = 'primary'
+READ_SECONDARY = 'secondary'
+
+# Cookie holding the time until which a client that wrote reads from the
+# primary, and a header that asks for primary reads (e.g. cache refreshes)
+PRIMARY_UNTIL_COOKIE = 'db_primary_until'
+PRIMARY_READ_HEADER = 'X-Read-Primary'
+
+# One pooled MongoClient per process and URI. MongoClient is thread-safe but
+# not fork-safe, so clients are tagged with the pid that created them.
+_clients = {}
+_clients_pid = None
+_clients_lock = threading.Lock()
+
+
+def get_client():
+    """Get the process-wide MongoClient for the current app's configuration."""
+    global _clients_pid
+    uri = current_app.config['MONGODB_URI']
+    pid = os.getpid()
+    client = _clients.get(uri)
+    if client is None or _clients_pid != pid:
+        with _clients_lock:
+            if _clients_pid != pid:
+                # Inherited from the parent process; never reuse its sockets.
+                _clients.clear()
+                _clients_pid = pid
+            client = _clients.get(uri)
+            if client is None:
+                # Deferred: pymongo takes tens of milliseconds to import and
+                # the other storage backends never need it
+                from pymongo import MongoClient
+                client = MongoClient(
+                    uri,
+                    maxPoolSize=current_app.config['MONGODB_MAX_POOL_SIZE'],
+                    serverSelectionTimeoutMS=current_app.config['MONGODB_SERVER_SELECTION_TIMEOUT_MS']
+                )
+                _clients[uri] = client
+    return client
+
+
+def reset_connections():
+    """Drop all MongoClients without touching their sockets.
+
+    Call in a freshly forked process (e.g. gunicorn's ``post_fork``) so that
+    connections opened by the parent are never shared with the child.
+    """
+    global _clients_pid
+    with _clients_lock:
+        _clients.clear()
+        _clients_pid = os.getpid()
 
 
 def get_db():
-    """Get MongoDB database connection from Flask g object or create new one."""
-    if 'mongodb' not in g:
-        g.mongodb = MongoClient(current_app.config['MONGODB_URI'])
-    
+    """Get MongoDB database from Flask g object or the pooled client."""
     if 'db' not in g:
-        g.db = g.mongodb[current_app.config['MONGODB_DATABASE']]
+        g.db = get_client()[current_app.config['MONGODB_DATABASE']]
     
     return g.db
 
 
 def close_db(error=None):
-    """Close MongoDB connection."""
-    mongodb = g.pop('mongodb', None)
-    if mongodb is not None:
-        mongodb.close()
+    """Release the request's database handle; the pooled client stays open."""
+    g.pop('db', None)
+
+
+def get_backend():
+    """Get the storage backend of the current app."""
+    return current_app.extensions['storage']
 
 
 def init_app(app):
-    """Initialize MongoDB with Flask app."""
+    """Initialize the storage backend with Flask app."""
+    from storage import create_backend
+    
     app.teardown_appcontext(close_db)
+    app.extensions['singleflight'] = SingleFlight(app.config['DATABASE_COALESCE_MAX_KEYS'])
     
-    # Test connection on startup
+    backend = create_backend(app)
+    app.extensions['storage'] = backend
+    # Test connection and create indexes on startup
     with app.app_context():
+        backend.startup(app.logger)
+
+
+def ensure_indexes(db, indexes, logger):
+    """Create the indexes declared in ``MONGODB_INDEXES`` if they are missing.
+
+    Each entry is a dict with ``collection``, ``keys`` (a list of
+    ``(field, direction)`` pairs) and optional ``options`` for
+    ``create_index``.
+    """
+    for index in indexes:
         try:
-            client = MongoClient(app.config['MONGODB_URI'], serverSelectionTimeoutMS=5000)
-            # The ismaster command is cheap and does not require auth.
-            client.admin.command('ismaster')
-            app.logger.info(f"Successfully connected to MongoDB at {app.config['MONGODB_URI']}")
-        except ConnectionFailure as e:
-            app.logger.warning(f"MongoDB connection failed: {e}")
-            app.logger.warning("Application will start without MongoDB. Some features may be unavailable.")
+            db[index['collection']].create_index(index['keys'], **index.get('options', {}))
         except Exception as e:
-            app.logger.error(f"Unexpected error connecting to MongoDB: {e}")
+            logger.warning(f"Could not create index {index['keys']} on {index['collection']}: {e}")
+
 
+def timed(func):
+    """Accumulate the time spent in ``func`` on ``g`` for the access log."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if has_app_context():
+                g.db_time = g.get('db_time', 0.0) + time.perf_counter() - started
+                g.db_calls = g.get('db_calls', 0) + 1
+    return wrapper
 
+
+def reads_own_writes():
+    """Return True if the current request must see its client's recent writes."""
+    if not has_request_context():
+        return False
+    if g.get('db_wrote'):
+        return True
+    try:
+        return float(request.cookies.get(PRIMARY_UNTIL_COOKIE, 0)) >= time.time()
+    except ValueError:
+        return False
+
+
+def _secondary_allowed(read):
+    """Return True if a read with routing ``read`` may go to a secondary."""
+    if read == READ_PRIMARY:
+        return False
+    if read != READ_SECONDARY:
+        raise ValueError(f'Unknown read routing: {read}')
+    if has_request_context() and request.headers.get(PRIMARY_READ_HEADER):
+        return False
+    return not reads_own_writes()
+
+
+def _stick_to_primary():
+    """Send the client's secondary reads to the primary for a while after a write."""
+    if not has_request_context() or g.get('db_wrote'):
+        return
+    g.db_wrote = True
+    seconds = current_app.config['MONGODB_READ_YOUR_WRITES_SECONDS']
+    if seconds <= 0 or not get_backend().replicated:
+        return
+    until = str(int(time.time() + seconds))
+
+    @after_this_request
+    def set_cookie(response):
+        response.set_cookie(PRIMARY_UNTIL_COOKIE, until, max_age=seconds, httponly=True, samesite='Lax')
+        return response
+
+
+@timed
 def test_connection():
-    """Test MongoDB connection."""
+    """Test the database connection."""
+    backend = get_backend()
     try:
-        db = get_db()
-        # Perform a simple operation to test the connection
-        db.list_collection_names()
-        return True, "MongoDB connection successful"
+        backend.ping()
+        return True, f"{backend.label} connection successful"
     except Exception as e:
-        return False, f"MongoDB connection failed: {str(e)}"
+        return False, f"{backend.label} connection failed: {str(e)}"
 
 
 # Example utility functions for common operations
+@timed
 def insert_document(collection_name, document):
     """Insert a document into a collection."""
-    db = get_db()
-    collection = db[collection_name]
-    result = collection.insert_one(document)
-    return result.inserted_id
+    document_id = get_backend().insert(collection_name, document)
+    _stick_to_primary()
+    document_inserted.send(collection_name, document_id=document_id, document=document)
+    return document_id
 
 
-def find_documents(collection_name, query=None, limit=None):
-    """Find documents in a collection."""
-    db = get_db()
-    collection = db[collection_name]
-    
+@timed
+def find_documents(collection_name, query=None, limit=None, sort=None, read=READ_PRIMARY,
+                   projection=None, coalesce=None):
+    """Find documents in a collection.
+
+    ``sort`` is a list of ``(field, direction)`` pairs as accepted by pymongo.
+    ``read='secondary'`` lets the read go to a replica-set secondary.
+    ``coalesce`` overrides ``DATABASE_COALESCE_READS`` for this call.
+    """
     if query is None:
         query = {}
     
-    cursor = collection.find(query)
+    backend = get_backend()
+    secondary = _secondary_allowed(read)
     
-    if limit:
-        cursor = cursor.limit(limit)
+    def find():
+        return backend.find(
+            collection_name, query, limit=limit, sort=sort, secondary=secondary, projection=projection
+        )
     
-    return list(cursor)
+    if coalesce is None:
+        coalesce = current_app.config['DATABASE_COALESCE_READS']
+    # A shared query may have started before this client's last write
+    if not coalesce or reads_own_writes():
+        return find()
+    key = make_key(collection_name, query, projection, limit, sort, secondary)
+    return current_app.extensions['singleflight'].do(key, find)
+
+
+@timed
+def search_documents(collection_name, text, skip=0, limit=None, read=READ_PRIMARY, projection=None):
+    """Find documents matching any word of ``text`` through the collection's text index.
+
+    The documents come best first, each with its relevance as ``score``.
+    """
+    return get_backend().search(
+        collection_name, text, skip=skip, limit=limit, secondary=_secondary_allowed(read), projection=projection
+    )
+
+
+def coalescing_snapshot():
+    """Return the single-flight counters of the current app."""
+    return current_app.extensions['singleflight'].snapshot()
+
+
+@timed
+def count_documents(collection_name, query=None, read=READ_PRIMARY):
+    """Count the documents of a collection matching ``query``."""
+    return get_backend().count(collection_name, query or {}, secondary=_secondary_allowed(read))
+
+
+def track_previous(collection_name, fields):
+    """Send the values of ``fields`` before each update or delete as ``previous``.
+
+    Costs one read per write: per update only if it changes one of the fields.
+    The read and the write are not atomic, so a concurrent write in between
+    can make ``previous`` out of date.
+    """
+    _tracked_fields.setdefault(collection_name, set()).update(fields)
+
+
+def _previous(collection_name, query, changes=None):
+    fields = _tracked_fields.get(collection_name)
+    if not fields or (changes is not None and fields.isdisjoint(changes)):
+        return None
+    found = get_backend().find(collection_name, query, limit=1, projection=dict.fromkeys(fields, 1))
+    return found[0] if found else None
 
 
+@timed
 def update_document(collection_name, query, update_data):
     """Update a document in a collection."""
-    db = get_db()
-    collection = db[collection_name]
-    result = collection.update_one(query, {'$set': update_data})
-    return result.modified_count
+    previous = _previous(collection_name, query, update_data)
+    modified_count = get_backend().update(collection_name, query, update_data)
+    if modified_count:
+        _stick_to_primary()
+        document_updated.send(collection_name, document_id=query.get('_id'), changes=update_data, previous=previous)
+    return modified_count
 
 
+@timed
 def delete_document(collection_name, query):
     """Delete a document from a collection."""
-    db = get_db()
-    collection = db[collection_name]
-    result = collection.delete_one(query)
-    return result.deleted_count
\ No newline at end of file
+    previous = _previous(collection_name, query)
+    deleted_count = get_backend().delete(collection_name, query)
+    if deleted_count:
+        _stick_to_primary()
+        document_deleted.send(collection_name, document_id=query.get('_id'), previous=previous)
+    return deleted_count
@@ -0,0 +1,343 @@
+"""Duplicate detection and merging of contacts.
+
+Contacts match when they share
+
+``email``
+    the normalized email address: lowercased, without a ``+tag``, and
+    without dots for Gmail;
+``phone``
+    the last ten digits of the phone number, plus the name key;
+``name_company``
+    the name key (Soundex of the last and first names) and the company,
+    lowercased without punctuation or legal suffix (``Inc``, ``Ltd``...).
+
+The keys are stored on each contact (``email_key``, ``phone_key``,
+``name_key``) by the create and update routes, and indexed, so the check
+on create (``find_duplicates``) costs up to three indexed lookups. ``python dedup.py backfill`` adds them to older contacts.
+
+A scan (``find_proposals``) puts each contact into the blocks of its keys
+and joins the members of every block with a union-find. This is linear in
+the number of contacts, where comparing pairs would be quadratic. Blocks
+larger than ``DEDUP_MAX_BLOCK_SIZE`` (a shared office phone, a common name
+at a large company) are skipped rather than merged wholesale. Each set of
+duplicates becomes a merge proposal: the oldest contact survives and
+takes the others' fields where its own are empty.
+
+Proposals are not stored. Their id hashes the members' ids and
+``updated_at``, so ``apply_merges`` can tell that an approved proposal
+still describes the contacts as they are, and rejects it as stale
+otherwise.
+"""
+import hashlib
+import re
+import sys
+import unicodedata
+from collections import defaultdict
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import current_app, request
+
+from database import delete_document, find_documents, get_backend, update_document
+from serializers import CONTACT_FIELDS, public_fields, serialize_document
+from sync import record_tombstone
+
+# Fields whose changes change the keys
+IDENTITY_FIELDS = ('first_name', 'last_name', 'email', 'phone', 'company')
+
+GMAIL_DOMAINS = ('gmail.com', 'googlemail.com')
+
+COMPANY_SUFFIXES = {'inc', 'incorporated', 'llc', 'ltd', 'limited', 'corp', 'corporation', 'co', 'gmbh', 'sa', 'plc'}
+
+SOUNDEX_CODES = {
+    letter: digit
+    for digit, letters in (('1', 'BFPV'), ('2', 'CGJKQSXZ'), ('3', 'DT'), ('4', 'L'), ('5', 'MN'), ('6', 'R'))
+    for letter in letters
+}
+
+
+def normalize_email(email):
+    """Return the comparable form of an email address, or None."""
+    local, at, domain = (email or '').strip().lower().rpartition('@')
+    if not at or not local or not domain:
+        return None
+    local = local.split('+', 1)[0]
+    if domain in GMAIL_DOMAINS:
+        local, domain = local.replace('.', ''), 'gmail.com'
+    return f'{local}@{domain}'
+
+
+def normalize_phone(phone):
+    """Return the last ten digits of a phone number, or None if it has under seven."""
+    digits = re.sub(r'\D', '', phone or '')
+    return digits[-10:] if len(digits) >= 7 else None
+
+
+def normalize_company(company):
+    """Return a company name lowercased, without punctuation or legal suffix."""
+    words = re.findall(r'[a-z0-9]+', (company or '').lower())
+    while len(words) > 1 and words[-1] in COMPANY_SUFFIXES:
+        words.pop()
+    return ''.join(words) or None
+
+
+def soundex(name):
+    """Return the American Soundex code of a name, e.g. ``R163`` for Robert."""
+    letters = [c for c in unicodedata.normalize('NFKD', name or '').upper() if 'A' <= c <= 'Z']
+    if not letters:
+        return ''
+    code = letters[0]
+    previous = SOUNDEX_CODES.get(letters[0], '')
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # H and W do not separate letters with the same code; vowels do
+        if letter not in 'HW':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+def contact_keys(contact):
+    """Return the match keys of a contact (None where a field is missing)."""
+    last, first = soundex(contact.get('last_name')), soundex(contact.get('first_name'))
+    return {
+        'email_key': normalize_email(contact.get('email')),
+        'phone_key': normalize_phone(contact.get('phone')),
+        'name_key': f'{last}:{first}' if last and first else None
+    }
+
+
+def key_changes(contact_id, changes):
+    """Return the key fields to store along with ``changes`` to a contact."""
+    if not any(field in changes for field in IDENTITY_FIELDS):
+        return {}
+    current = find_documents('contacts', {'_id': contact_id}, limit=1)
+    if not current:
+        return {}
+    return contact_keys(dict(current[0], **changes))
+
+
+def find_duplicates(contact):
+    """Return ``(contact_id, reason)`` for existing contacts matching ``contact``."""
+    keys = contact_keys(contact)
+    company = normalize_company(contact.get('company'))
+    limit = current_app.config['DEDUP_MAX_BLOCK_SIZE']
+    projection = {'name_key': 1, 'company': 1}
+    checks = (
+        ('email_key', 'email', lambda found: True),
+        ('phone_key', 'phone', lambda found: keys['name_key'] and found.get('name_key') == keys['name_key']),
+        ('name_key', 'name_company', lambda found: company and normalize_company(found.get('company')) == company)
+    )
+    duplicates = {}
+    for field, reason, accept in checks:
+        if not keys[field]:
+            continue
+        # Primary reads, so that a contact created a moment ago is seen
+        for found in find_documents('contacts', {field: keys[field]}, limit=limit, projection=projection):
+            if accept(found):
+                duplicates.setdefault(found['_id'], reason)
+    return list(duplicates.items())
+
+
+def duplicate_conflict(contact):
+    """Return the ``409`` payload if a new contact matches existing ones, else None.
+
+    Checks only if ``DEDUP_CHECK_ON_CREATE`` is set and the request does not
+    pass ``?allow_duplicate=true``.
+    """
+    allow_duplicate = request.args.get('allow_duplicate', '').lower() in ('1', 'true')
+    if not current_app.config['DEDUP_CHECK_ON_CREATE'] or allow_duplicate:
+        return None
+    duplicates = find_duplicates(contact)
+    if not duplicates:
+        return None
+    return {
+        'status': 'error',
+        'message': 'Contact may be a duplicate',
+        'duplicates': [
+            {'contact_id': str(contact_id), 'reason': reason} for contact_id, reason in duplicates
+        ]
+    }
+
+
+def _blocks(contact):
+    keys = contact_keys(contact)
+    company = normalize_company(contact.get('company'))
+    if keys['email_key']:
+        yield 'email', keys['email_key']
+    if keys['phone_key'] and keys['name_key']:
+        yield 'phone', keys['phone_key'], keys['name_key']
+    if keys['name_key'] and company:
+        yield 'name_company', keys['name_key'], company
+
+
+def group_duplicates(contacts, max_block_size):
+    """Return ``(groups, skipped_blocks)`` for a list of contacts.
+
+    Each group is ``(indexes into contacts, set of reasons)``.
+    """
+    parent = list(range(len(contacts)))
+
+    def root(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    blocks = defaultdict(list)
+    for index, contact in enumerate(contacts):
+        for block in _blocks(contact):
+            blocks[block].append(index)
+
+    joined = []
+    skipped = 0
+    for block, members in blocks.items():
+        if len(members) < 2:
+            continue
+        if len(members) > max_block_size:
+            skipped += 1
+            continue
+        first = root(members[0])
+        for member in members[1:]:
+            parent[root(member)] = first
+        joined.append((members[0], block[0]))
+
+    groups = defaultdict(lambda: ([], set()))
+    for index in range(len(contacts)):
+        groups[root(index)][0].append(index)
+    for member, reason in joined:
+        groups[root(member)][1].add(reason)
+    return [group for group in groups.values() if len(group[0]) > 1], skipped
+
+
+def proposal_id(contacts):
+    """Return an id that changes whenever one of the contacts changes."""
+    digest = hashlib.sha1()
+    for contact in sorted(contacts, key=lambda contact: str(contact['_id'])):
+        digest.update(f"{contact['_id']}@{contact.get('updated_at')};".encode())
+    return digest.hexdigest()[:20]
+
+
+def merge_fields(survivor, duplicates):
+    """Return the changes that fold ``duplicates`` into ``survivor``.
+
+    Empty fields of the survivor take the value of the most recently
+    updated duplicate that has one; distinct notes are appended.
+    """
+    newest_first = sorted(duplicates, key=lambda contact: contact.get('updated_at') or datetime.min, reverse=True)
+    changes = {}
+    for field in CONTACT_FIELDS:
+        if field == 'notes' or survivor.get(field):
+            continue
+        value = next((contact[field] for contact in newest_first if contact.get(field)), None)
+        if value:
+            changes[field] = value
+    notes = [survivor.get('notes')] + [contact.get('notes') for contact in newest_first]
+    notes = [note for index, note in enumerate(notes) if note and note not in notes[:index]]
+    if len(notes) > 1:
+        changes['notes'] = '\n\n'.join(notes)
+    return changes
+
+
+def _oldest(contacts):
+    return min(contacts, key=lambda contact: (contact.get('created_at') or datetime.max, str(contact['_id'])))
+
+
+def find_proposals():
+    """Scan the contacts; return ``(proposals, skipped_blocks)``."""
+    contacts = find_documents('contacts', read='secondary')
+    groups, skipped = group_duplicates(contacts, current_app.config['DEDUP_MAX_BLOCK_SIZE'])
+    proposals = []
+    for indexes, reasons in groups:
+        members = [contacts[index] for index in indexes]
+        survivor = _oldest(members)
+        duplicates = [contact for contact in members if contact is not survivor]
+        proposals.append({
+            'proposal_id': proposal_id(members),
+            'survivor_id': str(survivor['_id']),
+            'duplicate_ids': [str(contact['_id']) for contact in duplicates],
+            'reasons': sorted(reasons),
+            'changes': merge_fields(survivor, duplicates),
+            'contacts': [
+                serialize_document(public_fields('contacts', contact)) for contact in members
+            ]
+        })
+    proposals.sort(key=lambda proposal: proposal['survivor_id'])
+    return proposals, skipped
+
+
+def apply_merges(merges):
+    """Apply approved proposals; return one result per proposal.
+
+    Each merge gives the ``proposal_id``, ``survivor_id`` and
+    ``duplicate_ids`` of a proposal, possibly with another member chosen
+    as the survivor. The contacts of every merge are read in one query.
+    """
+    try:
+        wanted = {
+            ObjectId(contact_id)
+            for merge in merges
+            for contact_id in [merge['survivor_id']] + list(merge['duplicate_ids'])
+        }
+    except (InvalidId, KeyError, TypeError) as e:
+        raise ValueError(f'Invalid merge: {e}')
+    found = {contact['_id']: contact for contact in find_documents('contacts', {'_id': {'$in': list(wanted)}})}
+
+    results = []
+    for merge in merges:
+        survivor_id = ObjectId(merge['survivor_id'])
+        duplicate_ids = [ObjectId(contact_id) for contact_id in merge['duplicate_ids']]
+        result = {'proposal_id': merge.get('proposal_id'), 'survivor_id': str(survivor_id)}
+        results.append(result)
+        members = [found.get(contact_id) for contact_id in [survivor_id] + duplicate_ids]
+        if not duplicate_ids or survivor_id in duplicate_ids:
+            result['status'] = 'invalid'
+            continue
+        if None in members or proposal_id(members) != merge.get('proposal_id'):
+            result['status'] = 'stale'
+            continue
+
+        survivor, duplicates = members[0], members[1:]
+        changes = merge_fields(survivor, duplicates)
+        changes.update(contact_keys(dict(survivor, **changes)))
+        changes['updated_at'] = datetime.utcnow()
+        update_document('contacts', {'_id': survivor_id}, changes)
+        for contact_id in duplicate_ids:
+            if delete_document('contacts', {'_id': contact_id}):
+                record_tombstone('contacts', contact_id)
+            # Later merges must not use a contact merged away
+            found.pop(contact_id, None)
+        found.pop(survivor_id, None)
+        result['status'] = 'merged'
+        result['merged_ids'] = [str(contact_id) for contact_id in duplicate_ids]
+    return results
+
+
+def backfill_keys():
+    """Store the match keys on contacts that lack them or have stale ones.
+
+    Writes through the backend directly: only derived fields change, so
+    ``updated_at`` and the write signals (sync, events, caches) are left alone.
+    """
+    backend = get_backend()
+    updated = 0
+    for contact in find_documents('contacts'):
+        keys = contact_keys(contact)
+        if any(contact.get(field) != value for field, value in keys.items()):
+            updated += backend.update('contacts', {'_id': contact['_id']}, keys)
+    return updated
+
+
+if __name__ == '__main__':
+    # Maintenance: python dedup.py backfill [config]
+    from __init__ import create_app
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'backfill':
+        sys.exit('usage: python dedup.py backfill [config]')
+    app = create_app(sys.argv[2] if len(sys.argv) > 2 else 'production')
+    with app.app_context():
+        print(f'Stored match keys on {backfill_keys()} contacts')
@@ -0,0 +1,66 @@
+"""Storage round-trip check behind the MongoDB test endpoints.
+
+In ``write`` mode a test document is inserted into ``test_collection`` (which
+expires, see ``EPHEMERAL_COLLECTIONS``) and the latest ones are read back. In
+``read`` mode nothing is written, so uptime checks can call it as often as
+they like. Both report the latency of each round trip.
+"""
+import time
+from datetime import datetime
+
+from flask import current_app, request
+
+from database import find_documents, insert_document, test_connection
+
+MODES = ('write', 'read')
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def mongodb_test(message):
+    """Run the check in the requested mode; return the payload and status code."""
+    mode = request.args.get('mode') or current_app.config['MONGODB_TEST_MODE']
+    if mode not in MODES:
+        return {
+            'status': 'error',
+            'message': f"mode must be one of {', '.join(MODES)}"
+        }, 400
+
+    latency = {}
+    started = time.perf_counter()
+    connected, connection = test_connection()
+    latency['ping'] = _elapsed_ms(started)
+    if not connected:
+        return {
+            'status': 'error',
+            'connection': connection
+        }, 503
+
+    payload = {'status': 'success', 'connection': connection, 'mode': mode}
+    if mode == 'write':
+        started = time.perf_counter()
+        doc_id = insert_document('test_collection', {
+            'type': 'test',
+            'timestamp': datetime.utcnow(),
+            'message': message
+        })
+        latency['insert'] = _elapsed_ms(started)
+        payload['inserted_id'] = str(doc_id)
+
+    # Retrieve recent test documents
+    started = time.perf_counter()
+    recent_tests = find_documents('test_collection', {'type': 'test'}, limit=5, sort=[('timestamp', -1)])
+    latency['query'] = _elapsed_ms(started)
+
+    payload['recent_tests'] = [
+        {
+            'id': str(doc.get('_id')),
+            'timestamp': doc.get('timestamp').isoformat() if doc.get('timestamp') else None,
+            'message': doc.get('message')
+        }
+        for doc in recent_tests
+    ]
+    payload['latency_ms'] = latency
+    return payload, 200
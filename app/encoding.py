@@ -0,0 +1,137 @@
+"""Content negotiation for API responses: JSON, MessagePack and CBOR.
+
+JSON is the default. Clients that send ``Accept: application/msgpack`` or
+``Accept: application/cbor`` get a binary body instead, in which ObjectIds
+and datetimes keep their native types rather than being converted to
+strings:
+
+MessagePack
+    datetimes use the standard Timestamp extension (type -1), ObjectIds the
+    application extension type ``OBJECT_ID_EXT_TYPE`` holding the 12 raw
+    bytes.
+CBOR
+    datetimes use the standard epoch tag (1), ObjectIds the tag
+    ``OBJECT_ID_CBOR_TAG`` holding the 12 raw bytes.
+
+Datetimes stored by the app are naive UTC and are encoded as UTC.
+
+``msgpack`` and ``cbor2`` are in requirements.txt. Should either be missing,
+its format is simply not offered and such clients get JSON.
+"""
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from flask import current_app, json, request
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+CBOR = 'application/cbor'
+# Older clients still ask for the unregistered MessagePack type
+MSGPACK_ALIASES = ('application/x-msgpack',)
+
+OBJECT_ID_EXT_TYPE = 1
+OBJECT_ID_CBOR_TAG = 40100
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def available_types():
+    """Return the media types that can be produced, JSON first."""
+    types = [JSON]
+    if msgpack is not None:
+        types.append(MSGPACK)
+        types.extend(MSGPACK_ALIASES)
+    if cbor2 is not None:
+        types.append(CBOR)
+    return types
+
+
+def negotiate():
+    """Return the media type to answer the current request with."""
+    mimetype = request.accept_mimetypes.best_match(available_types(), default=JSON)
+    return MSGPACK if mimetype in MSGPACK_ALIASES else mimetype
+
+
+def wants_native():
+    """True if the response keeps ObjectIds and datetimes as native values."""
+    return negotiate() != JSON
+
+
+# ----------------------------------------------------------------------------
+# Encoders
+# ----------------------------------------------------------------------------
+
+def _msgpack_default(value):
+    if isinstance(value, datetime):
+        # Timestamp.from_datetime() is several times slower than this
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        delta = value - _EPOCH
+        return msgpack.Timestamp(delta.days * 86400 + delta.seconds, delta.microseconds * 1000)
+    if isinstance(value, ObjectId):
+        return msgpack.ExtType(OBJECT_ID_EXT_TYPE, value.binary)
+    raise TypeError(f'Object of type {type(value).__name__} is not MessagePack serializable')
+
+
+def _msgpack_ext_hook(code, data):
+    if code == OBJECT_ID_EXT_TYPE:
+        return ObjectId(data)
+    return msgpack.ExtType(code, data)
+
+
+def _cbor_default(encoder, value):
+    if isinstance(value, ObjectId):
+        encoder.encode(cbor2.CBORTag(OBJECT_ID_CBOR_TAG, value.binary))
+        return
+    raise TypeError(f'Object of type {type(value).__name__} is not CBOR serializable')
+
+
+def _cbor_tag_hook(*args):
+    # cbor2 5 passes (decoder, tag), cbor2 6 passes (tag, immutable)
+    tag = next(arg for arg in args if isinstance(arg, cbor2.CBORTag))
+    if tag.tag == OBJECT_ID_CBOR_TAG:
+        return ObjectId(tag.value)
+    return tag
+
+
+def encode(payload, mimetype):
+    """Encode ``payload`` as ``mimetype``."""
+    if mimetype == MSGPACK:
+        return msgpack.packb(payload, default=_msgpack_default, datetime=False)
+    if mimetype == CBOR:
+        return cbor2.dumps(payload, default=_cbor_default, timezone=timezone.utc, datetime_as_timestamp=True)
+    return json.dumps(payload)
+
+
+def decode(body, mimetype):
+    """Decode a response body produced by :func:`encode`."""
+    if mimetype == MSGPACK or mimetype in MSGPACK_ALIASES:
+        return msgpack.unpackb(body, ext_hook=_msgpack_ext_hook, timestamp=3)
+    if mimetype == CBOR:
+        return cbor2.loads(body, tag_hook=_cbor_tag_hook)
+    return json.loads(body) if body else None
+
+
+def api_response(payload):
+    """Return ``payload`` as a response in the negotiated format.
+
+    Use like ``jsonify``: ``return api_response({...}), 400``.
+    """
+    mimetype = negotiate()
+    if mimetype == JSON:
+        response = current_app.json.response(payload)
+    else:
+        response = current_app.response_class(encode(payload, mimetype), mimetype=mimetype)
+    # Caches must keep one copy per representation
+    response.vary.add('Accept')
+    return response
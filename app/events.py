@@ -0,0 +1,406 @@
+"""Live change events for contacts and affirmations, served as Server-Sent Events.
+
+Writes made through ``database.py`` are published to an event bus, and
+``/api/v1/stream`` relays them to connected clients. Every event has an id;
+a reconnecting client sends it back as ``Last-Event-ID`` and receives the
+events it missed, as long as they are still in the bus's replay buffer.
+
+Three bus implementations are available through ``EVENTS_BACKEND``:
+
+``memory``
+    In-process ring buffer. Only clients connected to the worker that
+    handled the write see the event; fine for development or one worker.
+``file``
+    Events are appended to ``EVENTS_FILE`` and every worker tails it, so all
+    workers on one host see all events. The file is rotated at
+    ``EVENTS_FILE_MAX_BYTES``.
+``changestream``
+    A MongoDB change stream over the watched collections; sees writes from
+    every process and host. Requires a replica set and falls back to
+    ``memory`` when change streams are unavailable.
+
+The ``file`` and ``changestream`` buses give an event the same id in every
+worker, so a client may reconnect to any of them. Each worker starts
+following its bus when it starts (``start()``, called by gunicorn's
+``post_worker_init`` and by run.py), not when its first client connects.
+
+An open stream occupies a whole worker thread under the sync and gthread
+worker classes, so only ``EVENTS_MAX_THREADED_STREAMS`` streams are allowed
+per worker there. Run gunicorn with ``GUNICORN_WORKER_CLASS=gevent`` to
+hold up to ``EVENTS_MAX_STREAMS`` idle connections per worker.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from itertools import islice
+
+from bson import ObjectId
+from flask import Response, current_app, has_app_context, jsonify
+
+import database
+from serializers import PUBLIC_PROJECTIONS, public_fields
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = {
+    database.document_inserted: 'created',
+    database.document_updated: 'updated',
+    database.document_deleted: 'deleted'
+}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def make_event(event_type, collection_name, document_id, document=None):
+    """Build the JSON payload of a change event."""
+    return json.dumps({
+        'type': event_type,
+        'collection': collection_name,
+        'id': str(document_id) if document_id is not None else None,
+        'document': document,
+        'timestamp': datetime.utcnow().isoformat()
+    }, default=_json_default)
+
+
+class MemoryEventBus:
+    """In-process event bus with a bounded replay buffer."""
+
+    def __init__(self, buffer_size=1000):
+        self._events = deque(maxlen=buffer_size)  # (seq, event_id, event_type, data)
+        self._seq = 0
+        self._condition = threading.Condition()
+        self._streams = 0
+        self._streams_lock = threading.Lock()
+        # Ids from a previous process must not match this one's
+        self._boot = uuid.uuid4().hex[:8]
+
+    def publish(self, event_type, data):
+        """Publish a serialized event."""
+        self._append(None, event_type, data)
+
+    def _append(self, event_id, event_type, data):
+        with self._condition:
+            self._seq += 1
+            if event_id is None:
+                event_id = f'{self._boot}-{self._seq}'
+            self._events.append((self._seq, event_id, event_type, data))
+            self._condition.notify_all()
+
+    def start(self):
+        """Start background work, if any, in the current process."""
+
+    def cursor(self, last_event_id=None):
+        """Return the position to stream from for a (re)connecting client."""
+        self.start()
+        with self._condition:
+            if not last_event_id:
+                return self._seq
+            for seq, event_id, _, _ in reversed(self._events):
+                if event_id == last_event_id:
+                    return seq
+            # Unknown or expired id: replay everything still buffered
+            return self._events[0][0] - 1 if self._events else self._seq
+
+    def wait(self, after, timeout):
+        """Return events newer than ``after``, waiting up to ``timeout`` seconds."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq > after, timeout)
+            missed = min(self._seq - after, len(self._events))
+            if missed <= 0:
+                return []
+            return list(islice(reversed(self._events), missed))[::-1]
+
+    def open_stream(self, capacity):
+        """Reserve one of ``capacity`` stream slots; return False if full."""
+        with self._streams_lock:
+            if self._streams >= capacity:
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        with self._streams_lock:
+            self._streams -= 1
+
+
+class FileEventBus(MemoryEventBus):
+    """Event bus shared by all workers on a host through an append-only file.
+
+    Event ids are ``<inode>:<offset>`` of the event's line, so they are the
+    same in every worker. A starting worker buffers the last events of the
+    file, to resume clients that reconnect from another worker, and then
+    follows the events written after them.
+    """
+
+    def __init__(self, path, buffer_size=1000, max_bytes=10 * 1024 * 1024, poll_interval=0.2):
+        super().__init__(buffer_size)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self._pid = None
+        self._start_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def publish(self, event_type, data):
+        import fcntl
+        line = json.dumps({'event': event_type, 'data': data}) + '\n'
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + '.1')
+                with open(self.path, 'a') as f:
+                    f.write(line)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def start(self):
+        # Threads do not survive fork(), so every worker starts its own tail
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._start_lock:
+            if self._pid != pid:
+                f = inode = None
+                try:
+                    f, inode = self._open()
+                    self._backfill(f, inode)
+                except OSError as e:
+                    logger.warning(f'Could not read past events from {self.path}: {e}')
+                threading.Thread(target=self._tail, args=(f, inode), name='events-tail', daemon=True).start()
+                self._pid = pid
+
+    def _open(self):
+        open(self.path, 'a').close()
+        f = open(self.path, 'rb')
+        return f, os.fstat(f.fileno()).st_ino
+
+    def _read_event(self, inode, position, line):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            logger.warning(f'Skipping malformed event at {self.path}:{position}')
+            return
+        self._append(f'{inode}:{position + len(line)}', record['event'], record['data'])
+
+    def _backfill(self, f, inode):
+        """Buffer the last events of ``f`` and leave it after the last full line."""
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        f.seek(end)
+        lines = data[:end].splitlines(keepends=True)[-self._events.maxlen:]
+        position = end - sum(len(line) for line in lines)
+        for line in lines:
+            self._read_event(inode, position, line)
+            position += len(line)
+
+    def _tail(self, f=None, inode=None):
+        while True:
+            try:
+                if f is None:
+                    # A rotated file holds only new events: read it all
+                    f, inode = self._open()
+                position = f.tell()
+                line = f.readline()
+                if line.endswith(b'\n'):
+                    self._read_event(inode, position, line)
+                    continue
+                # Partial or no line yet; check for rotation before sleeping
+                f.seek(position)
+                if os.stat(self.path).st_ino != inode:
+                    f.close()
+                    f = None
+                    continue
+            except OSError as e:
+                if f is not None:
+                    f.close()
+                f = None
+                logger.warning(f'Event file tail error: {e}')
+            time.sleep(self.poll_interval)
+
+
+class ChangeStreamEventBus(MemoryEventBus):
+    """Event bus fed by a MongoDB change stream on the watched collections.
+
+    Event ids are the change stream's resume tokens, so they are the same in
+    every worker.
+    """
+
+    def __init__(self, app, collections, buffer_size=1000):
+        super().__init__(buffer_size)
+        self.app = app
+        self.collections = list(collections)
+        self.available = True
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def publish(self, event_type, data):
+        # With a working change stream, events come from MongoDB itself
+        if not self.available:
+            super().publish(event_type, data)
+
+    def start(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._start_lock:
+            if self._pid != pid:
+                threading.Thread(target=self._watch, name='events-changestream', daemon=True).start()
+                self._pid = pid
+
+    def _watch(self):
+        from pymongo.errors import OperationFailure, PyMongoError
+
+        hidden = {field for collection in self.collections for field in PUBLIC_PROJECTIONS.get(collection, ())}
+        pipeline = [{'$match': {
+            'ns.coll': {'$in': self.collections},
+            'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}
+        }}]
+        if hidden:
+            # Internal fields never leave the database
+            pipeline.append({'$project': {f'fullDocument.{field}': 0 for field in hidden}})
+        types = {'insert': 'created', 'update': 'updated', 'replace': 'updated', 'delete': 'deleted'}
+        resume_token = None
+        with self.app.app_context():
+            while True:
+                try:
+                    db = database.get_db()
+                    with db.watch(pipeline, full_document='updateLookup', resume_after=resume_token) as stream:
+                        for change in stream:
+                            resume_token = stream.resume_token
+                            if change['operationType'] == 'update' and _internal_only(
+                                change['ns']['coll'], change.get('updateDescription', {}).get('updatedFields', {})
+                            ):
+                                continue
+                            event_type = types[change['operationType']]
+                            self._append(change['_id'].get('_data'), event_type, make_event(
+                                event_type,
+                                change['ns']['coll'],
+                                change['documentKey']['_id'],
+                                change.get('fullDocument')
+                            ))
+                except OperationFailure as e:
+                    # Standalone servers do not support change streams
+                    self.app.logger.warning(f'MongoDB change streams unavailable, using in-process events: {e}')
+                    self.available = False
+                    return
+                except PyMongoError as e:
+                    self.app.logger.warning(f'Change stream interrupted, retrying: {e}')
+                    time.sleep(1)
+
+
+def _internal_only(collection_name, changes):
+    """Whether an update changed only internal fields, which clients never see."""
+    hidden = PUBLIC_PROJECTIONS.get(collection_name)
+    return bool(hidden) and bool(changes) and all(field in hidden for field in changes)
+
+
+def get_event_bus():
+    """Return the event bus of the current app."""
+    return current_app.extensions['events']
+
+
+def _publish_write(collection_name, document_id=None, document=None, changes=None, signal=None, **kwargs):
+    if not has_app_context() or 'events' not in current_app.extensions:
+        return
+    if collection_name not in current_app.config['EVENTS_COLLECTIONS']:
+        return
+    if signal is database.document_updated and changes and _internal_only(collection_name, changes):
+        return
+    event_type = EVENT_TYPES[signal]
+    payload = public_fields(collection_name, document or changes)
+    get_event_bus().publish(event_type, make_event(event_type, collection_name, document_id, payload))
+
+
+def _on_inserted(collection_name, **kwargs):
+    _publish_write(collection_name, signal=database.document_inserted, **kwargs)
+
+
+def _on_updated(collection_name, **kwargs):
+    _publish_write(collection_name, signal=database.document_updated, **kwargs)
+
+
+def _on_deleted(collection_name, **kwargs):
+    _publish_write(collection_name, signal=database.document_deleted, **kwargs)
+
+
+def _stream_capacity():
+    """Streams allowed per worker, depending on whether sockets are cooperative."""
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('socket'):
+            return current_app.config['EVENTS_MAX_STREAMS']
+    except ImportError:
+        pass
+    return current_app.config['EVENTS_MAX_THREADED_STREAMS']
+
+
+def stream_response(last_event_id=None):
+    """Build the ``text/event-stream`` response for one client."""
+    bus = get_event_bus()
+    if not bus.open_stream(_stream_capacity()):
+        response = jsonify({
+            'status': 'error',
+            'message': 'Too many open event streams, please retry'
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+
+    heartbeat = current_app.config['EVENTS_HEARTBEAT_SECONDS']
+    position = bus.cursor(last_event_id)
+
+    def generate():
+        nonlocal position
+        try:
+            yield f'retry: {heartbeat * 1000}\n\n'
+            while True:
+                events = bus.wait(position, heartbeat)
+                if not events:
+                    # Comment line keeps proxies from closing the idle connection
+                    yield ': keep-alive\n\n'
+                    continue
+                for seq, event_id, event_type, data in events:
+                    position = seq
+                    yield f'id: {event_id}\nevent: {event_type}\ndata: {data}\n\n'
+        finally:
+            bus.close_stream()
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def init_app(app):
+    """Create the event bus and publish writes made through database.py."""
+    backend = app.config['EVENTS_BACKEND']
+    buffer_size = app.config['EVENTS_BUFFER_SIZE']
+    if backend == 'file':
+        bus = FileEventBus(app.config['EVENTS_FILE'], buffer_size, app.config['EVENTS_FILE_MAX_BYTES'])
+    elif backend == 'changestream' and app.config['DATABASE_BACKEND'] != 'mongodb':
+        app.logger.warning('Change stream events need the mongodb storage backend, using in-process events')
+        bus = MemoryEventBus(buffer_size)
+    elif backend == 'changestream':
+        bus = ChangeStreamEventBus(app, app.config['EVENTS_COLLECTIONS'], buffer_size)
+    elif backend == 'memory':
+        bus = MemoryEventBus(buffer_size)
+    else:
+        raise ValueError(f'Unknown EVENTS_BACKEND: {backend}')
+    app.extensions['events'] = bus
+
+    database.document_inserted.connect(_on_inserted)
+    database.document_updated.connect(_on_updated)
+    database.document_deleted.connect(_on_deleted)
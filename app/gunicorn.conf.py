@@ -0,0 +1,163 @@
+"""Gunicorn configuration.
+
+Worker and thread counts are derived from the container's cgroup CPU and
+memory limits rather than the host's core count. Each worker warms up (see
+``warmup.py``) before it accepts connections. Every setting can be
+overridden through a ``GUNICORN_*`` environment variable:
+
+    GUNICORN_BIND                 address to bind (default 0.0.0.0:$PORT)
+    GUNICORN_WORKER_CLASS         sync, gthread or gevent (default gthread)
+    GUNICORN_WORKERS              worker processes (default: auto)
+    GUNICORN_THREADS              threads per gthread worker (default 4)
+    GUNICORN_WORKER_CONNECTIONS   concurrent clients per gevent worker (default 1000)
+    GUNICORN_WORKER_MEMORY_MB     memory budget per worker for auto-sizing (default 128)
+    GUNICORN_MAX_WORKERS          upper bound for auto-sizing (default 16)
+    GUNICORN_PRELOAD              load the app in the master before forking (default true)
+    GUNICORN_MAX_REQUESTS         recycle a worker after this many requests (default 1000, 0 disables)
+    GUNICORN_MAX_REQUESTS_JITTER  random extra requests before recycling (default max_requests / 10)
+    GUNICORN_TIMEOUT              worker timeout in seconds (default 30)
+    GUNICORN_GRACEFUL_TIMEOUT     graceful shutdown timeout in seconds (default 30)
+    GUNICORN_KEEPALIVE            keep-alive timeout in seconds (default 75, above nginx's 60)
+    GUNICORN_LOG_LEVEL            gunicorn log level (default info)
+"""
+import math
+import os
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def _read_first_line(path):
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit():
+    """Return the CPU quota available to this container, in (fractional) CPUs."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    line = _read_first_line('/sys/fs/cgroup/cpu.max')
+    if line:
+        quota, _, period = line.partition(' ')
+        if quota != 'max' and period:
+            return min(cpus, int(quota) / int(period))
+        return cpus
+
+    # cgroup v1: quota of -1 means unlimited
+    quota = _read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+    period = _read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if quota and period and int(quota) > 0:
+        return min(cpus, int(quota) / int(period))
+    return cpus
+
+
+def cgroup_memory_limit():
+    """Return the container memory limit in bytes, or None when unlimited."""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        line = _read_first_line(path)
+        if line and line != 'max':
+            limit = int(line)
+            # cgroup v1 reports "unlimited" as a huge page-aligned number
+            if limit < 1 << 60:
+                return limit
+    return None
+
+
+def auto_workers(worker_class, cpus, memory_limit):
+    """Size the worker pool for the given worker class and limits."""
+    if worker_class == 'sync':
+        # One request per process; cover I/O waits with extra processes.
+        workers = 2 * cpus + 1
+    elif worker_class == 'gthread':
+        # Threads cover I/O waits; one process per core plus a spare.
+        workers = cpus + 1
+    else:
+        # Cooperative workers multiplex thousands of clients per process.
+        workers = cpus
+
+    if memory_limit:
+        budget = _env_int('GUNICORN_WORKER_MEMORY_MB', 128) * 1024 * 1024
+        workers = min(workers, memory_limit // budget)
+
+    return int(max(1, min(workers, _env_int('GUNICORN_MAX_WORKERS', 16))))
+
+
+# Server socket
+bind = os.environ.get('GUNICORN_BIND') or f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+
+# Worker processes
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class not in ('sync', 'gthread', 'gevent'):
+    raise RuntimeError(f'Unsupported GUNICORN_WORKER_CLASS: {worker_class}')
+
+cpu_limit = max(1, math.ceil(cgroup_cpu_limit()))
+memory_limit = cgroup_memory_limit()
+workers = _env_int('GUNICORN_WORKERS', 0) or auto_workers(worker_class, cpu_limit, memory_limit)
+threads = _env_int('GUNICORN_THREADS', 4) if worker_class == 'gthread' else 1
+worker_connections = _env_int('GUNICORN_WORKER_CONNECTIONS', 1000)
+
+# Load the application once in the master so workers share its memory
+# pages copy-on-write and skip create_app() and the MongoDB startup probe.
+preload_app = _env_bool('GUNICORN_PRELOAD', True)
+
+if worker_class == 'gevent' and preload_app:
+    # The app is imported in the master, so sockets and locks must be
+    # patched before that happens rather than in the worker's init.
+    from gevent import monkey
+    monkey.patch_all()
+
+# Worker recycling; jitter keeps workers from restarting in lockstep
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10)
+
+# Timeouts
+timeout = _env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+# nginx keeps idle upstream connections for 60s (keepalive_timeout in
+# nginx/*.conf); gunicorn must hold them longer, or it may close one just as
+# nginx reuses it and the request fails with a 502. The sync worker class
+# does not support keep-alive and closes every connection.
+keepalive = _env_int('GUNICORN_KEEPALIVE', 75)
+
+# Logging
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    server.log.info(
+        'Starting %d %s worker(s) (threads=%d, cpu_limit=%s, memory_limit=%s, preload=%s)',
+        workers, worker_class, threads, cpu_limit,
+        f'{memory_limit // (1024 * 1024)}MB' if memory_limit else 'unlimited',
+        preload_app
+    )
+
+
+def post_fork(server, worker):
+    # MongoClient is not fork-safe: make sure no client (or pooled socket)
+    # created in the master is reused by this worker.
+    import database
+    database.reset_connections()
+    server.log.debug('Worker %s: MongoDB connections reset after fork', worker.pid)
+
+
+def post_worker_init(worker):
+    # Runs before the worker accepts connections, so no request hits it cold.
+    # worker.notify() keeps the arbiter from killing it during a slow warm-up.
+    import warmup
+    warmup.start_worker(worker.wsgi, heartbeat=worker.notify)
@@ -0,0 +1,96 @@
+"""Invalidation of the nginx micro-cache.
+
+nginx caches a few safe GET responses for seconds (see ``nginx/nginx.conf``).
+Stock nginx has no purge command, so instead of deleting an entry the app
+refreshes it: after a write to a collection listed in ``HTTP_CACHE_PATHS``,
+the affected paths are requested from nginx's internal refresh server at
+``HTTP_CACHE_REFRESH_URL``, which bypasses the cache and stores the fresh
+response under the key the public server uses. Only the bare paths are
+cached: nginx passes requests with a query string straight to the backend.
+
+Refreshes run on a background thread and are coalesced, so a burst of writes
+costs one refresh per path and write requests never wait on nginx. The cache
+TTLs still bound staleness if a refresh fails or races a slower cache fill.
+"""
+import logging
+import os
+import threading
+
+from flask import current_app, has_app_context
+
+import database
+
+logger = logging.getLogger(__name__)
+
+
+class CacheRefresher:
+    """Refresh cached paths on nginx from a background thread."""
+
+    def __init__(self, base_url, paths, timeout=2.0):
+        self.base_url = base_url.rstrip('/')
+        self.paths = paths
+        self.timeout = timeout
+        self._pending = set()
+        self._condition = threading.Condition()
+        self._pid = None
+
+    def schedule(self, collection_name):
+        """Queue a refresh of every cached path that depends on a collection."""
+        paths = self.paths.get(collection_name)
+        if not paths:
+            return
+        self._start()
+        with self._condition:
+            self._pending.update(paths)
+            self._condition.notify()
+
+    def _start(self):
+        # Threads do not survive fork(), so every worker starts its own
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._condition:
+            if self._pid != pid:
+                threading.Thread(target=self._run, name='http-cache-refresh', daemon=True).start()
+                self._pid = pid
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                paths, self._pending = self._pending, set()
+            for path in sorted(paths):
+                self.refresh(path)
+
+    def refresh(self, path):
+        """Replace the cached response for ``path``; return True on success."""
+        import urllib.request
+        # Read from the primary: a lagging secondary would cache stale data
+        request = urllib.request.Request(
+            self.base_url + path,
+            headers={'Accept': 'application/json', database.PRIMARY_READ_HEADER: '1'}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+            return True
+        except OSError as e:
+            logger.warning(f'Could not refresh cached {path}: {e}')
+            return False
+
+
+def _on_write(collection_name, **kwargs):
+    if has_app_context() and 'http_cache' in current_app.extensions:
+        current_app.extensions['http_cache'].schedule(collection_name)
+
+
+def init_app(app):
+    """Refresh nginx cache entries after writes, if a refresh URL is set."""
+    base_url = app.config.get('HTTP_CACHE_REFRESH_URL')
+    if not base_url:
+        return
+    app.extensions['http_cache'] = CacheRefresher(
+        base_url, app.config['HTTP_CACHE_PATHS'], app.config['HTTP_CACHE_REFRESH_TIMEOUT']
+    )
+    for signal in (database.document_inserted, database.document_updated, database.document_deleted):
+        signal.connect(_on_write)
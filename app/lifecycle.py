@@ -0,0 +1,94 @@
+"""Lifecycle of ephemeral collections.
+
+``EPHEMERAL_COLLECTIONS`` declares collections whose documents need not be
+kept, such as the ``test_collection`` written by the MongoDB test endpoints.
+Each entry is either
+
+``{'ttl_field': ..., 'ttl_seconds': ...}``
+    documents are deleted ``ttl_seconds`` after the datetime in
+    ``ttl_field``, through a TTL index (the SQLite backend emulates it), or
+``{'capped_bytes': ..., 'capped_documents': ...}``
+    the MongoDB collection is capped and drops its oldest documents beyond
+    that size (``capped_documents`` is optional). MongoDB only.
+
+MongoDB does not allow TTL indexes on capped collections, so an entry uses
+one or the other. The declarations are applied at startup; changing a TTL
+updates the existing index in place.
+"""
+
+
+def ttl_indexes(collections):
+    """Return ``MONGODB_INDEXES`` entries for the TTL declarations."""
+    return [
+        {
+            'collection': name,
+            'keys': [(spec['ttl_field'], 1)],
+            'options': {'expireAfterSeconds': spec['ttl_seconds']}
+        }
+        for name, spec in collections.items()
+        if 'ttl_field' in spec
+    ]
+
+
+def _validate(name, spec):
+    if 'ttl_field' in spec and 'capped_bytes' in spec:
+        raise ValueError(f'{name}: a capped collection cannot have a TTL')
+    if 'ttl_field' not in spec and 'capped_bytes' not in spec:
+        raise ValueError(f'{name}: declare ttl_field/ttl_seconds or capped_bytes')
+
+
+def apply_mongo(db, collections, logger):
+    """Create capped collections and update changed TTLs in MongoDB.
+
+    New TTL indexes are created with the other indexes by
+    ``database.ensure_indexes`` afterwards.
+    """
+    from pymongo.errors import PyMongoError
+
+    existing = set(db.list_collection_names())
+    for name, spec in collections.items():
+        try:
+            _validate(name, spec)
+            if 'capped_bytes' in spec:
+                _apply_capped(db, name, spec, name in existing, logger)
+            elif name in existing:
+                _update_ttl(db, name, spec, logger)
+        except (PyMongoError, ValueError) as e:
+            logger.warning(f'Could not apply the lifecycle of {name}: {e}')
+
+
+def _apply_capped(db, name, spec, exists, logger):
+    size = spec['capped_bytes']
+    options = {'size': size}
+    if spec.get('capped_documents'):
+        options['max'] = spec['capped_documents']
+    if not exists:
+        db.create_collection(name, capped=True, **options)
+        logger.info(f'Created capped collection {name} ({size} bytes)')
+        return
+    current = db[name].options()
+    if current.get('capped'):
+        if current.get('size') != size or current.get('max') != options.get('max'):
+            db.command('collMod', name, cappedSize=size, cappedMax=options.get('max', 0))
+            logger.info(f'Resized capped collection {name} to {size} bytes')
+        return
+    # Keeps the newest documents that fit; the document limit applies from
+    # the next write on
+    db.command('convertToCapped', name, size=size)
+    if 'max' in options:
+        db.command('collMod', name, cappedMax=options['max'])
+    logger.info(f'Converted {name} to a capped collection ({size} bytes)')
+
+
+def _update_ttl(db, name, spec, logger):
+    key = [(spec['ttl_field'], 1)]
+    for index in db[name].list_indexes():
+        if list(index['key'].items()) != key:
+            continue
+        if index.get('expireAfterSeconds') != spec['ttl_seconds']:
+            db.command('collMod', name, index={
+                'keyPattern': dict(key),
+                'expireAfterSeconds': spec['ttl_seconds']
+            })
+            logger.info(f"Set the TTL of {name}.{spec['ttl_field']} to {spec['ttl_seconds']}s")
+        return
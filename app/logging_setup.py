@@ -0,0 +1,177 @@
+"""Non-blocking application logging and structured access logs.
+
+Log records are put on an in-memory queue by a ``QueueHandler`` and written
+to their destinations (stdout or ``logs/*.log``) by a ``QueueListener``
+thread, so request threads never wait on disk or pipe I/O. The queue is
+bounded; when it is full, records are dropped and counted rather than
+blocking the request.
+
+The access log is one JSON object per request with latency and the time
+spent in ``database.py``. Server errors (5xx) and requests slower than
+``ACCESS_LOG_SLOW_MS`` are always logged; other requests, client errors
+(4xx) included, are sampled with ``ACCESS_LOG_SAMPLE_RATE``.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import current_app, g, request
+from flask.logging import default_handler
+
+ACCESS_LOGGER_NAME = 'access'
+
+# Marks handlers installed here so repeated create_app() calls replace them
+_HANDLER_MARKER = '_queued_logging'
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks and survives ``fork()``.
+
+    The listener thread does not exist in a forked child (e.g. a gunicorn
+    worker when the app is preloaded), so a new queue and listener are
+    created the first time a record is emitted in a new process.
+    """
+
+    def __init__(self, targets, maxsize):
+        super().__init__(queue.Queue(maxsize))
+        self.targets = targets
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._start_lock:
+            if self._pid == pid:
+                return
+            # Never reuse the parent's queue: its locks may be held forever
+            self.queue = queue.Queue(self.maxsize)
+            self.listener = QueueListener(self.queue, *self.targets, respect_handler_level=True)
+            self.listener.start()
+            self._pid = pid
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record):
+        self._ensure_listener()
+        super().emit(record)
+
+    def stop(self):
+        """Flush pending records and stop the listener thread."""
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+        self._pid = None
+        for target in self.targets:
+            target.close()
+
+
+class JSONFormatter(logging.Formatter):
+    """Format a record's ``fields`` attribute (or its message) as JSON."""
+
+    def format(self, record):
+        payload = getattr(record, 'fields', None)
+        if payload is None:
+            payload = {
+                'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+                'level': record.levelname,
+                'message': record.getMessage()
+            }
+        return json.dumps(payload, default=str)
+
+
+def _destination(app, filename, formatter):
+    if app.config.get('LOG_TO_STDOUT'):
+        handler = logging.StreamHandler(sys.stdout)
+    else:
+        os.makedirs('logs', exist_ok=True)
+        handler = RotatingFileHandler(
+            os.path.join('logs', filename),
+            maxBytes=app.config['LOG_MAX_BYTES'],
+            backupCount=app.config['LOG_BACKUP_COUNT']
+        )
+    handler.setFormatter(formatter)
+    return handler
+
+
+def _install(logger, handler, level):
+    """Attach ``handler`` to ``logger``, replacing handlers from earlier calls."""
+    for existing in list(logger.handlers):
+        if getattr(existing, _HANDLER_MARKER, False):
+            logger.removeHandler(existing)
+            existing.stop()
+            atexit.unregister(existing.stop)
+    setattr(handler, _HANDLER_MARKER, True)
+    logger.addHandler(handler)
+    # Once per handler: replaced handlers are unregistered above
+    atexit.register(handler.stop)
+    logger.setLevel(level)
+
+
+def configure_logging(app):
+    """Route app and access logs through a queue to stdout or log files."""
+    level = getattr(logging, app.config['LOG_LEVEL'].upper(), logging.INFO)
+    queue_size = app.config['LOG_QUEUE_SIZE']
+
+    app_destination = _destination(app, 'app.log', logging.Formatter(
+        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+    ))
+    app_destination.setLevel(level)
+    # Flask's synchronous stderr handler would log every record a second time
+    app.logger.removeHandler(default_handler)
+    _install(app.logger, NonBlockingQueueHandler([app_destination], queue_size), level)
+
+    if app.config['ACCESS_LOG_ENABLED']:
+        access_logger = logging.getLogger(ACCESS_LOGGER_NAME)
+        access_logger.propagate = False
+        access_destination = _destination(app, 'access.log', JSONFormatter())
+        _install(access_logger, NonBlockingQueueHandler([access_destination], queue_size), logging.INFO)
+        app.before_request(_start_timer)
+        app.after_request(_log_request)
+
+
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+def _log_request(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    duration_ms = (time.perf_counter() - started) * 1000
+
+    config = current_app.config
+    always = response.status_code >= 500 or duration_ms >= config['ACCESS_LOG_SLOW_MS']
+    if not always and random.random() >= config['ACCESS_LOG_SAMPLE_RATE']:
+        return response
+
+    logging.getLogger(ACCESS_LOGGER_NAME).info('access', extra={'fields': {
+        'ts': datetime.now(timezone.utc).isoformat(),
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'duration_ms': round(duration_ms, 2),
+        'db_time_ms': round(g.get('db_time', 0.0) * 1000, 2),
+        'db_calls': g.get('db_calls', 0),
+        'bytes': response.calculate_content_length(),
+        'remote_addr': request.headers.get('X-Real-IP', request.remote_addr),
+        'user_agent': request.user_agent.string,
+        'sample_rate': 1.0 if always else config['ACCESS_LOG_SAMPLE_RATE']
+    }})
+    return response
@@ -0,0 +1,212 @@
+"""On-demand request profiling.
+
+A request is profiled when it carries ``X-Profile: <PROFILING_TOKEN>`` or
+when it is picked by ``PROFILING_SAMPLE_RATE``. Two modes are available,
+chosen by ``PROFILING_MODE`` or per request with ``X-Profile-Mode``:
+
+``sampler``
+    A background thread samples the request thread's stack every
+    ``PROFILING_SAMPLER_INTERVAL_MS``. Low overhead, suitable for production.
+    Writes ``.collapsed`` (flamegraph.pl / speedscope) and ``.speedscope.json``.
+``cprofile``
+    Deterministic profiling with :mod:`cProfile`. Exact call counts but much
+    higher overhead. Writes a ``.prof`` file (``pstats``, snakeviz) and a
+    ``.txt`` summary of the most expensive functions.
+
+Files go to ``PROFILING_DIR`` and are named after the time, endpoint,
+process and request duration, e.g.
+``20240101T120000-api_v1.list_contacts-4242-153ms.speedscope.json``.
+"""
+import hmac
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_MODE_HEADER = 'HTTP_X_PROFILE_MODE'
+MODES = ('sampler', 'cprofile')
+
+
+class StackSampler:
+    """Sample one thread's Python stack at a fixed interval."""
+
+    def __init__(self, thread_id, interval, root=None):
+        self.thread_id = thread_id
+        self.interval = interval
+        # Frames above ``root`` (server and middleware plumbing) are dropped
+        self.root = root
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                if code is self.root:
+                    break
+                frame = frame.f_back
+            stack.reverse()
+            self.samples[tuple(stack)] += 1
+
+    def collapsed(self):
+        """Return the samples in Brendan Gregg's collapsed-stack format."""
+        lines = []
+        for stack, count in self.samples.most_common():
+            frames = ';'.join(f'{name} ({os.path.basename(filename)}:{line})' for name, filename, line in stack)
+            lines.append(f'{frames} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def speedscope(self, name):
+        """Return the samples as a speedscope "sampled" profile."""
+        frames = []
+        index = {}
+        samples = []
+        weights = []
+        weight = self.interval * 1000
+        for stack, count in self.samples.items():
+            sample = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+                sample.append(index[frame])
+            samples.append(sample)
+            weights.append(count * weight)
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights
+            }],
+            'name': name,
+            'exporter': 'app.profiling'
+        }
+
+
+class ProfilingMiddleware:
+    """WSGI middleware that profiles selected requests."""
+
+    def __init__(self, app, wsgi_app):
+        self.app = app
+        self.wsgi_app = wsgi_app
+        self.token = app.config['PROFILING_TOKEN']
+        self.sample_rate = app.config['PROFILING_SAMPLE_RATE']
+        self.mode = app.config['PROFILING_MODE']
+        self.interval = app.config['PROFILING_SAMPLER_INTERVAL_MS'] / 1000.0
+        self.directory = app.config['PROFILING_DIR']
+        self._cprofile_lock = threading.Lock()
+        if self.mode not in MODES:
+            raise ValueError(f'Unknown PROFILING_MODE: {self.mode}')
+
+    def __call__(self, environ, start_response):
+        if not self._should_profile(environ):
+            return self.wsgi_app(environ, start_response)
+
+        mode = environ.get(PROFILE_MODE_HEADER, self.mode)
+        if mode not in MODES:
+            mode = self.mode
+
+        started = time.perf_counter()
+        # Only one deterministic profiler may be active per process
+        if mode == 'cprofile' and self._cprofile_lock.acquire(blocking=False):
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                return self.wsgi_app(environ, start_response)
+            finally:
+                profiler.disable()
+                self._cprofile_lock.release()
+                self._dump_cprofile(environ, profiler, time.perf_counter() - started)
+        else:
+            sampler = StackSampler(threading.get_ident(), self.interval, root=self.__call__.__code__)
+            sampler.start()
+            try:
+                return self.wsgi_app(environ, start_response)
+            finally:
+                sampler.stop()
+                self._dump_samples(environ, sampler, time.perf_counter() - started)
+
+    def _should_profile(self, environ):
+        header = environ.get(PROFILE_HEADER)
+        # WSGI headers are latin-1 strings; compare_digest rejects non-ASCII str
+        if header and self.token and hmac.compare_digest(header.encode('latin-1'), self.token.encode()):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _endpoint(self, environ):
+        try:
+            rule, _ = self.app.url_map.bind_to_environ(environ).match(return_rule=True)
+            return rule.endpoint
+        except Exception:
+            return 'unmatched'
+
+    def _base_path(self, environ, duration):
+        os.makedirs(self.directory, exist_ok=True)
+        name = '{}-{}-{}-{}ms'.format(
+            datetime.utcnow().strftime('%Y%m%dT%H%M%S'),
+            self._endpoint(environ),
+            os.getpid(),
+            int(duration * 1000)
+        )
+        return os.path.join(self.directory, name)
+
+    def _dump_samples(self, environ, sampler, duration):
+        try:
+            base = self._base_path(environ, duration)
+            with open(base + '.collapsed', 'w') as f:
+                f.write(sampler.collapsed())
+            with open(base + '.speedscope.json', 'w') as f:
+                json.dump(sampler.speedscope(os.path.basename(base)), f)
+            self.app.logger.info(f'Profile written to {base}.speedscope.json')
+        except OSError as e:
+            self.app.logger.error(f'Could not write profile: {e}')
+
+    def _dump_cprofile(self, environ, profiler, duration):
+        try:
+            base = self._base_path(environ, duration)
+            profiler.dump_stats(base + '.prof')
+            import pstats
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(40)
+            with open(base + '.txt', 'w') as f:
+                f.write(summary.getvalue())
+            self.app.logger.info(f'Profile written to {base}.prof')
+        except OSError as e:
+            self.app.logger.error(f'Could not write profile: {e}')
+
+
+def init_app(app):
+    """Wrap the WSGI app with the profiling middleware if enabled."""
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+    app.wsgi_app = ProfilingMiddleware(app, app.wsgi_app)
+    app.logger.info(
+        f"Request profiling enabled (mode={app.config['PROFILING_MODE']}, "
+        f"sample_rate={app.config['PROFILING_SAMPLE_RATE']}, dir={app.config['PROFILING_DIR']})"
+    )
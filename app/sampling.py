@@ -0,0 +1,290 @@
+"""Weighted, non-repeating choice of affirmations.
+
+Affirmations are drawn with a weight per ``category``:
+``AFFIRMATION_CATEGORY_WEIGHTS`` sets the default weights, and each named
+campaign in ``AFFIRMATION_CAMPAIGNS`` (chosen with ``?campaign=``) overrides
+some of them. Categories without a weight weigh 1 and a weight of 0 leaves a
+category out. A weight applies to every affirmation of its category, so a
+category is drawn in proportion to weight x size, through an alias table
+(Vose's method: O(categories) to build, O(1) per draw), then one of its
+affirmations uniformly.
+
+With ``rotate=True`` a visitor sees no affirmation twice until they have
+seen every one the weights allow. The visitor's position is kept in the
+signed session cookie as a seed and the catalog version plus, per category
+started, the category size, the number drawn so far and a checksum of the
+``_id`` of the last affirmation the walk started with. Each category is walked in the order of a
+keyed pseudo-random permutation (a Feistel network), so the cookie stays a
+few bytes per category however many affirmations there are.
+
+Affirmations come from the shared snapshot (``snapshot.py``), where each
+category is a contiguous range sorted by ``_id``. Rebuilding the snapshot
+after a write only changes the category ranges: the alias tables of the new
+version are rebuilt from the category sizes on first use, and an
+affirmation added to a category lands at the end of its range, so visitors
+already walking that category get it after the ones they have not seen
+yet. When a category shrinks, its walk restarts; so does it when the
+version changed and the checksum no longer matches, which is when an
+affirmation was deleted and another added. Without the snapshot the
+collection is read from the database on every draw.
+"""
+import random
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import current_app, session
+
+import database
+from snapshot import UNAVAILABLE, group_documents
+
+# Session key of the visitor's rotation
+ROTATION_KEY = 'affirmation_rotation'
+
+# A rotation that has started more categories than this starts over, which
+# bounds the session cookie
+ROTATION_MAX_CATEGORIES = 40
+
+# Alias tables kept per process, across snapshot versions and campaigns
+ALIAS_CACHE_SIZE = 64
+
+
+class AliasTable:
+    """Weighted choice among keys in O(1), by Vose's alias method."""
+
+    __slots__ = ('keys', 'probability', 'alias')
+
+    def __init__(self, weights):
+        self.keys = [key for key, weight in weights.items() if weight > 0]
+        size = len(self.keys)
+        if not size:
+            raise ValueError('An alias table needs a positive weight')
+        total = sum(weights[key] for key in self.keys)
+        scaled = [weights[key] * size / total for key in self.keys]
+        self.probability = [1.0] * size
+        self.alias = list(range(size))
+        small = [index for index, value in enumerate(scaled) if value < 1]
+        large = [index for index, value in enumerate(scaled) if value >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] += scaled[less] - 1
+            (small if scaled[more] < 1 else large).append(more)
+        # What is left is 1 up to rounding errors
+
+    def sample(self, rng=random):
+        index = rng.randrange(len(self.keys))
+        if rng.random() >= self.probability[index]:
+            index = self.alias[index]
+        return self.keys[index]
+
+
+def _new_rotation(version):
+    return {'seed': random.getrandbits(64), 'version': version, 'categories': {}}
+
+
+def permute(index, size, key):
+    """Return position ``index`` of a permutation of ``range(size)`` keyed by ``key``.
+
+    A four-round Feistel network over the smallest even number of bits
+    that covers ``size``, cycle-walking until the value falls in range
+    (under four rounds of the network on average).
+    """
+    if size < 2:
+        return index
+    bits = max((size - 1).bit_length(), 2)
+    bits += bits & 1
+    half = bits // 2
+    mask = (1 << half) - 1
+    value = index
+    while True:
+        left, right = value >> half, value & mask
+        for round_key in (key, key >> 16, key >> 32, key >> 48):
+            mixed = ((right + 1) * 0x9E3779B1 ^ round_key) & 0xFFFFFFFF
+            mixed = (mixed ^ mixed >> 15) * 0x2C1B3C6D & 0xFFFFFFFF
+            left, right = right, left ^ (mixed >> 7 & mask)
+        value = left << half | right
+        if value < size:
+            return value
+
+
+class _SnapshotCatalog:
+    def __init__(self, snapshot, version, groups):
+        self.snapshot = snapshot
+        self.version = version
+        self.groups = groups
+
+    def fetch(self, category, index):
+        return self.snapshot.get(self.groups[category][0] + index, self.version)
+
+
+class _ListCatalog:
+    version = None
+
+    def __init__(self, documents):
+        self.documents, self.groups = group_documents(documents, 'category')
+
+    def fetch(self, category, index):
+        return self.documents[self.groups[category][0] + index]
+
+
+def _catalog(use_snapshot=True):
+    snapshot = current_app.extensions.get('affirmations_snapshot')
+    # The snapshot may predate the client's own writes
+    if use_snapshot and snapshot is not None and not database.reads_own_writes():
+        groups = snapshot.groups()
+        if groups is not UNAVAILABLE:
+            return _SnapshotCatalog(snapshot, *groups)
+    return _ListCatalog(database.find_documents('affirmations', read=database.READ_SECONDARY))
+
+
+def category_weights(campaign=None):
+    """Return the category weights of ``campaign`` (the defaults if unknown)."""
+    weights = dict(current_app.config['AFFIRMATION_CATEGORY_WEIGHTS'])
+    weights.update(current_app.config['AFFIRMATION_CAMPAIGNS'].get(campaign) or {})
+    return weights
+
+
+class Sampler:
+    """Alias tables per catalog version, campaign and exhausted categories."""
+
+    def __init__(self, cache_size=ALIAS_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._tables = OrderedDict()
+
+    def table(self, catalog, campaign, exclude=frozenset()):
+        """Return the alias table over ``catalog``'s categories, or None if all weigh 0."""
+        key = (catalog.version, campaign, exclude)
+        if catalog.version is not None:
+            with self._lock:
+                table = self._tables.get(key)
+                if table is not None:
+                    self._tables.move_to_end(key)
+                    return table
+        weights = category_weights(campaign)
+        masses = {
+            category: weights.get(category, 1) * (end - start)
+            for category, (start, end) in catalog.groups.items()
+            if category not in exclude
+        }
+        table = AliasTable(masses) if any(mass > 0 for mass in masses.values()) else None
+        if catalog.version is not None and table is not None:
+            # Built outside the lock: a lost race only builds a table twice
+            with self._lock:
+                self._tables[key] = table
+                while len(self._tables) > self.cache_size:
+                    self._tables.popitem(last=False)
+        return table
+
+    def draw(self, catalog, campaign):
+        table = self.table(catalog, campaign)
+        if table is None:
+            return None
+        category = table.sample()
+        start, end = catalog.groups[category]
+        return catalog.fetch(category, random.randrange(end - start))
+
+    @staticmethod
+    def _mark(catalog, category, size):
+        # Checksum of the last affirmation of a walk's first ``size``
+        document = catalog.fetch(category, size - 1)
+        if document is UNAVAILABLE:
+            return UNAVAILABLE
+        return zlib.crc32(str(document['_id']).encode())
+
+    def draw_rotating(self, catalog, campaign, state):
+        """Draw an affirmation the visitor has not seen in this rotation.
+
+        ``state`` is the visitor's rotation from the session, or None to
+        start one; returns the affirmation and the state to store, which is
+        ``state`` itself when nothing was drawn.
+        """
+        previous = state
+        if not state or len(state['categories']) > ROTATION_MAX_CATEGORIES:
+            state = _new_rotation(catalog.version)
+        else:
+            # Copied: a draw that is retried must not advance the session
+            state = {'seed': state['seed'], 'version': state.get('version'),
+                     'categories': {c: list(w) for c, w in state['categories'].items()}}
+        walks = state['categories']
+        # A delete and an insert leave a category's size unchanged but shift
+        # its affirmations, so after a rebuild the walks are checked
+        if catalog.version is None or state['version'] != catalog.version:
+            for category, walk in list(walks.items()):
+                start, end = catalog.groups.get(category, (0, 0))
+                if end - start < walk[0]:
+                    continue  # restarted below
+                mark = self._mark(catalog, category, walk[0])
+                if mark is UNAVAILABLE:
+                    return UNAVAILABLE, previous
+                if walk[2:] != [mark]:
+                    del walks[category]
+            state['version'] = catalog.version
+        for _ in range(2):
+            exhausted = set()
+            for category, (start, end) in catalog.groups.items():
+                walk = walks.get(category)
+                if walk is None:
+                    continue
+                if end - start < walk[0]:
+                    del walks[category]  # affirmations were deleted
+                elif walk[1] >= end - start:
+                    exhausted.add(category)
+            table = self.table(catalog, campaign, frozenset(exhausted))
+            if table is not None:
+                break
+            # Every affirmation was seen: start over
+            state = _new_rotation(catalog.version)
+            walks = state['categories']
+        else:
+            return None, previous
+
+        category = table.sample()
+        start, end = catalog.groups[category]
+        if category not in walks:
+            mark = self._mark(catalog, category, end - start)
+            if mark is UNAVAILABLE:
+                return UNAVAILABLE, previous
+            walks[category] = [end - start, 0, mark]
+        size, drawn = walks[category][:2]
+        # The first ``size`` are permuted, later additions follow in order
+        if drawn < size:
+            index = permute(drawn, size, state['seed'] ^ zlib.crc32(category.encode()))
+        else:
+            index = drawn
+        walks[category][1] = drawn + 1
+        return catalog.fetch(category, index), state
+
+
+def get_sampler():
+    """Get the sampler of the current app."""
+    return current_app.extensions['affirmation_sampler']
+
+
+def next_affirmation(campaign=None, rotate=False):
+    """Return a weighted random affirmation, or None if there is none.
+
+    ``rotate`` avoids repeats for the visitor (see the module docstring).
+    """
+    sampler = get_sampler()
+    # A snapshot rebuilt during the draw leaves it unavailable; the retry
+    # reads the database
+    for use_snapshot in (True, False):
+        catalog = _catalog(use_snapshot)
+        if rotate:
+            affirmation, state = sampler.draw_rotating(catalog, campaign, session.get(ROTATION_KEY))
+        else:
+            affirmation = sampler.draw(catalog, campaign)
+        if affirmation is not UNAVAILABLE:
+            break
+    # Assigning would mark the session modified and send a Set-Cookie
+    if rotate and state != session.get(ROTATION_KEY):
+        session[ROTATION_KEY] = state
+    return affirmation
+
+
+def init_app(app):
+    """Set up the affirmation sampler."""
+    app.extensions['affirmation_sampler'] = Sampler()
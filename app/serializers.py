@@ -0,0 +1,59 @@
+"""Helpers for converting MongoDB documents to and from API payloads."""
+
+CONTACT_FIELDS = ['first_name', 'last_name', 'email', 'phone', 'company', 'notes']
+
+# Match keys stored on contacts for duplicate detection (dedup.py); internal
+CONTACT_KEY_FIELDS = ['email_key', 'phone_key', 'name_key']
+
+# Projections leaving internal fields out of the documents sent to clients
+PUBLIC_PROJECTIONS = {
+    'contacts': dict.fromkeys(CONTACT_KEY_FIELDS, 0)
+}
+
+
+def public_fields(collection_name, document):
+    """Return a copy of ``document`` without the collection's internal fields."""
+    hidden = PUBLIC_PROJECTIONS.get(collection_name)
+    if not hidden or document is None:
+        return document
+    return {field: value for field, value in document.items() if field not in hidden}
+
+
+def serialize_document(document):
+    """Convert ObjectId and datetime fields of a document to JSON-safe values.
+
+    The document is modified in place and returned for convenience.
+    """
+    document['_id'] = str(document['_id'])
+    # Convert datetime objects to ISO format strings
+    created_at = document.get('created_at')
+    if created_at:
+        document['created_at'] = created_at.isoformat()
+    updated_at = document.get('updated_at')
+    if updated_at:
+        document['updated_at'] = updated_at.isoformat()
+    return document
+
+
+def serialize_documents(documents):
+    """Serialize a list of documents in place and return it."""
+    for document in documents:
+        serialize_document(document)
+    return documents
+
+
+def normalize_contact(data, now):
+    """Build a contact document from request data.
+
+    Text fields are stripped and the email address is lowercased.
+    """
+    return {
+        'first_name': data.get('first_name', '').strip(),
+        'last_name': data.get('last_name', '').strip(),
+        'email': data.get('email', '').strip().lower(),
+        'phone': data.get('phone', '').strip(),
+        'company': data.get('company', '').strip(),
+        'notes': data.get('notes', '').strip(),
+        'created_at': now,
+        'updated_at': now
+    }
@@ -0,0 +1,124 @@
+"""Coalescing of identical concurrent reads ("single flight").
+
+When several threads of a worker ask for the same documents at the same
+moment, e.g. a burst of ``find_documents('affirmations')``, the first one
+runs the query and the others wait for its result instead of sending the
+same query again. Calls are identical when their key is: collection,
+query, projection, limit, sort and read routing.
+
+Every caller gets its own copy of the result, since routes modify documents
+in place while serializing them; without waiters the leader keeps the
+original and nothing is copied. A coalesced read may reflect the database
+as of when the shared query started, so requests that need their own
+writes bypass it (see ``database.find_documents``). When the shared query
+fails, each waiter raises its own copy of the error, chained to the
+leader's.
+"""
+import copy
+import json
+import threading
+from collections import OrderedDict
+
+
+def make_key(collection_name, query, projection=None, limit=None, sort=None, secondary=False):
+    """Return a hashable, order-insensitive key for a read."""
+    # repr() keeps ObjectIds and datetimes distinct from equal-looking strings
+    normalized = json.dumps([query, projection], sort_keys=True, default=repr)
+    sort = tuple(tuple(pair) for pair in sort) if sort else None
+    return (collection_name, normalized, limit or None, sort, bool(secondary))
+
+
+def copy_documents(documents):
+    """Copy a result so that one caller's changes are invisible to the others."""
+    return [
+        {key: copy.deepcopy(value) if isinstance(value, (dict, list)) else value for key, value in document.items()}
+        for document in documents
+    ]
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and share its result.
+
+    Per-key counters are kept for the ``max_keys`` most recently used keys:
+    ``calls`` made, ``executions`` that reached the database and ``shared``
+    calls served by another's execution (the calls saved); the totals
+    count every key.
+    """
+
+    def __init__(self, max_keys=256):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = OrderedDict()
+        self._totals = {'calls': 0, 'executions': 0, 'shared': 0}
+
+    def _count(self, key, field):
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = {'calls': 0, 'executions': 0, 'shared': 0}
+            if len(self._stats) > self.max_keys:
+                self._stats.popitem(last=False)
+        else:
+            self._stats.move_to_end(key)
+        for counters in (stats, self._totals):
+            counters['calls'] += 1
+            counters[field] += 1
+
+    def do(self, key, func):
+        """Return ``func()``, or a copy of the result of an identical call in flight."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+                self._count(key, 'executions')
+            else:
+                flight.waiters += 1
+                leader = False
+                self._count(key, 'shared')
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                # Raising the leader's exception itself would make every
+                # waiter append to its one __traceback__ and __context__
+                try:
+                    error = copy.copy(flight.error)
+                except Exception:
+                    error = None  # not copyable: share it after all
+                if error is None:
+                    raise flight.error
+                raise error from flight.error
+            return copy_documents(flight.result)
+
+        try:
+            flight.result = func()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                waiters = flight.waiters
+            flight.done.set()
+        # Waiters copy the original, so the leader must not modify it
+        return copy_documents(flight.result) if waiters else flight.result
+
+    def snapshot(self):
+        """Return the counters, per key and in total."""
+        with self._lock:
+            keys = [
+                dict(stats, collection=key[0], query=key[1], limit=key[2], secondary=key[4])
+                for key, stats in self._stats.items()
+            ]
+            return {'totals': dict(self._totals), 'keys': keys}
@@ -0,0 +1,329 @@
+"""Affirmations snapshot shared by all workers of a host.
+
+Without it every gunicorn worker loads the whole ``affirmations`` collection
+for each random affirmation (``main.index`` and the random endpoints). With
+``AFFIRMATIONS_SNAPSHOT_ENABLED`` one worker, the leader, writes the
+collection into a memory-mapped file at ``AFFIRMATIONS_SNAPSHOT_PATH`` (in
+``/dev/shm`` where it exists) and every worker reads from the same pages:
+picking a random affirmation decodes that one document only, and no worker
+keeps a copy of the collection.
+
+File layout (little endian)::
+
+    header   magic, seq, version, count, length, dirty, clean, built_at,
+             groups_length
+    offsets  count + 1 record offsets, as uint64
+    records  one document per record, in Extended JSON (storage/extjson.py)
+    groups   JSON object of ``group_by`` value -> [first, end) record range
+
+With ``group_by`` (``category`` for affirmations) the records are sorted by
+that field and then by ``_id``, so each group is a contiguous range and new
+documents go to the end of theirs; ``sampling.py`` draws from the ranges.
+
+Readers take no lock. The leader makes ``seq`` odd while it rewrites the file
+and even again when done (a seqlock), so a reader that sees an odd or
+changed ``seq`` retries. ``version`` counts rebuilds.
+
+The leader is whichever worker holds an exclusive ``flock`` on
+``<path>.lock``; every worker runs a thread that tries to take it, so
+another worker takes over when the leader exits. A write to ``affirmations``
+in any worker stores a new ``dirty`` mark in the header; the leader rebuilds
+when the mark differs from the one its last build started from (``clean``),
+and at least every ``AFFIRMATIONS_SNAPSHOT_INTERVAL_SECONDS``. Until the
+first build, or if the file is unusable, reads fall back to the database.
+"""
+import json
+import logging
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+
+from flask import current_app, has_app_context
+
+import database
+from storage.extjson import decode_document, encode_document
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so no leader election
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'AFFSNAP2'
+HEADER = struct.Struct('<8sQQQQQQdQ')
+HEADER_SIZE = 128
+UINT64 = struct.Struct('<Q')
+RECORD_BOUNDS = struct.Struct('<QQ')
+
+# Byte offsets of the header fields written on their own
+SEQ = 8
+DIRTY = 40
+
+# Attempts of a read that keeps racing the leader before falling back
+READ_ATTEMPTS = 20
+
+# Seconds before the leader retries a failed build
+RETRY_SECONDS = 5.0
+
+# Returned by reads that could not use the snapshot
+UNAVAILABLE = object()
+
+
+def group_documents(documents, field):
+    """Sort documents by ``field`` then ``_id``; return them and each group's range."""
+    documents = sorted(documents, key=lambda document: (str(document.get(field) or ''), str(document.get('_id'))))
+    groups = {}
+    for index, document in enumerate(documents):
+        group = str(document.get(field) or '')
+        if group in groups:
+            groups[group][1] = index + 1
+        else:
+            groups[group] = [index, index + 1]
+    return documents, groups
+
+
+def _record(mapping, index, count):
+    start, end = RECORD_BOUNDS.unpack_from(mapping, HEADER_SIZE + 8 * index)
+    base = HEADER_SIZE + 8 * (count + 1)
+    return mapping[base + start:base + end]
+
+
+class SharedSnapshot:
+    """A collection serialized into a memory-mapped file, rebuilt by a leader.
+
+    ``load`` returns the documents; only the leader calls it.
+    """
+
+    def __init__(self, path, load, interval=60.0, poll=0.5, group_by=None):
+        self.path = path
+        self.load = load
+        self.group_by = group_by
+        self.interval = interval
+        self.poll = poll
+        self.leader = False
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+        self._lock_fd = None
+        self._groups = None
+
+    def _open(self):
+        # Files and flocks are opened per process: a flock taken through an
+        # inherited descriptor would be shared with the parent
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(fd).st_size < HEADER_SIZE:
+                os.ftruncate(fd, HEADER_SIZE)
+            self._fd = fd
+            self._map = mmap.mmap(fd, 0)
+            self.leader = False
+            self._lock_fd = None
+            threading.Thread(target=self._run, name='affirmations-snapshot', daemon=True).start()
+            self._pid = pid
+
+    def _mapping(self, min_size=0):
+        """Return a mapping of the whole file, growing the file to ``min_size``."""
+        mapping = self._map
+        if len(mapping) >= min_size:
+            return mapping
+        with self._lock:
+            size = os.fstat(self._fd).st_size
+            if size < min_size:
+                size = max(min_size, 2 * size)
+                os.ftruncate(self._fd, size)
+            # The old mapping stays valid for readers still holding it; the
+            # file never shrinks, so none of them reads past its end
+            if len(self._map) < size:
+                self._map = mmap.mmap(self._fd, 0)
+            return self._map
+
+    def _read(self, read):
+        """Return ``(version, read(mapping, count, length, groups_length))``.
+
+        ``read`` runs again whenever the leader rewrote the file meanwhile;
+        what it returns is only consistent once this returns. Returns
+        ``UNAVAILABLE`` before the first build or after too many retries.
+        """
+        try:
+            self._open()
+        except OSError as e:
+            logger.warning(f'Could not open the snapshot {self.path}: {e}')
+            return UNAVAILABLE
+        mapping = self._map
+        for _ in range(READ_ATTEMPTS):
+            magic, seq, version, count, length, _, _, _, groups_length = HEADER.unpack_from(mapping, 0)
+            if magic != MAGIC or not version:
+                return UNAVAILABLE
+            if seq & 1:
+                time.sleep(0)
+                continue
+            if len(mapping) < HEADER_SIZE + length:
+                mapping = self._mapping(HEADER_SIZE + length)
+                continue
+            try:
+                result = read(mapping, count, length, groups_length)
+            except struct.error:
+                # Offsets torn by a concurrent rebuild
+                continue
+            if UINT64.unpack_from(mapping, SEQ)[0] == seq:
+                return version, result
+        return UNAVAILABLE
+
+    def choice(self):
+        """Return a random document, None if there are none, or ``UNAVAILABLE``."""
+        result = self._read(lambda mapping, count, length, groups_length:
+                            _record(mapping, random.randrange(count), count) if count else None)
+        if result is UNAVAILABLE:
+            return UNAVAILABLE
+        record = result[1]
+        return decode_document(record) if record is not None else None
+
+    def get(self, index, version):
+        """Return document ``index`` of snapshot ``version``, or ``UNAVAILABLE``."""
+        result = self._read(lambda mapping, count, length, groups_length:
+                            _record(mapping, index, count) if index < count else None)
+        if result is UNAVAILABLE or result[0] != version or result[1] is None:
+            return UNAVAILABLE
+        return decode_document(result[1])
+
+    def groups(self):
+        """Return ``(version, {group: [first, end]})``, or ``UNAVAILABLE``.
+
+        Decoded once per version and process.
+        """
+        cached = self._groups
+        if cached is not None and self._map is not None and \
+                UINT64.unpack_from(self._map, 16)[0] == cached[0]:
+            return cached
+        result = self._read(lambda mapping, count, length, groups_length:
+                            mapping[HEADER_SIZE + length - groups_length:HEADER_SIZE + length])
+        if result is UNAVAILABLE:
+            return UNAVAILABLE
+        self._groups = (result[0], json.loads(result[1]) if result[1] else {})
+        return self._groups
+
+    def mark_dirty(self):
+        """Ask the leader to rebuild; callable from any worker."""
+        try:
+            self._open()
+            UINT64.pack_into(self._map, DIRTY, time.time_ns())
+        except OSError as e:
+            logger.warning(f'Could not mark the snapshot {self.path} dirty: {e}')
+
+    def build(self):
+        """Serialize ``load()`` into the file; only the leader calls this."""
+        dirty = UINT64.unpack_from(self._map, DIRTY)[0]
+        documents = self.load()
+        groups = b''
+        if self.group_by:
+            documents, ranges = group_documents(documents, self.group_by)
+            groups = json.dumps(ranges, separators=(',', ':')).encode()
+        records = [encode_document(document).encode() for document in documents]
+        offsets = [0]
+        for record in records:
+            offsets.append(offsets[-1] + len(record))
+        body = struct.pack(f'<{len(offsets)}Q', *offsets) + b''.join(records) + groups
+
+        mapping = self._mapping(HEADER_SIZE + len(body))
+        _, seq, version, _, _, _, _, _, _ = HEADER.unpack_from(mapping, 0)
+        seq += seq & 1  # a previous leader died while writing
+        UINT64.pack_into(mapping, SEQ, seq + 1)
+        mapping[HEADER_SIZE:HEADER_SIZE + len(body)] = body
+        # Leaves dirty alone: other workers may be marking it right now
+        struct.pack_into('<8s', mapping, 0, MAGIC)
+        struct.pack_into('<QQQ', mapping, 16, version + 1, len(records), len(body))
+        struct.pack_into('<QdQ', mapping, 48, dirty, time.time(), len(groups))
+        UINT64.pack_into(mapping, SEQ, seq + 2)
+        return len(records)
+
+    def _stale(self):
+        magic, _, version, _, _, dirty, clean, built_at, _ = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or not version or dirty != clean:
+            return True
+        return time.time() - built_at >= self.interval
+
+    def _try_lock(self):
+        if self._lock_fd is None:
+            self._lock_fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _run(self):
+        pid = os.getpid()
+        retry_at = 0.0
+        while True:
+            try:
+                if not self.leader:
+                    self.leader = self._try_lock()
+                    if self.leader:
+                        logger.info(f'Worker {pid} builds the snapshot {self.path}')
+                if self.leader and time.monotonic() >= retry_at and self._stale():
+                    started = time.perf_counter()
+                    count = self.build()
+                    logger.debug(f'Built the snapshot of {count} documents in '
+                                 f'{(time.perf_counter() - started) * 1000:.1f}ms')
+            except Exception as e:
+                logger.warning(f'Could not build the snapshot {self.path}: {e}')
+                retry_at = time.monotonic() + RETRY_SECONDS
+            time.sleep(self.poll)
+
+    def describe(self):
+        """Return the header fields and whether this worker is the leader."""
+        if self._map is None:
+            return {'path': self.path, 'version': 0}
+        _, _, version, count, length, _, _, built_at, _ = HEADER.unpack_from(self._map, 0)
+        return {
+            'path': self.path,
+            'version': version,
+            'documents': count,
+            'bytes': HEADER_SIZE + length,
+            'built_at': built_at,
+            'leader': self.leader
+        }
+
+
+def snapshot_status():
+    """Return the state of the affirmations snapshot, or None if disabled."""
+    snapshot = current_app.extensions.get('affirmations_snapshot')
+    return snapshot.describe() if snapshot is not None else None
+
+
+def _on_write(collection_name, **kwargs):
+    if has_app_context() and 'affirmations_snapshot' in current_app.extensions:
+        current_app.extensions['affirmations_snapshot'].mark_dirty()
+
+
+def init_app(app):
+    """Share a snapshot of the affirmations between workers, if enabled."""
+    if not app.config['AFFIRMATIONS_SNAPSHOT_ENABLED']:
+        return
+    if fcntl is None:
+        app.logger.warning('The affirmations snapshot needs flock(); reading from the database')
+        return
+
+    def load():
+        with app.app_context():
+            return database.find_documents('affirmations', coalesce=False)
+
+    # Nothing is opened here, so a preloading gunicorn master holds no flock
+    app.extensions['affirmations_snapshot'] = SharedSnapshot(
+        app.config['AFFIRMATIONS_SNAPSHOT_PATH'], load,
+        interval=app.config['AFFIRMATIONS_SNAPSHOT_INTERVAL_SECONDS'],
+        poll=app.config['AFFIRMATIONS_SNAPSHOT_POLL_SECONDS'],
+        group_by='category'
+    )
+    for signal in (database.document_inserted, database.document_updated, database.document_deleted):
+        signal.connect(_on_write, sender='affirmations')
@@ -50,15 +50,21 @@ document.addEventListener('DOMContentLoaded', function() {
 
         try {
             // Send POST request to add contact
-            const response = await fetch('/contacts/api/add', {
+            const addContact = (query) => fetch('/contacts/api/add' + query, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
                 body: JSON.stringify(contactData)
             });
+            let response = await addContact('');
+            let result = await response.json();
 
-            const result = await response.json();
+            // Possible duplicate of an existing contact: add only if confirmed
+            if (response.status === 409 && confirm(`${result.message}. Add it anyway?`)) {
+                response = await addContact('?allow_duplicate=true');
+                result = await response.json();
+            }
 
             if (response.ok) {
                 showMessage('Contact added successfully!', 'success');
@@ -74,14 +80,33 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
-    // Load contacts from the server
+    // Contacts keyed by id, kept current with delta syncs
+    const contactsById = new Map();
+    let syncToken = null;
+
+    // Load contacts changed since the last sync from the server
     async function loadContacts() {
         try {
-            const response = await fetch('/contacts/api/list');
+            const url = syncToken
+                ? `/api/v1/contacts/changes?since=${encodeURIComponent(syncToken)}`
+                : '/api/v1/contacts/changes';
+            const response = await fetch(url);
             const result = await response.json();
 
+            if (response.status === 410) {
+                // Sync token expired, start over with a full sync
+                syncToken = null;
+                return loadContacts();
+            }
+
             if (response.ok) {
-                displayContacts(result.contacts);
+                if (result.full_sync) {
+                    contactsById.clear();
+                }
+                result.contacts.forEach(contact => contactsById.set(contact._id, contact));
+                result.deleted.forEach(contactId => contactsById.delete(contactId));
+                syncToken = result.next_token;
+                displayContacts(Array.from(contactsById.values()));
             } else {
                 showMessage('Error loading contacts', 'error');
             }
@@ -0,0 +1,150 @@
+"""Dashboard statistics kept as counters (``/api/v1/stats``).
+
+``contacts_by_company``
+    contacts per ``company`` (``''`` for none);
+``signups_by_day``
+    contacts per UTC day of ``created_at``, as ``YYYY-MM-DD``;
+``affirmations_by_category``
+    affirmations per ``category``.
+
+Each count is a document of the ``stats`` collection:
+``{'_id': '<metric>:<key>', 'metric', 'key', 'count'}``. The write helpers of
+database.py keep them current. An insert adds 1 to the counters of the new
+document. A delete subtracts 1 from those of the old one, whose fields are
+read just before (``database.track_previous``). An update that changes a
+counted field moves 1 from the old counter to the new one. Every change is
+an atomic increment (``$inc`` on MongoDB), so writes from all workers add
+up. Reading the stats reads the counters, one per company, day and category,
+and never the contacts.
+
+Writes that bypass database.py (imports, the mongo shell) leave the
+counters off. So does a write racing between the read of a document's old
+fields and its update. ``python stats.py reconcile`` recounts with one
+grouped count per metric, run by the database (an aggregation pipeline on
+MongoDB). It then corrects each counter by the difference; run it nightly.
+"""
+import sys
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app, has_app_context
+
+import database
+from database import find_documents, get_backend
+
+STATS = 'stats'
+
+# metric: (collection, field, grouped by day)
+METRICS = {
+    'contacts_by_company': ('contacts', 'company', False),
+    'signups_by_day': ('contacts', 'created_at', True),
+    'affirmations_by_category': ('affirmations', 'category', False)
+}
+
+
+def _key(value, day):
+    if day:
+        return value.strftime('%Y-%m-%d') if isinstance(value, datetime) else ''
+    return '' if value is None else str(value)
+
+
+def _counters(collection_name, document):
+    """Return the ``(metric, key)`` counters ``document`` counts in."""
+    return {
+        (metric, _key(document.get(field), day))
+        for metric, (collection, field, day) in METRICS.items()
+        if collection == collection_name
+    }
+
+
+def _increment(counters, amount):
+    backend = get_backend()
+    for metric, key in counters:
+        try:
+            backend.increment(STATS, f'{metric}:{key}', 'count', amount, {'metric': metric, 'key': key})
+        except Exception as e:
+            # The write itself succeeded; reconciliation fixes the counter
+            current_app.logger.warning(f'Could not update the {metric} counter of {key!r}: {e}')
+
+
+def _enabled():
+    return has_app_context() and current_app.config['STATS_ENABLED']
+
+
+def _on_insert(collection_name, document=None, **kwargs):
+    if _enabled():
+        _increment(_counters(collection_name, document), 1)
+
+
+def _on_update(collection_name, changes=None, previous=None, **kwargs):
+    # No previous: the update changed no counted field
+    if _enabled() and previous is not None:
+        old = _counters(collection_name, previous)
+        new = _counters(collection_name, dict(previous, **changes))
+        _increment(old - new, -1)
+        _increment(new - old, 1)
+
+
+def _on_delete(collection_name, previous=None, **kwargs):
+    if _enabled() and previous is not None:
+        _increment(_counters(collection_name, previous), -1)
+
+
+def get_stats(metric=None):
+    """Return ``{metric: {key: count}}``, for one metric or all of them."""
+    query = {'metric': metric} if metric else {}
+    stats = {name: {} for name in ([metric] if metric else METRICS)}
+    for counter in find_documents(STATS, query, read='secondary'):
+        if counter.get('count') and counter.get('metric') in stats:
+            stats[counter['metric']][counter['key']] = counter['count']
+    return stats
+
+
+def reconcile():
+    """Recount every metric in the database and correct the counters.
+
+    Returns the number of counters that were off. Counters down to zero
+    are removed.
+    """
+    backend = get_backend()
+    counts = Counter()
+    for metric, (collection, field, day) in METRICS.items():
+        for value, count in backend.count_by(collection, field, day=day).items():
+            counts[metric, '' if value is None else str(value)] += count
+    stored = {counter['_id']: counter for counter in backend.find(STATS, {})}
+
+    corrected = 0
+    for (metric, key), count in counts.items():
+        counter = stored.pop(f'{metric}:{key}', {})
+        difference = count - counter.get('count', 0)
+        if difference:
+            backend.increment(STATS, f'{metric}:{key}', 'count', difference, {'metric': metric, 'key': key})
+            corrected += 1
+    # Counters of companies, days or categories that no longer have documents
+    for stat_id, counter in stored.items():
+        backend.delete(STATS, {'_id': stat_id})
+        if counter.get('count'):
+            corrected += 1
+    return corrected
+
+
+def init_app(app):
+    """Keep the statistics counters current on writes, if enabled."""
+    if not app.config['STATS_ENABLED']:
+        return
+    for collection, field, _ in METRICS.values():
+        database.track_previous(collection, [field])
+        database.document_inserted.connect(_on_insert, sender=collection)
+        database.document_updated.connect(_on_update, sender=collection)
+        database.document_deleted.connect(_on_delete, sender=collection)
+
+
+if __name__ == '__main__':
+    # Nightly maintenance: python stats.py reconcile [config]
+    from __init__ import create_app
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'reconcile':
+        sys.exit('usage: python stats.py reconcile [config]')
+    app = create_app(sys.argv[2] if len(sys.argv) > 2 else 'production')
+    with app.app_context():
+        print(f'Corrected {reconcile()} statistics counters')
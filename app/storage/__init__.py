@@ -0,0 +1,49 @@
+"""Document storage backends behind the helpers in database.py.
+
+``DATABASE_BACKEND`` selects the backend:
+
+``mongodb`` (default)
+    MongoDB at ``MONGODB_URI``.
+``sqlite``
+    An embedded SQLite database at ``SQLALCHEMY_DATABASE_URI``, for small
+    single-node deployments.
+``memory``
+    Dicts in the current process; the backend of ``TestingConfig``, so tests
+    and benchmarks need no services.
+
+Change streams and ``get_db()`` are MongoDB-only.
+"""
+from .base import StorageBackend
+
+
+def _mongo():
+    from .mongo import MongoBackend
+    return MongoBackend
+
+
+def _sqlite():
+    from .sqlite import SQLiteBackend
+    return SQLiteBackend
+
+
+def _memory():
+    from .memory import MemoryBackend
+    return MemoryBackend
+
+
+BACKENDS = {
+    'mongodb': _mongo,
+    'sqlite': _sqlite,
+    'memory': _memory
+}
+
+
+def create_backend(app):
+    """Create the storage backend configured for ``app``."""
+    name = app.config['DATABASE_BACKEND']
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown DATABASE_BACKEND: {name}')
+    return BACKENDS[name]()(app)
+
+
+__all__ = ['BACKENDS', 'StorageBackend', 'create_backend']
@@ -0,0 +1,128 @@
+"""Interface shared by the document storage backends."""
+import re
+
+
+def project(document, projection):
+    """Apply a MongoDB inclusion or exclusion projection on top-level fields."""
+    if not projection:
+        return document
+    included = {name for name, value in projection.items() if value and name != '_id'}
+    if included:
+        if projection.get('_id', 1):
+            included.add('_id')
+        return {name: value for name, value in document.items() if name in included}
+    excluded = {name for name, value in projection.items() if not value}
+    return {name: value for name, value in document.items() if name not in excluded}
+
+
+def text_indexes(indexes):
+    """Return ``{collection: {field: weight}}`` for the text indexes among ``indexes``."""
+    found = {}
+    for index in indexes:
+        fields = [name for name, kind in index['keys'] if kind == 'text']
+        if fields:
+            weights = index.get('options', {}).get('weights', {})
+            found[index['collection']] = {field: weights.get(field, 1) for field in fields}
+    return found
+
+
+def text_terms(text):
+    """Split a search string into lowercase words."""
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def text_score(document, terms, weights):
+    """Score ``document`` for ``terms``: occurrences per field, times the field's weight."""
+    score = 0
+    for field, weight in weights.items():
+        value = document.get(field)
+        if not isinstance(value, str):
+            continue
+        lowered = value.lower()
+        # Splitting into words is only worth it if a term occurs at all
+        if any(term in lowered for term in terms):
+            words = text_terms(lowered)
+            score += weight * sum(words.count(term) for term in terms)
+    return score
+
+
+class StorageBackend:
+    """A store of schemaless documents grouped in named collections.
+
+    Documents are dicts whose ``_id`` is an ObjectId assigned on insert.
+    Queries use the MongoDB filter syntax; backends other than MongoDB
+    support equality and the ``$gt``, ``$gte``, ``$lt``, ``$lte``, ``$ne``
+    and ``$in`` operators on top-level fields. Updates replace top-level
+    fields, like ``$set``.
+    """
+
+    #: Name used in ``DATABASE_BACKEND``
+    name = None
+    #: Human-readable name for log and health messages
+    label = None
+    #: True if ``secondary`` reads may lag behind writes
+    replicated = False
+
+    def __init__(self, app):
+        self.app = app
+
+    def startup(self, logger):
+        """Check the store and create its indexes; called once by ``init_app``.
+
+        Must not raise: an unavailable store is logged, not fatal.
+        """
+        raise NotImplementedError
+
+    def ping(self):
+        """Raise if the store cannot be reached."""
+        raise NotImplementedError
+
+    def insert(self, collection_name, document):
+        """Insert ``document``, setting its ``_id``; return the id."""
+        raise NotImplementedError
+
+    def find(self, collection_name, query, limit=None, sort=None, secondary=False, projection=None):
+        """Return the list of documents matching ``query``.
+
+        ``sort`` is a list of ``(field, direction)`` pairs, direction being
+        ``1`` or ``-1``. ``secondary`` allows reading from a replica.
+        ``projection`` is a MongoDB projection dict on top-level fields.
+        """
+        raise NotImplementedError
+
+    def search(self, collection_name, text, skip=0, limit=None, secondary=False, projection=None):
+        """Return the documents matching any word of ``text``, best first.
+
+        Uses the collection's text index (see ``text_indexes``), and fails
+        without one. Each document gets its relevance as ``score``; scores
+        are comparable within a backend only.
+        """
+        raise NotImplementedError
+
+    def count(self, collection_name, query, secondary=False):
+        """Return the number of documents matching ``query``."""
+        raise NotImplementedError
+
+    def count_by(self, collection_name, field, day=False, secondary=False):
+        """Return ``{value: number of documents}`` per value of ``field``, grouped in the store.
+
+        With ``day``, ``field`` holds datetimes, grouped by UTC day as
+        ``YYYY-MM-DD``. Documents without the field count under None.
+        """
+        raise NotImplementedError
+
+    def increment(self, collection_name, document_id, field, amount, defaults=None):
+        """Add ``amount`` to ``field`` of the document ``document_id``, atomically.
+
+        Like ``$inc`` with ``upsert``: a missing document is created with
+        ``defaults`` and ``field`` set to ``amount``.
+        """
+        raise NotImplementedError
+
+    def update(self, collection_name, query, changes):
+        """Set ``changes`` on the first matching document; return 1 if it changed."""
+        raise NotImplementedError
+
+    def delete(self, collection_name, query):
+        """Delete the first matching document; return the number deleted."""
+        raise NotImplementedError
@@ -0,0 +1,42 @@
+"""Documents as JSON text in MongoDB Extended JSON.
+
+ObjectIds and datetimes are written as ``{"$oid": "..."}`` and
+``{"$date": "..."}`` so they round-trip with their types. Used by the
+SQLite backend and the shared affirmation snapshot (``snapshot.py``).
+"""
+import json
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return {'$date': format_datetime(value)}
+    if isinstance(value, ObjectId):
+        return {'$oid': str(value)}
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def _object_hook(value):
+    if len(value) == 1:
+        if '$oid' in value:
+            return ObjectId(value['$oid'])
+        if '$date' in value:
+            return datetime.fromisoformat(value['$date'])
+    return value
+
+
+def format_datetime(value):
+    """Return naive UTC with a fixed width, so that text order is time order."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec='microseconds')
+
+
+def encode_document(document):
+    return json.dumps(document, default=_default, separators=(',', ':'))
+
+
+def decode_document(text):
+    return json.loads(text, object_hook=_object_hook)
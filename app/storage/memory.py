@@ -0,0 +1,191 @@
+"""In-memory storage backend.
+
+Documents live in per-collection dicts in the current process, so nothing
+survives a restart and every gunicorn worker has its own data. It needs no
+server and answers in microseconds, which makes it the backend of
+``TestingConfig`` and of the benchmarks.
+
+Stored and returned documents are copies, as with a real database: callers
+may modify what ``find`` returns without changing the store.
+"""
+import copy
+import itertools
+import operator
+import threading
+from collections import Counter
+from datetime import datetime
+
+from bson import ObjectId
+
+from .base import StorageBackend, project, text_indexes, text_score, text_terms
+
+COMPARISONS = {
+    '$gt': operator.gt,
+    '$gte': operator.ge,
+    '$lt': operator.lt,
+    '$lte': operator.le
+}
+
+_MISSING = object()
+
+
+def _copy(document):
+    # Field values are mostly immutable (str, datetime, ObjectId), so only
+    # containers need a deep copy
+    return {
+        key: copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+        for key, value in document.items()
+    }
+
+
+def _matches_condition(value, condition):
+    if isinstance(condition, dict) and condition and all(key.startswith('$') for key in condition):
+        for name, expected in condition.items():
+            if name == '$ne':
+                if value == expected:
+                    return False
+            elif name == '$in':
+                if value not in expected:
+                    return False
+            elif name in COMPARISONS:
+                # Like MongoDB, values of different types never match
+                if value is None or value is _MISSING:
+                    return False
+                try:
+                    if not COMPARISONS[name](value, expected):
+                        return False
+                except TypeError:
+                    return False
+            else:
+                raise ValueError(f'Unsupported query operator: {name}')
+        return True
+    if condition is None:
+        return value is None or value is _MISSING
+    return value == condition
+
+
+def matches(document, query):
+    """Return True if ``document`` matches the MongoDB filter ``query``."""
+    for name, condition in query.items():
+        if not _matches_condition(document.get(name, _MISSING), condition):
+            return False
+    return True
+
+
+def _sort_key(field):
+    def key(document):
+        value = document.get(field)
+        # Missing and null values sort first, as in MongoDB
+        return (value is not None, value)
+    return key
+
+
+class MemoryBackend(StorageBackend):
+    """Documents stored in dicts in the current process."""
+
+    name = 'memory'
+    label = 'In-memory storage'
+
+    def __init__(self, app):
+        super().__init__(app)
+        self._collections = {}
+        self._lock = threading.RLock()
+        self._text = text_indexes(app.config['MONGODB_INDEXES'])
+
+    def startup(self, logger):
+        logger.info('Using in-memory storage; data is lost on restart')
+
+    def ping(self):
+        pass
+
+    def _collection(self, collection_name):
+        return self._collections.setdefault(collection_name, {})
+
+    def _first(self, collection, query):
+        # Fast path for the common lookup by _id
+        if set(query) == {'_id'} and not isinstance(query['_id'], dict):
+            return collection.get(query['_id'])
+        return next((document for document in collection.values() if matches(document, query)), None)
+
+    def insert(self, collection_name, document):
+        if '_id' not in document:
+            document['_id'] = ObjectId()
+        with self._lock:
+            collection = self._collection(collection_name)
+            if document['_id'] in collection:
+                raise ValueError(f"Duplicate _id {document['_id']} in {collection_name}")
+            collection[document['_id']] = _copy(document)
+        return document['_id']
+
+    def find(self, collection_name, query, limit=None, sort=None, secondary=False, projection=None):
+        with self._lock:
+            documents = (
+                document for document in self._collection(collection_name).values()
+                if matches(document, query)
+            )
+            if sort:
+                documents = list(documents)
+                # Stable sorts, least significant key first
+                for field, direction in reversed(sort):
+                    documents.sort(key=_sort_key(field), reverse=direction == -1)
+            if limit:
+                # Without a sort, scanning stops at the limit
+                documents = itertools.islice(documents, limit)
+            return [_copy(project(document, projection)) for document in documents]
+
+    def search(self, collection_name, text, skip=0, limit=None, secondary=False, projection=None):
+        # Scores every document; no stemming, unlike MongoDB and SQLite
+        if collection_name not in self._text:
+            raise ValueError(f'No text index on {collection_name}')
+        weights = self._text[collection_name]
+        terms = text_terms(text)
+        with self._lock:
+            scored = [(text_score(document, terms, weights), document)
+                      for document in self._collection(collection_name).values()]
+            scored = sorted((item for item in scored if item[0]), key=lambda item: item[0], reverse=True)
+            end = skip + limit if limit else None
+            return [dict(_copy(project(document, projection)), score=score) for score, document in scored[skip:end]]
+
+    def count(self, collection_name, query, secondary=False):
+        with self._lock:
+            return sum(1 for document in self._collection(collection_name).values() if matches(document, query))
+
+    def count_by(self, collection_name, field, day=False, secondary=False):
+        with self._lock:
+            values = [document.get(field) for document in self._collection(collection_name).values()]
+        if day:
+            values = [value.strftime('%Y-%m-%d') if isinstance(value, datetime) else None for value in values]
+        return dict(Counter(values))
+
+    def increment(self, collection_name, document_id, field, amount, defaults=None):
+        with self._lock:
+            collection = self._collection(collection_name)
+            document = collection.get(document_id)
+            if document is None:
+                collection[document_id] = dict(_copy(defaults or {}), _id=document_id, **{field: amount})
+            else:
+                document[field] = document.get(field, 0) + amount
+
+    def update(self, collection_name, query, changes):
+        with self._lock:
+            document = self._first(self._collection(collection_name), query)
+            if document is None:
+                return 0
+            if all(document.get(key, _MISSING) == value for key, value in changes.items()):
+                return 0
+            document.update(_copy(changes))
+            return 1
+
+    def delete(self, collection_name, query):
+        with self._lock:
+            collection = self._collection(collection_name)
+            document = self._first(collection, query)
+            if document is None:
+                return 0
+            del collection[document['_id']]
+            return 1
+
+    def clear(self):
+        """Remove every collection, e.g. between tests."""
+        with self._lock:
+            self._collections.clear()
@@ -0,0 +1,116 @@
+"""MongoDB storage backend."""
+from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure
+from pymongo.read_preferences import Nearest, PrimaryPreferred, Secondary, SecondaryPreferred
+
+import database
+import lifecycle
+from .base import StorageBackend
+
+# MONGODB_SECONDARY_READ_MODE values; 'primary' turns secondary reads off
+READ_MODES = {
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest
+}
+
+
+class MongoBackend(StorageBackend):
+    """Documents stored in MongoDB through the pooled client in database.py."""
+
+    name = 'mongodb'
+    label = 'MongoDB'
+
+    def __init__(self, app):
+        super().__init__(app)
+        mode = app.config['MONGODB_SECONDARY_READ_MODE']
+        if mode == 'primary':
+            self.secondary_read_preference = None
+        elif mode in READ_MODES:
+            self.secondary_read_preference = READ_MODES[mode](
+                max_staleness=app.config['MONGODB_MAX_STALENESS_SECONDS']
+            )
+        else:
+            raise ValueError(f'Unknown MONGODB_SECONDARY_READ_MODE: {mode}')
+        # Until startup() has asked the server, assume the read mode was
+        # configured for a replica set
+        self.replicated = self.secondary_read_preference is not None
+
+    def _collection(self, collection_name, secondary=False):
+        collection = database.get_db()[collection_name]
+        if secondary and self.secondary_read_preference is not None:
+            collection = collection.with_options(read_preference=self.secondary_read_preference)
+        return collection
+
+    def startup(self, logger):
+        config = self.app.config
+        client = None
+        try:
+            client = MongoClient(config['MONGODB_URI'], serverSelectionTimeoutMS=5000)
+            # The ismaster command is cheap and does not require auth.
+            reply = client.admin.command('ismaster')
+            logger.info(f"Successfully connected to MongoDB at {config['MONGODB_URI']}")
+            # A standalone server has no secondaries to lag behind, so
+            # primary pinning after writes is only needed with a replica
+            # set (setName) or a sharded cluster (mongos answers "isdbgrid")
+            if self.replicated and not (reply.get('setName') or reply.get('msg') == 'isdbgrid'):
+                self.replicated = False
+                logger.info('MongoDB is a standalone server; reads after writes are not pinned to the primary')
+            db = client[config['MONGODB_DATABASE']]
+            ephemeral = config['EPHEMERAL_COLLECTIONS']
+            lifecycle.apply_mongo(db, ephemeral, logger)
+            database.ensure_indexes(db, config['MONGODB_INDEXES'] + lifecycle.ttl_indexes(ephemeral), logger)
+        except ConnectionFailure as e:
+            logger.warning(f"MongoDB connection failed: {e}")
+            logger.warning("Application will start without MongoDB. Some features may be unavailable.")
+        except Exception as e:
+            logger.error(f"Unexpected error connecting to MongoDB: {e}")
+        finally:
+            # The probe client must not outlive startup: with gunicorn's
+            # preload_app it would otherwise be inherited by every worker.
+            if client is not None:
+                client.close()
+
+    def ping(self):
+        database.get_db().list_collection_names()
+
+    def insert(self, collection_name, document):
+        return database.get_db()[collection_name].insert_one(document).inserted_id
+
+    def find(self, collection_name, query, limit=None, sort=None, secondary=False, projection=None):
+        cursor = self._collection(collection_name, secondary).find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)
+
+    def search(self, collection_name, text, skip=0, limit=None, secondary=False, projection=None):
+        score = {'$meta': 'textScore'}
+        cursor = self._collection(collection_name, secondary).find(
+            {'$text': {'$search': text}}, dict(projection or {}, score=score)
+        ).sort([('score', score)]).skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)
+
+    def count(self, collection_name, query, secondary=False):
+        return self._collection(collection_name, secondary).count_documents(query)
+
+    def count_by(self, collection_name, field, day=False, secondary=False):
+        key = {'$dateToString': {'format': '%Y-%m-%d', 'date': f'${field}'}} if day else f'${field}'
+        groups = self._collection(collection_name, secondary).aggregate([{'$group': {'_id': key, 'count': {'$sum': 1}}}])
+        return {group['_id']: group['count'] for group in groups}
+
+    def increment(self, collection_name, document_id, field, amount, defaults=None):
+        update = {'$inc': {field: amount}}
+        if defaults:
+            update['$setOnInsert'] = defaults
+        database.get_db()[collection_name].update_one({'_id': document_id}, update, upsert=True)
+
+    def update(self, collection_name, query, changes):
+        return database.get_db()[collection_name].update_one(query, {'$set': changes}).modified_count
+
+    def delete(self, collection_name, query):
+        return database.get_db()[collection_name].delete_one(query).deleted_count
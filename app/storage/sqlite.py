@@ -0,0 +1,368 @@
+"""Embedded SQLite storage backend.
+
+Each collection is a table of ``(id, doc)`` rows. ``doc`` holds the whole
+document as JSON text, with ObjectIds and datetimes in MongoDB Extended JSON
+(``{"$oid": "..."}``, ``{"$date": "..."}``) so they round-trip with their
+types. Queries are compiled to parameterized SQL over SQLite's JSON
+functions; the sqlite3 module keeps the compiled statements in a
+per-connection cache, so repeated queries are not re-parsed.
+
+The database runs in WAL mode, so readers never block the writer and several
+gunicorn workers can share one file. ``MONGODB_INDEXES`` become expression
+indexes; ``expireAfterSeconds`` options are honored by deleting expired rows
+when the collection is written, at most once a minute.
+
+A text index becomes a contentless FTS5 table, ``<collection>_text``, kept
+current by triggers on the collection's table and keyed by its rowids. It
+stems English words and ranks matches by BM25 with the index's field
+weights. It is rebuilt when its fields change; after a ``VACUUM``, which may
+renumber rowids, drop it to have it rebuilt at the next start.
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+import lifecycle
+from .base import StorageBackend, project, text_terms
+from .extjson import decode_document, encode_document, format_datetime
+
+OPERATORS = {'$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<=', '$ne': '!='}
+
+# Minimum seconds between two expiry passes on a collection
+EXPIRE_INTERVAL = 60
+
+
+def _scalar(value):
+    """Convert a query value to what the field expression yields in SQL."""
+    if isinstance(value, datetime):
+        return format_datetime(value)
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+def _table(collection_name):
+    if not collection_name.replace('_', '').isalnum():
+        raise ValueError(f'Invalid collection name: {collection_name}')
+    return f'"{collection_name}"'
+
+
+def _field(name):
+    """SQL expression for a top-level field, unwrapping $oid/$date values."""
+    if name == '_id':
+        return 'id'
+    if not name.replace('_', '').isalnum():
+        raise ValueError(f'Unsupported field: {name}')
+    path = f'$."{name}"'
+    return (
+        f"coalesce(json_extract(doc, '{path}.\"$date\"'), "
+        f"json_extract(doc, '{path}.\"$oid\"'), json_extract(doc, '{path}'))"
+    )
+
+
+def compile_query(query):
+    """Compile a MongoDB filter to a SQL ``WHERE`` clause and parameters."""
+    clauses = []
+    params = []
+    for name, condition in (query or {}).items():
+        expression = _field(name)
+        if isinstance(condition, dict) and condition and all(key.startswith('$') for key in condition):
+            for operator, value in condition.items():
+                if operator == '$in':
+                    values = [_scalar(item) for item in value]
+                    if not values:
+                        clauses.append('0')
+                        continue
+                    clauses.append(f"{expression} IN ({', '.join('?' * len(values))})")
+                    params.extend(values)
+                elif operator in OPERATORS:
+                    clauses.append(f'{expression} {OPERATORS[operator]} ?')
+                    params.append(_scalar(value))
+                else:
+                    raise ValueError(f'Unsupported query operator: {operator}')
+        elif condition is None:
+            clauses.append(f'{expression} IS NULL')
+        else:
+            clauses.append(f'{expression} = ?')
+            params.append(_scalar(condition))
+    return ' AND '.join(clauses) or '1', params
+
+
+class SQLiteBackend(StorageBackend):
+    """Documents stored as JSON in a local SQLite database."""
+
+    name = 'sqlite'
+    label = 'SQLite'
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.path = self._path(app.config['SQLALCHEMY_DATABASE_URI'])
+        self.memory = self.path == ':memory:'
+        if self.memory:
+            # A named shared-cache database, so every thread sees the same data
+            self.path = f'file:storage-{id(self)}?mode=memory&cache=shared'
+            self._keeper = self._connect()
+        self._local = threading.local()
+        self._tables = set()
+        self._tables_lock = threading.Lock()
+        self._ttl = {}
+        self._expired_at = {}
+        self._text = {}
+
+    @staticmethod
+    def _path(uri):
+        prefix = 'sqlite:///'
+        if not uri.startswith(prefix):
+            raise ValueError(f'SQLite backend needs a sqlite:/// URI, got {uri}')
+        return uri[len(prefix):] or ':memory:'
+
+    def _connect(self):
+        connection = sqlite3.connect(
+            self.path,
+            uri=self.path.startswith('file:'),
+            timeout=5.0,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=256
+        )
+        if not self.memory:
+            connection.execute('PRAGMA journal_mode=WAL')
+            # Durable at checkpoints; a crash can lose only the last commits
+            connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    @property
+    def connection(self):
+        """This thread's connection; connections are not shared across fork()."""
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            self._local.connection = self._connect()
+            self._local.pid = pid
+        return self._local.connection
+
+    def _ensure_table(self, collection_name):
+        if collection_name in self._tables:
+            return
+        with self._tables_lock:
+            self.connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {_table(collection_name)} (id TEXT PRIMARY KEY, doc TEXT NOT NULL)'
+            )
+            self._tables.add(collection_name)
+
+    def startup(self, logger):
+        try:
+            if not self.memory:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            config = self.app.config
+            self.ensure_indexes(
+                config['MONGODB_INDEXES'] + lifecycle.ttl_indexes(config['EPHEMERAL_COLLECTIONS']), logger
+            )
+            logger.info(f'Using SQLite storage at {self.path}')
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f'SQLite storage unavailable at {self.path}: {e}')
+        finally:
+            # With gunicorn's preload_app the startup connection would
+            # otherwise be inherited by every worker
+            connection = getattr(self._local, 'connection', None)
+            if connection is not None:
+                connection.close()
+            self._local = threading.local()
+
+    def ensure_indexes(self, indexes, logger):
+        """Create expression indexes for ``MONGODB_INDEXES`` entries."""
+        for index in indexes:
+            collection_name = index['collection']
+            fields = [name for name, _ in index['keys']]
+            options = index.get('options', {})
+            if 'expireAfterSeconds' in options:
+                self._ttl[collection_name] = (fields[0], options['expireAfterSeconds'])
+            if fields == ['_id']:
+                continue
+            try:
+                self._ensure_table(collection_name)
+                if any(kind == 'text' for _, kind in index['keys']):
+                    weights = options.get('weights', {})
+                    self._ensure_text_index(collection_name, {field: weights.get(field, 1) for field in fields})
+                    continue
+                name = f"ix_{collection_name}_{'_'.join(fields)}"
+                columns = ', '.join(_field(field) for field in fields)
+                self.connection.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{name}" ON {_table(collection_name)} ({columns})'
+                )
+            except (sqlite3.Error, ValueError) as e:
+                logger.warning(f"Could not create index {index['keys']} on {collection_name}: {e}")
+
+    def _ensure_text_index(self, collection_name, weights):
+        """Create the FTS5 table and triggers of a text index, filled from the rows."""
+        fields = list(weights)
+        for field in fields:
+            _field(field)  # rejects names that cannot be quoted
+        table = _table(collection_name)
+        fts = _table(f'{collection_name}_text')
+        columns = ', '.join(f'"{field}"' for field in fields)
+
+        def values(row):
+            return ', '.join(f"coalesce(json_extract({row}doc, '$.\"{field}\"'), '')" for field in fields)
+
+        connection = self.connection
+        # Under the write lock, so that workers starting together build it once
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            existing = [row[1] for row in connection.execute(f'PRAGMA table_info({fts})')]
+            if existing != fields:
+                for suffix in ('insert', 'update', 'delete'):
+                    connection.execute(f'DROP TRIGGER IF EXISTS "{collection_name}_text_{suffix}"')
+                connection.execute(f'DROP TABLE IF EXISTS {fts}')
+                connection.execute(
+                    f"CREATE VIRTUAL TABLE {fts} USING fts5({columns}, content='', "
+                    "tokenize='porter unicode61 remove_diacritics 2')"
+                )
+                insert = f'INSERT INTO {fts} (rowid, {columns}) VALUES (new.rowid, {values("new.")});'
+                delete = (f"INSERT INTO {fts} ({fts}, rowid, {columns}) "
+                          f"VALUES ('delete', old.rowid, {values('old.')});")
+                connection.execute(
+                    f'CREATE TRIGGER "{collection_name}_text_insert" AFTER INSERT ON {table} BEGIN {insert} END'
+                )
+                connection.execute(
+                    f'CREATE TRIGGER "{collection_name}_text_update" AFTER UPDATE ON {table} '
+                    f'BEGIN {delete} {insert} END'
+                )
+                connection.execute(
+                    f'CREATE TRIGGER "{collection_name}_text_delete" AFTER DELETE ON {table} BEGIN {delete} END'
+                )
+                connection.execute(f'INSERT INTO {fts} (rowid, {columns}) SELECT rowid, {values("")} FROM {table}')
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        self._text[collection_name] = weights
+
+    def ping(self):
+        self.connection.execute('SELECT 1').fetchone()
+
+    def insert(self, collection_name, document):
+        self._ensure_table(collection_name)
+        if '_id' not in document:
+            document['_id'] = ObjectId()
+        self.connection.execute(
+            f'INSERT INTO {_table(collection_name)} (id, doc) VALUES (?, ?)',
+            (str(document['_id']), encode_document(document))
+        )
+        self._expire(collection_name)
+        return document['_id']
+
+    def find(self, collection_name, query, limit=None, sort=None, secondary=False, projection=None):
+        self._ensure_table(collection_name)
+        where, params = compile_query(query)
+        sql = f'SELECT doc FROM {_table(collection_name)} WHERE {where}'
+        if sort:
+            order = ', '.join(
+                f"{_field(name)} {'DESC' if direction == -1 else 'ASC'}" for name, direction in sort
+            )
+            sql += f' ORDER BY {order}'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        return [project(decode_document(row[0]), projection) for row in self.connection.execute(sql, params)]
+
+    def search(self, collection_name, text, skip=0, limit=None, secondary=False, projection=None):
+        if collection_name not in self._text:
+            raise ValueError(f'No text index on {collection_name}')
+        terms = text_terms(text)
+        if not terms:
+            return []
+        fts = _table(f'{collection_name}_text')
+        weights = ', '.join(str(float(weight)) for weight in self._text[collection_name].values())
+        # Any of the words, as MongoDB's $text does; BM25 is negative, lower is better
+        sql = (
+            f'SELECT t.doc, -bm25({fts}, {weights}) AS score FROM {fts} '
+            f'JOIN {_table(collection_name)} AS t ON t.rowid = {fts}.rowid '
+            f'WHERE {fts} MATCH ? ORDER BY score DESC LIMIT ? OFFSET ?'
+        )
+        params = (' OR '.join(f'"{term}"' for term in terms), int(limit) if limit else -1, int(skip))
+        return [
+            dict(project(decode_document(doc), projection), score=score)
+            for doc, score in self.connection.execute(sql, params)
+        ]
+
+    def count(self, collection_name, query, secondary=False):
+        self._ensure_table(collection_name)
+        where, params = compile_query(query)
+        sql = f'SELECT COUNT(*) FROM {_table(collection_name)} WHERE {where}'
+        return self.connection.execute(sql, params).fetchone()[0]
+
+    def count_by(self, collection_name, field, day=False, secondary=False):
+        self._ensure_table(collection_name)
+        expression = _field(field)
+        if day:
+            # Dates are stored as fixed-width ISO text
+            expression = f'substr({expression}, 1, 10)'
+        sql = f'SELECT {expression}, COUNT(*) FROM {_table(collection_name)} GROUP BY 1'
+        return dict(self.connection.execute(sql).fetchall())
+
+    def increment(self, collection_name, document_id, field, amount, defaults=None):
+        self._ensure_table(collection_name)
+        _field(field)
+        path = f'$."{field}"'
+        document = dict(defaults or {}, _id=document_id)
+        document[field] = amount
+        # One statement, so concurrent increments from other workers add up
+        self.connection.execute(
+            f'INSERT INTO {_table(collection_name)} (id, doc) VALUES (?, ?) ON CONFLICT (id) DO UPDATE SET '
+            f"doc = json_set(doc, '{path}', coalesce(json_extract(doc, '{path}'), 0) + ?)",
+            (str(document_id), encode_document(document), amount)
+        )
+
+    def update(self, collection_name, query, changes):
+        self._ensure_table(collection_name)
+        where, params = compile_query(query)
+        table = _table(collection_name)
+        connection = self.connection
+        # Read-modify-write under the write lock, so concurrent updates of
+        # different fields do not overwrite each other
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(f'SELECT id, doc FROM {table} WHERE {where} LIMIT 1', params).fetchone()
+            if row is None:
+                connection.execute('COMMIT')
+                return 0
+            document = decode_document(row[1])
+            document.update(changes)
+            updated = encode_document(document)
+            if updated == row[1]:
+                connection.execute('COMMIT')
+                return 0
+            connection.execute(f'UPDATE {table} SET doc = ? WHERE id = ?', (updated, row[0]))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        self._expire(collection_name)
+        return 1
+
+    def delete(self, collection_name, query):
+        self._ensure_table(collection_name)
+        where, params = compile_query(query)
+        table = _table(collection_name)
+        cursor = self.connection.execute(
+            f'DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE {where} LIMIT 1)', params
+        )
+        return cursor.rowcount
+
+    def _expire(self, collection_name):
+        """Delete documents past their TTL, like a MongoDB TTL index."""
+        if collection_name not in self._ttl:
+            return
+        now = time.monotonic()
+        if now - self._expired_at.get(collection_name, 0) < EXPIRE_INTERVAL:
+            return
+        self._expired_at[collection_name] = now
+        field, seconds = self._ttl[collection_name]
+        cutoff = format_datetime(datetime.utcnow() - timedelta(seconds=seconds))
+        self.connection.execute(f'DELETE FROM {_table(collection_name)} WHERE {_field(field)} < ?', (cutoff,))
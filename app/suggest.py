@@ -0,0 +1,373 @@
+"""Prefix suggestions for contacts (``GET /api/v1/contacts/suggest?q=``).
+
+Each worker keeps an in-memory index of the words of ``first_name``,
+``last_name`` and ``company`` and of the whole ``email``, lowercased and
+without accents. Terms are kept sorted as ``term NUL slot`` strings, where
+a slot holds one contact. A query bisects to the first term at or after
+its longest word and walks forward while the terms still start with it,
+so the time depends on the number of suggestions returned, not on the
+number of contacts. Contacts must match every query word, so "ada lov"
+finds Ada Lovelace: the other words are looked for in a string of the
+contact's terms kept next to it.
+
+The sorted terms live in buckets of up to ``2 * BUCKET_SIZE`` strings
+(like the ``sortedcontainers`` package), so adding or removing a term moves
+at most a bucket instead of shifting millions of entries.
+
+The index is built on a background thread when the worker starts
+(``start_build``, from gunicorn's ``post_worker_init`` or run.py), or on
+the first query otherwise. Every worker holds its own copy, about 800 bytes
+per contact, so a collection of more than ``CONTACT_SUGGEST_MAX_CONTACTS``
+contacts is not indexed; the count is checked again every
+``RECHECK_SECONDS``. Without an index, ``prefix_query`` answers from
+the database instead: range queries on the indexed fields, which match the
+start of a field (not of every word) and take milliseconds, not
+microseconds. Once built, the index is kept current incrementally:
+
+- writes made by this worker update it through the ``document_*`` signals;
+- writes made by other workers are caught up through delta sync
+  (``sync.changes_since``), at most every ``CONTACT_SUGGEST_SYNC_SECONDS``.
+  When the sync token has expired the index is rebuilt in the background
+  and the old one keeps answering meanwhile.
+"""
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from itertools import islice
+
+from flask import current_app, has_app_context
+
+import database
+from sync import SyncTokenExpired, changes_since, encode_token
+
+FIELDS = ('first_name', 'last_name', 'email', 'company')
+
+BUCKET_SIZE = 1000
+
+# Entries a query may look at per suggestion before it gives up, e.g. when
+# "a" matches a million words but few contacts match the other words
+SCAN_FACTOR = 50
+
+# Seconds before a build that found too many contacts, or failed, is retried
+RECHECK_SECONDS = 60
+
+
+def normalize(text):
+    """Lowercase ``text`` and strip accents."""
+    text = unicodedata.normalize('NFKD', text or '').lower()
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def contact_terms(record):
+    """Return the set of index terms of a ``(id, first, last, email, company)`` record."""
+    _, first_name, last_name, email, company = record
+    terms = set(re.findall(r'\w+', normalize(f'{first_name} {last_name} {company}')))
+    email = ''.join(normalize(email).split())
+    if email:
+        terms.add(email)
+    return terms
+
+
+def _text(terms):
+    # " term term...": a query word is a prefix of a term if " word" occurs
+    return ' ' + ' '.join(terms)
+
+
+def _query_words(query):
+    """Split ``query`` into its longest word and the `` word`` probes of the others."""
+    words = normalize(query).split()
+    if not words:
+        return None, []
+    lead = max(words, key=len)
+    return lead, [f' {word}' for word in words if word != lead]
+
+
+class SortedStrings:
+    """A sorted list of strings split into buckets."""
+
+    def __init__(self, values=()):
+        values = sorted(values)
+        self._buckets = [values[i:i + BUCKET_SIZE] for i in range(0, len(values), BUCKET_SIZE)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets)
+
+    def add(self, value):
+        if not self._buckets:
+            self._buckets.append([value])
+            self._maxes.append(value)
+            return
+        index = min(bisect_left(self._maxes, value), len(self._maxes) - 1)
+        bucket = self._buckets[index]
+        insort(bucket, value)
+        self._maxes[index] = bucket[-1]
+        if len(bucket) > 2 * BUCKET_SIZE:
+            self._buckets[index:index + 1] = [bucket[:BUCKET_SIZE], bucket[BUCKET_SIZE:]]
+            self._maxes[index:index + 1] = [bucket[BUCKET_SIZE - 1], bucket[-1]]
+
+    def discard(self, value):
+        index = bisect_left(self._maxes, value)
+        if index == len(self._maxes):
+            return
+        bucket = self._buckets[index]
+        position = bisect_left(bucket, value)
+        if position < len(bucket) and bucket[position] == value:
+            del bucket[position]
+            if bucket:
+                self._maxes[index] = bucket[-1]
+            else:
+                del self._buckets[index]
+                del self._maxes[index]
+
+    def iter_from(self, start):
+        """Iterate over the values from the first one ``>= start``."""
+        index = bisect_left(self._maxes, start)
+        if index == len(self._maxes):
+            return
+        position = bisect_left(self._buckets[index], start)
+        yield from islice(self._buckets[index], position, None)
+        for bucket in self._buckets[index + 1:]:
+            yield from bucket
+
+
+class ContactIndex:
+    """Prefix index over the contacts of one worker."""
+
+    def __init__(self, sync_seconds=2.0, max_contacts=None):
+        self.sync_seconds = sync_seconds
+        self.max_contacts = max_contacts
+        self.ready = False
+        self.too_large = False
+        self._building = False
+        self._retry_at = 0.0
+        self._lock = threading.RLock()
+        self._terms = SortedStrings()
+        self._records = []
+        self._texts = []
+        self._slots = {}
+        self._free = []
+        self._token = None
+        self._synced = 0.0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _put(self, document):
+        contact_id = str(document['_id'])
+        slot = self._slots.get(contact_id)
+        if slot is not None:
+            old = self._records[slot]
+            document = {field: document.get(field, old[position + 1]) for position, field in enumerate(FIELDS)}
+            self._remove_terms(slot)
+        elif self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._records)
+            self._records.append(None)
+            self._texts.append('')
+        record = (contact_id,) + tuple(document.get(field) or '' for field in FIELDS)
+        terms = contact_terms(record)
+        self._records[slot] = record
+        self._texts[slot] = _text(terms)
+        self._slots[contact_id] = slot
+        for term in terms:
+            self._terms.add(f'{term}\0{slot}')
+
+    def _remove_terms(self, slot):
+        for term in self._texts[slot].split():
+            self._terms.discard(f'{term}\0{slot}')
+
+    def _delete(self, contact_id):
+        slot = self._slots.pop(str(contact_id), None)
+        if slot is not None:
+            self._remove_terms(slot)
+            self._records[slot] = None
+            self._texts[slot] = ''
+            self._free.append(slot)
+
+    def build(self):
+        """Load every contact; must run in an app context."""
+        # Taken as changes_since would, so that no write is missed
+        token = encode_token(datetime.utcnow() - timedelta(milliseconds=current_app.config['SYNC_SAFETY_WINDOW_MS']))
+        if self.max_contacts:
+            count = database.count_documents('contacts')
+            self.too_large = count > self.max_contacts
+            if self.too_large:
+                self._retry_at = time.monotonic() + RECHECK_SECONDS
+                current_app.logger.warning(
+                    f'Not indexing {count} contacts for suggestions (CONTACT_SUGGEST_MAX_CONTACTS is {self.max_contacts})'
+                )
+                return
+        documents = database.find_documents('contacts', projection=dict.fromkeys(FIELDS, 1), coalesce=False)
+        self.load(documents, token)
+
+    def start_build(self, app):
+        """Build the index on a background thread, unless a build is running or due later."""
+        with self._lock:
+            if self._building or time.monotonic() < self._retry_at:
+                return
+            self._building = True
+        threading.Thread(target=self._build_in_background, args=(app,), name='contact-suggest', daemon=True).start()
+
+    def _build_in_background(self, app):
+        started = time.perf_counter()
+        try:
+            with app.app_context():
+                self.build()
+            if self.ready:
+                app.logger.info(f'Indexed {len(self)} contacts for suggestions in {time.perf_counter() - started:.1f}s')
+        except Exception as e:
+            self._retry_at = time.monotonic() + RECHECK_SECONDS
+            app.logger.warning(f'Could not build the contact suggestion index: {e}')
+        finally:
+            self._building = False
+
+    def load(self, documents, token):
+        """Replace the index with ``documents``, current as of ``token``."""
+        records = []
+        texts = []
+        entries = []
+        for slot, document in enumerate(documents):
+            record = (str(document['_id']),) + tuple(document.get(field) or '' for field in FIELDS)
+            terms = contact_terms(record)
+            records.append(record)
+            texts.append(_text(terms))
+            entries.extend(f'{term}\0{slot}' for term in terms)
+        with self._lock:
+            self._records = records
+            self._texts = texts
+            self._slots = {record[0]: slot for slot, record in enumerate(records)}
+            self._free = []
+            self._terms = SortedStrings(entries)
+            self._token = token
+            self._synced = time.monotonic()
+            self.ready = True
+
+    def catch_up(self):
+        """Apply the changes of other workers, at most every ``sync_seconds``."""
+        if time.monotonic() - self._synced < self.sync_seconds:
+            return
+        self._synced = time.monotonic()
+        try:
+            result = changes_since('contacts', self._token)
+        except SyncTokenExpired:
+            self.start_build(current_app._get_current_object())
+            return
+        with self._lock:
+            for document in result['changes']:
+                self._put(document)
+            for contact_id in result['deleted']:
+                self._delete(contact_id)
+            self._token = result['next_token']
+
+    def apply(self, document=None, document_id=None, changes=None, deleted=False):
+        """Apply one of this worker's writes; ignored until the index is built."""
+        if not self.ready:
+            return
+        with self._lock:
+            if deleted:
+                self._delete(document_id)
+            elif document is not None:
+                self._put(document)
+            elif document_id is not None and str(document_id) in self._slots:
+                self._put(dict(changes, _id=document_id))
+
+    def suggest(self, query, limit=10):
+        """Return up to ``limit`` contacts matching every word of ``query``."""
+        lead, others = _query_words(query)
+        if lead is None:
+            return []
+        suggestions = []
+        seen = set()
+        with self._lock:
+            for entry in islice(self._terms.iter_from(lead), limit * SCAN_FACTOR):
+                term, _, slot = entry.rpartition('\0')
+                if not term.startswith(lead):
+                    break
+                if slot in seen:
+                    continue
+                seen.add(slot)
+                text = self._texts[int(slot)]
+                if not all(word in text for word in others):
+                    continue
+                suggestions.append(dict(zip(('_id',) + FIELDS, self._records[int(slot)])))
+                if len(suggestions) == limit:
+                    break
+        return suggestions
+
+
+def prefix_query(query, limit=10):
+    """Return up to ``limit`` contacts matching ``query``, read from the database.
+
+    Used while the index is unavailable. The longest query word must start
+    one of the fields (as typed, lowercase or capitalized); the other words
+    are checked like ``ContactIndex.suggest`` does.
+    """
+    lead, others = _query_words(query)
+    if lead is None:
+        return []
+    typed = max(query.split(), key=len)
+    fetch = limit * SCAN_FACTOR if others else limit
+    projection = dict.fromkeys(FIELDS, 1)
+    suggestions = {}
+    for field in FIELDS:
+        for prefix in dict.fromkeys((typed, lead, lead.capitalize())):
+            documents = database.find_documents(
+                'contacts', {field: {'$gte': prefix, '$lt': prefix + '\uffff'}},
+                limit=fetch, read='secondary', projection=projection
+            )
+            for document in documents:
+                record = (str(document['_id']),) + tuple(document.get(name) or '' for name in FIELDS)
+                if record[0] in suggestions or not all(word in _text(contact_terms(record)) for word in others):
+                    continue
+                suggestions[record[0]] = dict(zip(('_id',) + FIELDS, record))
+                if len(suggestions) == limit:
+                    return list(suggestions.values())
+    return list(suggestions.values())
+
+
+def get_index():
+    """Get the current app's contact index, caught up; None until it is built."""
+    index = current_app.extensions['contact_suggest']
+    if not index.ready:
+        index.start_build(current_app._get_current_object())
+        return None
+    index.catch_up()
+    return index
+
+
+def start_build(app):
+    """Start building ``app``'s contact index in the background, if enabled."""
+    if 'contact_suggest' in app.extensions:
+        app.extensions['contact_suggest'].start_build(app)
+
+
+def _on_insert(collection_name, document_id=None, document=None, **kwargs):
+    if has_app_context() and 'contact_suggest' in current_app.extensions:
+        current_app.extensions['contact_suggest'].apply(document=dict(document, _id=document_id))
+
+
+def _on_update(collection_name, document_id=None, changes=None, **kwargs):
+    if has_app_context() and 'contact_suggest' in current_app.extensions:
+        current_app.extensions['contact_suggest'].apply(document_id=document_id, changes=changes)
+
+
+def _on_delete(collection_name, document_id=None, **kwargs):
+    if has_app_context() and 'contact_suggest' in current_app.extensions:
+        current_app.extensions['contact_suggest'].apply(document_id=document_id, deleted=True)
+
+
+def init_app(app):
+    """Serve contact suggestions from an in-memory index, if enabled."""
+    if not app.config['CONTACT_SUGGEST_ENABLED']:
+        return
+    app.extensions['contact_suggest'] = ContactIndex(
+        app.config['CONTACT_SUGGEST_SYNC_SECONDS'], app.config['CONTACT_SUGGEST_MAX_CONTACTS']
+    )
+    database.document_inserted.connect(_on_insert, sender='contacts')
+    database.document_updated.connect(_on_update, sender='contacts')
+    database.document_deleted.connect(_on_delete, sender='contacts')
@@ -0,0 +1,92 @@
+"""Delta sync support for the contacts and affirmations collections.
+
+Clients keep an opaque sync token and ask for the changes since it. Changed
+documents are found through the ``updated_at`` index the write routes
+maintain; deletions are recorded as tombstones in the ``tombstones``
+collection by the delete routes. The cost of a sync is therefore
+proportional to the number of changes, not the size of the collection.
+
+Tokens are milliseconds since the epoch. The returned token lags the time of
+the query by ``SYNC_SAFETY_WINDOW_MS`` so that writes committed slightly out
+of order are not skipped; clients must therefore apply changes idempotently
+(upsert by ``_id``).
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from database import find_documents, insert_document
+from serializers import PUBLIC_PROJECTIONS
+
+TOMBSTONES = 'tombstones'
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class SyncTokenExpired(Exception):
+    """The token is older than the tombstone retention; a full sync is needed."""
+
+
+def encode_token(timestamp):
+    """Encode a naive UTC datetime as a sync token."""
+    return str(int((timestamp - _EPOCH).total_seconds() * 1000))
+
+
+def decode_token(token):
+    """Decode a sync token; an empty token means "from the beginning"."""
+    if not token:
+        return None
+    try:
+        return _EPOCH + timedelta(milliseconds=int(token))
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f'Invalid sync token: {token}')
+
+
+def record_tombstone(collection_name, document_id):
+    """Record the deletion of a document so that syncing clients see it."""
+    now = datetime.utcnow()
+    insert_document(TOMBSTONES, {
+        'collection': collection_name,
+        'doc_id': str(document_id),
+        'deleted_at': now
+    })
+
+
+def changes_since(collection_name, token):
+    """Return the documents changed and deleted since ``token``.
+
+    The result holds ``changes`` (documents as stored), ``deleted`` (ids)
+    and ``next_token`` for the following call.
+    """
+    since = decode_token(token)
+    started = datetime.utcnow()
+    projection = PUBLIC_PROJECTIONS.get(collection_name)
+
+    if since is None:
+        # Full sync: tombstones are irrelevant to a client with no data
+        documents = find_documents(collection_name, projection=projection)
+        deleted = []
+    else:
+        retention = timedelta(days=current_app.config['SYNC_TOMBSTONE_TTL_DAYS'])
+        if since < started - retention:
+            raise SyncTokenExpired(token)
+        documents = find_documents(
+            collection_name, {'updated_at': {'$gt': since}}, sort=[('updated_at', 1)], projection=projection
+        )
+        deleted = find_documents(
+            TOMBSTONES,
+            {'collection': collection_name, 'deleted_at': {'$gt': since}},
+            sort=[('deleted_at', 1)]
+        )
+
+    # Every write stamped before the horizon has committed by now, so the
+    # next sync can start there; later ones are sent again, which is harmless.
+    horizon = started - timedelta(milliseconds=current_app.config['SYNC_SAFETY_WINDOW_MS'])
+    next_token = max(since or _EPOCH, horizon)
+
+    return {
+        'changes': documents,
+        'deleted': [tombstone['doc_id'] for tombstone in deleted],
+        'next_token': encode_token(next_token),
+        'full_sync': since is None
+    }
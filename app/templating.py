@@ -0,0 +1,138 @@
+"""Jinja template loading: bytecode cache and precompiled bundle.
+
+Compiling a template (lexing, parsing and generating Python code) is paid by
+every fresh process, and ``max_requests`` recycling starts many. Two layers
+avoid it:
+
+``JINJA_BYTECODE_CACHE_DIR``
+    A ``FileSystemBytecodeCache`` shared by all workers and restarts: the
+    first process to compile a template stores its code, later ones load it.
+    Entries are keyed on the source checksum, so edited templates recompile.
+``JINJA_TEMPLATE_BUNDLE``
+    Templates precompiled to byte-compiled Python modules by
+    ``python templating.py`` (a step of the Docker build), loaded with
+    Jinja's ``ModuleLoader``. A
+    manifest records the source hash of each template; templates changed
+    since the build are compiled from source instead. Not used when
+    templates auto-reload (debug).
+"""
+import compileall
+import hashlib
+import json
+import os
+import shutil
+import sys
+from importlib.metadata import version
+
+from jinja2 import BaseLoader, FileSystemBytecodeCache, ModuleLoader
+
+MANIFEST = 'manifest.json'
+
+
+def _source_hash(source):
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+def _build_id():
+    # Generated code is specific to the Jinja and Python versions
+    return f"jinja2-{version('jinja2')}-py{sys.version_info[0]}.{sys.version_info[1]}"
+
+
+class BundleLoader(BaseLoader):
+    """Load bundled templates from their modules and others from ``fallback``."""
+
+    def __init__(self, path, fallback, names):
+        self.modules = ModuleLoader(path)
+        self.fallback = fallback
+        self.names = names
+
+    def get_source(self, environment, template):
+        return self.fallback.get_source(environment, template)
+
+    def list_templates(self):
+        return self.fallback.list_templates()
+
+    def load(self, environment, name, globals=None):
+        if name in self.names:
+            return self.modules.load(environment, name, globals)
+        return self.fallback.load(environment, name, globals)
+
+
+def bundled_names(path, environment):
+    """Return the templates of the bundle at ``path`` whose source is unchanged."""
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    if manifest.get('build') != _build_id():
+        return set()
+    names = set()
+    for name, digest in manifest['templates'].items():
+        try:
+            source, _, _ = environment.loader.get_source(environment, name)
+        except Exception:
+            continue
+        if _source_hash(source) == digest:
+            names.add(name)
+    return names
+
+
+def build_bundle(app, target):
+    """Precompile every template of ``app`` into ``target``; return the count."""
+    # A fresh environment, so an existing bundle is not compiled from itself
+    environment = app.create_jinja_environment()
+    names = environment.list_templates()
+    shutil.rmtree(target, ignore_errors=True)
+    environment.compile_templates(target, zip=None, ignore_errors=False)
+    # Byte-compile the modules too, so importing them costs no compilation
+    compileall.compile_dir(target, quiet=1)
+    manifest = {
+        'build': _build_id(),
+        'templates': {
+            name: _source_hash(environment.loader.get_source(environment, name)[0]) for name in names
+        }
+    }
+    with open(os.path.join(target, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return len(names)
+
+
+def configure_environment(environment, bytecode_cache_dir=None, bundle=None, logger=None):
+    """Install the bytecode cache and the bundle loader on a Jinja environment.
+
+    Returns the number of templates served from the bundle.
+    """
+    if bytecode_cache_dir:
+        try:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+            environment.bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+        except OSError as e:
+            if logger:
+                logger.warning(f'Jinja bytecode cache disabled: {e}')
+    if not bundle:
+        return 0
+    names = bundled_names(bundle, environment)
+    if names:
+        environment.loader = BundleLoader(bundle, environment.loader, names)
+    return len(names)
+
+
+def init_app(app):
+    """Configure template loading for ``app``."""
+    bundle = None if app.jinja_env.auto_reload else app.config['JINJA_TEMPLATE_BUNDLE']
+    bundled = configure_environment(
+        app.jinja_env, app.config['JINJA_BYTECODE_CACHE_DIR'], bundle, app.logger
+    )
+    if bundled:
+        app.logger.info(f'Loading {bundled} precompiled templates from {bundle}')
+
+
+if __name__ == '__main__':
+    # Build step: python templating.py [target]
+    from __init__ import create_app
+
+    app = create_app('testing')
+    target = sys.argv[1] if len(sys.argv) > 1 else app.config['JINJA_TEMPLATE_BUNDLE']
+    count = build_bundle(app, target)
+    print(f'Precompiled {count} templates into {target}')
@@ -0,0 +1,149 @@
+"""Warm-up of a worker before it takes traffic.
+
+The first requests to a fresh worker would otherwise pay for compiling Jinja
+templates, opening the first database connection and running cold code
+paths, which shows up as a latency spike on every deploy. ``init_app``
+compiles every template while the app is created, so with gunicorn's
+``preload_app`` the compiled code is shared by all workers. ``warm_up`` then
+runs in each worker through ``start_worker`` (gunicorn's
+``post_worker_init`` hook, or ``run.py`` and ``wsgi.py`` before serving),
+which also starts the worker's background threads: it opens the storage connection pool and requests
+``WARMUP_PATHS`` through the app, priming the affirmation reads and the
+code behind them.
+
+``/ready`` answers 503 until the worker is warm and 200 afterwards, while
+``/health`` keeps reporting liveness.
+"""
+import threading
+import time
+
+from flask import jsonify
+from jinja2 import TemplateError
+
+
+class WarmUpState:
+    """Progress of the warm-up of this process."""
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.durations = {}
+
+    def snapshot(self):
+        return {
+            'ready': self.ready.is_set(),
+            'durations_ms': {name: round(seconds * 1000, 1) for name, seconds in self.durations.items()}
+        }
+
+
+def _timed(state, name, func, *args):
+    started = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        state.durations[name] = time.perf_counter() - started
+
+
+def compile_templates(app):
+    """Load every template into the Jinja cache; return how many compiled."""
+    environment = app.jinja_env
+    compiled = 0
+    for name in environment.list_templates():
+        try:
+            environment.get_template(name)
+            compiled += 1
+        except TemplateError as e:
+            app.logger.warning(f'Could not compile template {name}: {e}')
+    return compiled
+
+
+def _open_storage(app):
+    from database import get_backend
+    with app.app_context():
+        get_backend().ping()
+
+
+def _prime_paths(app):
+    client = app.test_client()
+    for path in app.config['WARMUP_PATHS']:
+        response = client.get(path, headers={'User-Agent': 'warm-up'})
+        if response.status_code >= 500:
+            app.logger.warning(f'Warm-up request to {path} failed with {response.status_code}')
+        response.close()
+
+
+def warm_up(app):
+    """Open the storage pool and run the warm-up requests, then mark ready."""
+    state = app.extensions['warmup']
+    if state.ready.is_set():
+        return
+    started = time.perf_counter()
+    steps = (('storage', _open_storage), ('requests', _prime_paths))
+    for name, step in steps:
+        try:
+            _timed(state, name, step, app)
+        except Exception as e:
+            # A cold worker still beats no worker
+            app.logger.warning(f'Warm-up step {name} failed: {e}')
+    state.ready.set()
+    durations = state.snapshot()['durations_ms']
+    app.logger.info(
+        f'Warm-up finished in {(time.perf_counter() - started) * 1000:.0f} ms '
+        f'({", ".join(f"{name} {durations[name]} ms" for name, _ in steps if name in durations)})'
+    )
+
+
+def wait_for_warm_up(app, timeout, heartbeat=None):
+    """Warm up on a thread for at most ``timeout`` seconds.
+
+    ``heartbeat`` is called every second, e.g. gunicorn's ``worker.notify``
+    so the arbiter does not kill a worker whose database is slow. After the
+    timeout the worker serves cold while the warm-up carries on.
+    """
+    thread = threading.Thread(target=warm_up, args=(app,), name='warm-up', daemon=True)
+    thread.start()
+    deadline = time.monotonic() + timeout
+    while thread.is_alive() and time.monotonic() < deadline:
+        thread.join(min(1.0, max(0.0, deadline - time.monotonic())))
+        if heartbeat is not None:
+            heartbeat()
+    if thread.is_alive():
+        app.logger.warning(f'Warm-up still running after {timeout}s; serving cold')
+
+
+def start_worker(app, heartbeat=None):
+    """Start the background work of a serving process, then warm it up.
+
+    With ``heartbeat`` the warm-up is bounded by ``WARMUP_TIMEOUT_SECONDS``
+    (see ``wait_for_warm_up``); without, it runs to completion.
+    """
+    import suggest
+    # Follow the event bus from now on, not from the first client's connection
+    app.extensions['events'].start()
+    # Index the contacts for suggestions without holding up the process
+    suggest.start_build(app)
+    if not app.config['WARMUP_ENABLED']:
+        return
+    if heartbeat is None:
+        warm_up(app)
+    else:
+        wait_for_warm_up(app, app.config['WARMUP_TIMEOUT_SECONDS'], heartbeat=heartbeat)
+
+
+def _ready_view(state):
+    def ready():
+        return jsonify(state.snapshot()), 200 if state.ready.is_set() else 503
+    return ready
+
+
+def init_app(app):
+    """Register /ready and compile the templates."""
+    state = WarmUpState()
+    app.extensions['warmup'] = state
+    app.add_url_rule('/ready', 'ready', _ready_view(state))
+
+    if not app.config['WARMUP_ENABLED']:
+        state.ready.set()
+        return
+
+    compiled = _timed(state, 'templates', compile_templates, app)
+    app.logger.info(f"Compiled {compiled} templates in {state.durations['templates'] * 1000:.0f} ms")
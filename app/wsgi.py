@@ -13,5 +13,7 @@ from __init__ import create_app
 app = create_app()
 
 if __name__ == '__main__':
+    import warmup
+    warmup.start_worker(app)
     port = int(os.environ.get('PORT', 8000))
     app.run(host='0.0.0.0', port=port)
\ No newline at end of file
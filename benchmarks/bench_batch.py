@@ -0,0 +1,27 @@
+"""Benchmarks for batched requests (``/api/v1/batch``)."""
+import pytest
+
+import config
+from __init__ import create_app
+
+
+class ProductionLimitsConfig(config.TestingConfig):
+    """Testing, with the concurrency limits production runs with."""
+    CONCURRENCY_LIMITS_ENABLED = True
+    CONCURRENCY_LIMITS = config.ProductionConfig.CONCURRENCY_LIMITS
+
+
+@pytest.fixture
+def limited_app(monkeypatch):
+    monkeypatch.setitem(config.config, 'production_limits', ProductionLimitsConfig)
+    return create_app('production_limits')
+
+
+def bench_batch_reads(benchmark, limited_app):
+    """A full batch of reads under the production limits: none may be shed."""
+    client = limited_app.test_client()
+    batch = {'requests': [{'method': 'GET', 'path': '/api/v1/contacts?per_page=5'}] * limited_app.config['BATCH_MAX_REQUESTS']}
+
+    response = benchmark(client.post, '/api/v1/batch', json=batch)
+    assert response.status_code == 200
+    assert [item['status'] for item in response.get_json()['responses']] == [200] * len(batch['requests'])
@@ -0,0 +1,68 @@
+"""Benchmarks for the data-layer helpers in ``database.py``, per storage backend."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from flask import current_app
+
+from conftest import DOCUMENT_COUNT, make_contact
+from database import find_documents, get_backend
+
+COLLECTION = 'benchmark_contacts'
+# Threads per gthread worker in production (GUNICORN_THREADS)
+CONCURRENT_READERS = 4
+
+
+def _clear(backend):
+    for document in backend.find(COLLECTION, {}):
+        backend.delete(COLLECTION, {'_id': document['_id']})
+
+
+@pytest.fixture
+def seeded_collection(storage_app):
+    """Fill a scratch collection with contacts and empty it afterwards."""
+    backend = get_backend()
+    _clear(backend)
+    for i in range(DOCUMENT_COUNT):
+        backend.insert(COLLECTION, make_contact(i))
+    yield COLLECTION
+    _clear(backend)
+
+
+def bench_find_documents_materialization(benchmark, seeded_collection):
+    """Materialization of a full collection by ``find_documents``."""
+    documents = benchmark(find_documents, seeded_collection)
+    assert len(documents) == DOCUMENT_COUNT
+
+
+def bench_find_documents_limit(benchmark, seeded_collection):
+    """Limited read as used by the MongoDB test endpoints."""
+    documents = benchmark(find_documents, seeded_collection, {'company': 'Company 1'}, limit=5)
+    assert len(documents) == 5
+
+
+def bench_insert_document(benchmark, storage_app):
+    """Single-document insert as done by the create routes."""
+    backend = get_backend()
+    _clear(backend)
+    benchmark.pedantic(lambda: backend.insert(COLLECTION, make_contact(0)), rounds=500)
+    _clear(backend)
+
+
+@pytest.mark.parametrize('coalesce', [False, True], ids=['direct', 'coalesced'])
+def bench_find_documents_concurrent(benchmark, seeded_collection, coalesce):
+    """A burst of identical full reads from the threads of one gthread worker."""
+    app = current_app._get_current_object()
+    barrier = threading.Barrier(CONCURRENT_READERS)
+
+    def read():
+        with app.app_context():
+            barrier.wait()
+            return find_documents(seeded_collection, coalesce=coalesce)
+
+    def burst():
+        with ThreadPoolExecutor(CONCURRENT_READERS) as executor:
+            return [future.result() for future in [executor.submit(read) for _ in range(CONCURRENT_READERS)]]
+
+    results = benchmark.pedantic(burst, rounds=20)
+    assert all(len(documents) == DOCUMENT_COUNT for documents in results)
@@ -0,0 +1,67 @@
+"""Benchmarks for contact deduplication (``dedup.py``)."""
+import pytest
+
+from conftest import DOCUMENT_COUNT, make_contact
+from database import get_backend
+from dedup import contact_keys, find_duplicates, group_duplicates
+
+# Every DUPLICATE_EVERY-th contact is imported a second time
+DUPLICATE_EVERY = 10
+
+
+def _distinct_name(i):
+    # Four-syllable names whose Soundex codes differ for i < 1080
+    consonants = 'bcdlmr'
+    head = 'AEIOU'[i // 216 % 5]
+    return head + ''.join('a' + consonants[i // 6 ** power % 6] for power in (2, 1, 0))
+
+
+def _contacts():
+    contacts = []
+    for i in range(DOCUMENT_COUNT):
+        contact = make_contact(i)
+        contact['last_name'] = _distinct_name(i)
+        contact['phone'] = f'555-{i:07d}'
+        contacts.append(contact)
+    for contact in contacts[::DUPLICATE_EVERY]:
+        local, domain = contact['email'].split('@')
+        contacts.append(dict(contact, email=f'{local.upper()}+import@{domain}', phone='+1 ' + contact['phone']))
+    return contacts
+
+
+@pytest.fixture(scope='module')
+def contacts_with_duplicates():
+    return _contacts()
+
+
+def bench_group_duplicates(benchmark, contacts_with_duplicates):
+    """Blocking and union-find over every contact, as ``find_proposals`` runs it."""
+    groups, skipped = benchmark(group_duplicates, contacts_with_duplicates, 50)
+    assert len(groups) == DOCUMENT_COUNT // DUPLICATE_EVERY
+    assert skipped == 0
+
+
+def _clear(backend):
+    for document in backend.find('contacts', {}):
+        backend.delete('contacts', {'_id': document['_id']})
+
+
+# Not MongoDB: the check reads the real contacts collection
+@pytest.fixture(params=['memory', 'sqlite'])
+def contacts_with_keys(request, contacts_with_duplicates):
+    """``contacts`` filled with the originals and their match keys."""
+    app = request.getfixturevalue({'memory': 'app', 'sqlite': 'sqlite_app'}[request.param])
+    with app.app_context():
+        backend = get_backend()
+        _clear(backend)
+        for contact in contacts_with_duplicates[:DOCUMENT_COUNT]:
+            backend.insert('contacts', dict(contact, **contact_keys(contact)))
+        yield app
+        _clear(backend)
+
+
+def bench_find_duplicates(benchmark, contacts_with_keys, contacts_with_duplicates):
+    """The duplicate check of ``create_contact``: up to three indexed lookups."""
+    candidate = contacts_with_duplicates[DOCUMENT_COUNT]
+    duplicates = benchmark(find_duplicates, candidate)
+    assert [reason for _, reason in duplicates] == ['email']
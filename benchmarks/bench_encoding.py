@@ -0,0 +1,66 @@
+"""Size and speed of the api_v1 response encodings on a large contact list.
+
+Encoding JSON includes the ``_id``/``isoformat`` conversion the routes do
+first; MessagePack and CBOR encode ObjectIds and datetimes natively. The
+encoded size of each payload is stored in ``extra_info['bytes']`` (see
+``--benchmark-json``) and printed when running with ``-s``.
+"""
+from datetime import datetime
+
+import pytest
+
+from conftest import make_contact
+from encoding import CBOR, JSON, MSGPACK, available_types, decode, encode
+from serializers import serialize_documents
+
+CONTACT_COUNT = 100_000
+FORMATS = [JSON, MSGPACK, CBOR]
+
+
+@pytest.fixture(scope='module')
+def contacts():
+    now = datetime.utcnow()
+    return [make_contact(i, now) for i in range(CONTACT_COUNT)]
+
+
+def _payload(contacts, mimetype):
+    documents = [dict(doc) for doc in contacts]
+    if mimetype == JSON:
+        serialize_documents(documents)
+    return {'status': 'success', 'contacts': documents, 'count': len(documents)}
+
+
+def _require(mimetype):
+    if mimetype not in available_types():
+        pytest.skip(f'{mimetype} encoder not installed')
+
+
+@pytest.mark.parametrize('mimetype', FORMATS)
+def bench_encode_contacts(benchmark, app, contacts, mimetype):
+    """Encode a ``/api/v1/contacts`` response body."""
+    _require(mimetype)
+    with app.app_context():
+        if mimetype == JSON:
+            def run():
+                payload = _payload(contacts, JSON)
+                return encode(payload, JSON)
+            body = benchmark.pedantic(run, rounds=5)
+        else:
+            body = benchmark.pedantic(
+                encode,
+                setup=lambda: ((_payload(contacts, mimetype), mimetype), {}),
+                rounds=5
+            )
+    benchmark.extra_info['bytes'] = len(body)
+    print(f'\n{mimetype}: {len(body):,} bytes for {CONTACT_COUNT:,} contacts')
+
+
+@pytest.mark.parametrize('mimetype', FORMATS)
+def bench_decode_contacts(benchmark, app, contacts, mimetype):
+    """Decode a ``/api/v1/contacts`` response body, as a client would."""
+    _require(mimetype)
+    with app.app_context():
+        body = encode(_payload(contacts, mimetype), mimetype)
+        result = benchmark.pedantic(decode, args=(body, mimetype), rounds=5)
+    assert result['count'] == CONTACT_COUNT
+    benchmark.extra_info['bytes'] = len(body)
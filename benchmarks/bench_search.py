@@ -0,0 +1,44 @@
+"""Benchmarks for full-text search (``/api/v1/search``)."""
+import pytest
+
+from conftest import DOCUMENT_COUNT, make_contact
+from database import find_documents, get_backend, search_documents
+
+TOPICS = ['robotics', 'gardening', 'astronomy', 'pottery', 'chess', 'cycling', 'baking', 'sailing', 'jazz', 'poetry']
+
+PROJECTION = {'first_name': 1, 'last_name': 1, 'email': 1, 'company': 1, 'notes': 1}
+
+
+def _clear(backend):
+    for document in backend.find('contacts', {}):
+        backend.delete('contacts', {'_id': document['_id']})
+
+
+# Not MongoDB: the search needs the real contacts collection and its text index
+@pytest.fixture(params=['memory', 'sqlite'])
+def searchable_contacts(request):
+    """``contacts`` filled with ``DOCUMENT_COUNT`` contacts, a tenth of them about each topic."""
+    app = request.getfixturevalue({'memory': 'app', 'sqlite': 'sqlite_app'}[request.param])
+    with app.app_context():
+        backend = get_backend()
+        _clear(backend)
+        for i in range(DOCUMENT_COUNT):
+            contact = make_contact(i)
+            contact['notes'] = f'Met at the {TOPICS[i % len(TOPICS)]} meetup, follow up next month.'
+            backend.insert('contacts', contact)
+        yield app
+        _clear(backend)
+
+
+def bench_search(benchmark, searchable_contacts):
+    """The first page of ``/api/v1/search?q=robotics``, ranked and projected."""
+    results = benchmark(search_documents, 'contacts', 'robotics', limit=21, projection=PROJECTION)
+    assert len(results) == 21
+
+
+def bench_search_client_side(benchmark, searchable_contacts):
+    """What a page does without the endpoint: load every contact and filter."""
+    def load_and_filter():
+        return [contact for contact in find_documents('contacts') if 'robotics' in contact['notes'].lower()][:21]
+
+    assert len(benchmark(load_and_filter)) == 21
@@ -0,0 +1,43 @@
+"""Benchmarks for document serialization and request payload normalization."""
+from datetime import datetime
+
+from conftest import DOCUMENT_COUNT, make_affirmation
+from serializers import normalize_contact, serialize_document, serialize_documents
+
+CONTACT_PAYLOAD = {
+    'first_name': '  Ada ',
+    'last_name': ' Lovelace  ',
+    'email': '  Ada.Lovelace@Example.COM ',
+    'phone': ' 555-0100 ',
+    'company': ' Analytical Engines ',
+    'notes': '  Interested in the outreach programme.  '
+}
+
+
+def bench_serialize_contact_list(benchmark, contact_documents):
+    """``_id``/``isoformat`` conversion done by the contact list routes."""
+    result = benchmark.pedantic(
+        serialize_documents,
+        setup=lambda: ((contact_documents(),), {}),
+        rounds=200
+    )
+    assert len(result) == DOCUMENT_COUNT
+    assert isinstance(result[0]['_id'], str)
+
+
+def bench_serialize_random_affirmation(benchmark):
+    """Single-document conversion done by the random affirmation routes."""
+    now = datetime.utcnow()
+    result = benchmark.pedantic(
+        serialize_document,
+        setup=lambda: ((make_affirmation(0, now),), {}),
+        rounds=5000
+    )
+    assert isinstance(result['created_at'], str)
+
+
+def bench_normalize_contact(benchmark):
+    """Field ``strip()``/``lower()`` normalization done by ``create_contact``."""
+    now = datetime.utcnow()
+    contact = benchmark(normalize_contact, CONTACT_PAYLOAD, now)
+    assert contact['email'] == 'ada.lovelace@example.com'
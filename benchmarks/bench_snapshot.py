@@ -0,0 +1,62 @@
+"""Benchmarks for picking a random affirmation (``snapshot.py``, ``sampling.py``)."""
+import random
+import time
+from datetime import datetime
+
+import pytest
+
+from conftest import DOCUMENT_COUNT, make_affirmation
+from database import find_documents, get_backend
+from sampling import next_affirmation
+from snapshot import UNAVAILABLE, SharedSnapshot
+
+
+@pytest.fixture
+def affirmation_documents():
+    now = datetime.utcnow()
+    return [make_affirmation(i, now) for i in range(DOCUMENT_COUNT)]
+
+
+@pytest.fixture
+def seeded_affirmations(storage_app, affirmation_documents):
+    """``affirmations`` filled with ``DOCUMENT_COUNT`` documents."""
+    backend = get_backend()
+    backend.delete('affirmations', {})
+    for document in affirmation_documents:
+        backend.insert('affirmations', dict(document))
+    return storage_app
+
+
+@pytest.fixture
+def built_snapshot(tmp_path, affirmation_documents):
+    """A snapshot of ``DOCUMENT_COUNT`` affirmations, built by its own leader thread."""
+    snapshot = SharedSnapshot(
+        str(tmp_path / 'affirmations.snapshot'), lambda: affirmation_documents, poll=0.01, group_by='category'
+    )
+    deadline = time.monotonic() + 5
+    while snapshot.choice() is UNAVAILABLE:
+        assert time.monotonic() < deadline, 'the snapshot was not built'
+        time.sleep(0.01)
+    return snapshot
+
+
+def bench_random_affirmation_database(benchmark, seeded_affirmations):
+    """Load the collection and pick one, as the routes do without the snapshot."""
+    def pick():
+        return random.choice(find_documents('affirmations'))
+
+    assert 'text' in benchmark(pick)
+
+
+def bench_random_affirmation_snapshot(benchmark, built_snapshot):
+    """Pick one from the shared snapshot, decoding only that document."""
+    assert 'text' in benchmark(built_snapshot.choice)
+
+
+@pytest.mark.parametrize('rotate', [False, True], ids=['weighted', 'rotating'])
+def bench_next_affirmation(benchmark, app, built_snapshot, monkeypatch, rotate):
+    """Weighted draw through the alias table, optionally without repeats."""
+    monkeypatch.setitem(app.extensions, 'affirmations_snapshot', built_snapshot)
+    monkeypatch.setitem(app.config, 'AFFIRMATION_CATEGORY_WEIGHTS', {'growth': 3, 'focus': 0.5})
+    with app.test_request_context('/'):
+        assert 'text' in benchmark(next_affirmation, rotate=rotate)
@@ -0,0 +1,18 @@
+"""Cold-start benchmark: a fresh interpreter importing the app and calling ``create_app()``.
+
+See ``importtime.py`` for the per-module breakdown.
+"""
+import subprocess
+import sys
+
+from importtime import APP_DIR, STARTUP_SCRIPT
+
+
+def bench_create_app_cold(benchmark):
+    """Import and create the testing app in a new process, as a fresh worker would."""
+    command = [sys.executable, '-c', STARTUP_SCRIPT.format(config='testing')]
+    result = benchmark.pedantic(
+        subprocess.run, args=(command,), kwargs={'cwd': APP_DIR, 'capture_output': True, 'check': True},
+        rounds=5
+    )
+    assert b'startup_ms=' in result.stdout
@@ -0,0 +1,47 @@
+"""Benchmarks for the dashboard statistics (``stats.py``)."""
+import pytest
+
+from conftest import DOCUMENT_COUNT, make_affirmation, make_contact
+from database import get_backend
+from stats import METRICS, get_stats, reconcile
+
+
+def _clear(backend):
+    for collection in ('contacts', 'affirmations', 'stats'):
+        for document in backend.find(collection, {}):
+            backend.delete(collection, {'_id': document['_id']})
+
+
+# Not MongoDB: the counters describe the real contacts and affirmations
+@pytest.fixture(params=['memory', 'sqlite'])
+def counted_app(request):
+    """``DOCUMENT_COUNT`` contacts and affirmations, with their counters."""
+    app = request.getfixturevalue({'memory': 'app', 'sqlite': 'sqlite_app'}[request.param])
+    with app.app_context():
+        backend = get_backend()
+        _clear(backend)
+        for i in range(DOCUMENT_COUNT):
+            backend.insert('contacts', make_contact(i))
+            backend.insert('affirmations', make_affirmation(i))
+        reconcile()
+        yield app
+        _clear(backend)
+
+
+def bench_stats_counters(benchmark, counted_app):
+    """``/api/v1/stats``: read the counters."""
+    stats = benchmark(get_stats)
+    assert sum(stats['contacts_by_company'].values()) == DOCUMENT_COUNT
+
+
+def bench_stats_aggregate(benchmark, counted_app):
+    """What the counters replace: one grouped count per metric on every view."""
+    def aggregate():
+        backend = get_backend()
+        return {
+            metric: backend.count_by(collection, field, day=day)
+            for metric, (collection, field, day) in METRICS.items()
+        }
+
+    stats = benchmark(aggregate)
+    assert sum(stats['contacts_by_company'].values()) == DOCUMENT_COUNT
@@ -0,0 +1,78 @@
+"""Benchmarks for contact autocomplete (``suggest.py``)."""
+import random
+
+import pytest
+from bson import ObjectId
+
+from conftest import DOCUMENT_COUNT, make_contact
+from database import get_backend
+from suggest import ContactIndex, prefix_query
+
+# Raise to 1,000,000 to check the latency target (about 17 s and 800 MB to build)
+SUGGEST_CONTACT_COUNT = 100_000
+
+SYLLABLES = ['an', 'ber', 'cor', 'da', 'el', 'fi', 'gra', 'hol', 'is', 'jo', 'ka', 'lin', 'mar',
+             'no', 'or', 'pe', 'qu', 'ro', 'sa', 'tor', 'u', 'vel', 'wen', 'xi', 'ya', 'zo']
+
+
+def _contacts(count):
+    rng = random.Random(1)
+
+    def name(syllables):
+        return ''.join(rng.choice(SYLLABLES) for _ in range(syllables)).capitalize()
+
+    first_names = [name(2) for _ in range(5000)]
+    last_names = [name(3) for _ in range(50000)]
+    companies = [f"{name(2)} {rng.choice(['Labs', 'Inc', 'Group', 'Systems'])}" for _ in range(20000)]
+    for i in range(count):
+        first_name, last_name = rng.choice(first_names), rng.choice(last_names)
+        yield {
+            '_id': ObjectId(),
+            'first_name': first_name,
+            'last_name': last_name,
+            'email': f'{first_name}.{last_name}{i}@example.com'.lower(),
+            'company': rng.choice(companies)
+        }
+
+
+@pytest.fixture(scope='module')
+def contact_index():
+    index = ContactIndex()
+    index.load(_contacts(SUGGEST_CONTACT_COUNT), None)
+    return index
+
+
+# "x y z": few contacts match every word, so the scan runs to its cap
+@pytest.mark.parametrize('query, found', [('mar', True), ('mar lin', True), ('x y z', False)],
+                         ids=['mar', 'mar lin', 'x y z'])
+def bench_suggest(benchmark, contact_index, query, found):
+    """A ``/api/v1/contacts/suggest`` lookup of ten suggestions."""
+    suggestions = benchmark(contact_index.suggest, query, 10)
+    assert (len(suggestions) == 10) == found
+
+
+def bench_suggest_insert(benchmark, contact_index):
+    """Index one new contact, as the ``document_inserted`` signal does."""
+    contacts = _contacts(10 ** 6)
+    benchmark(lambda: contact_index.apply(document=next(contacts)))
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def suggest_fallback_app(request):
+    """``DOCUMENT_COUNT`` contacts in the database and no suggestion index."""
+    app = request.getfixturevalue({'memory': 'app', 'sqlite': 'sqlite_app'}[request.param])
+    with app.app_context():
+        backend = get_backend()
+        for document in backend.find('contacts', {}):
+            backend.delete('contacts', {'_id': document['_id']})
+        for i in range(DOCUMENT_COUNT):
+            backend.insert('contacts', make_contact(i))
+        yield app
+        for document in backend.find('contacts', {}):
+            backend.delete('contacts', {'_id': document['_id']})
+
+
+def bench_suggest_prefix_query(benchmark, suggest_fallback_app):
+    """What ``/api/v1/contacts/suggest`` does without its index: database prefix queries."""
+    suggestions = benchmark(prefix_query, 'last12', 10)
+    assert len(suggestions) == 10
@@ -0,0 +1,51 @@
+"""Benchmarks for template rendering and loading."""
+import pytest
+from flask import render_template
+
+from conftest import make_affirmation
+from templating import build_bundle, configure_environment
+
+
+def bench_render_index(benchmark, app):
+    """Render the landing page with an affirmation, as ``main.index`` does."""
+    affirmation = make_affirmation(0)
+    with app.test_request_context('/'):
+        html = benchmark(render_template, 'index.html', affirmation=affirmation)
+    assert affirmation['text'] in html
+
+
+def bench_render_index_without_affirmation(benchmark, app):
+    """Render the landing page when no affirmation could be loaded."""
+    with app.test_request_context('/'):
+        html = benchmark(render_template, 'index.html', affirmation=None)
+    assert '</html>' in html
+
+
+@pytest.fixture(scope='module')
+def template_layers(app, tmp_path_factory):
+    """A precompiled bundle and a filled bytecode cache for ``app``'s templates."""
+    bundle = str(tmp_path_factory.mktemp('bundle'))
+    build_bundle(app, bundle)
+    cache_dir = str(tmp_path_factory.mktemp('jinja'))
+    environment = app.create_jinja_environment()
+    configure_environment(environment, bytecode_cache_dir=cache_dir)
+    _load_all(environment)
+    return {'source': {}, 'bytecode': {'bytecode_cache_dir': cache_dir}, 'bundle': {'bundle': bundle}}
+
+
+def _load_all(environment):
+    for name in environment.list_templates():
+        environment.get_template(name)
+
+
+@pytest.mark.parametrize('layer', ['source', 'bytecode', 'bundle'])
+def bench_load_templates(benchmark, app, template_layers, layer):
+    """Load every template into a fresh environment, as a new worker does."""
+    options = template_layers[layer]
+
+    def fresh_environment():
+        environment = app.create_jinja_environment()
+        configure_environment(environment, **options)
+        return (environment,), {}
+
+    benchmark.pedantic(_load_all, setup=fresh_environment, rounds=50)
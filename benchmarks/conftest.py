@@ -0,0 +1,103 @@
+"""Shared fixtures for the micro-benchmark suite."""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+# The application modules use top-level imports (``import database``), so the
+# app directory has to be importable the same way gunicorn sees it.
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+sys.path.insert(0, os.path.abspath(APP_DIR))
+
+from __init__ import create_app  # noqa: E402
+from storage import create_backend  # noqa: E402
+
+DOCUMENT_COUNT = 1000
+
+
+@pytest.fixture(scope='session')
+def app():
+    """Application configured for testing, on the in-memory storage backend."""
+    return create_app('testing')
+
+
+def make_contact(i, now=None):
+    """Build a contact document shaped like the ones the write routes store."""
+    now = now or datetime.utcnow()
+    return {
+        '_id': ObjectId(),
+        'first_name': f'First{i}',
+        'last_name': f'Last{i}',
+        'email': f'user{i}@example.com',
+        'phone': f'555-01{i % 100:02d}',
+        'company': f'Company {i % 50}',
+        'notes': 'Met at the community outreach event.',
+        'created_at': now - timedelta(days=i % 365),
+        'updated_at': now
+    }
+
+
+def make_affirmation(i, now=None):
+    """Build an affirmation document shaped like the ones the write routes store."""
+    now = now or datetime.utcnow()
+    return {
+        '_id': ObjectId(),
+        'text': f'I am capable of great things, number {i}.',
+        'author': f'Author {i % 20}',
+        'category': ['confidence', 'growth', 'gratitude', 'focus'][i % 4],
+        'created_at': now,
+        'updated_at': now
+    }
+
+
+@pytest.fixture
+def contact_documents():
+    """Factory returning a fresh list of contact documents."""
+    now = datetime.utcnow()
+    template = [make_contact(i, now) for i in range(DOCUMENT_COUNT)]
+    return lambda: [dict(doc) for doc in template]
+
+
+def _app_with_backend(name, **config):
+    """Testing application switched to another storage backend."""
+    app = create_app('testing')
+    app.config.update(DATABASE_BACKEND=name, **config)
+    backend = create_backend(app)
+    backend.startup(app.logger)
+    app.extensions['storage'] = backend
+    return app
+
+
+@pytest.fixture(scope='session')
+def mongo_app():
+    """Application backed by a reachable MongoDB, or skip."""
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    app = _app_with_backend('mongodb')
+    client = MongoClient(app.config['MONGODB_URI'], serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command('ping')
+    except PyMongoError as e:
+        pytest.skip(f'MongoDB not available: {e}')
+    finally:
+        client.close()
+    return app
+
+
+@pytest.fixture(scope='session')
+def sqlite_app(tmp_path_factory):
+    """Application using the SQLite backend on a scratch database file."""
+    path = tmp_path_factory.mktemp('storage') / 'bench.db'
+    return _app_with_backend('sqlite', SQLALCHEMY_DATABASE_URI=f'sqlite:///{path}')
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'mongodb'])
+def storage_app(request):
+    """Application context for each storage backend; MongoDB skips if unreachable."""
+    fixture = {'memory': 'app', 'sqlite': 'sqlite_app', 'mongodb': 'mongo_app'}[request.param]
+    app = request.getfixturevalue(fixture)
+    with app.app_context():
+        yield app
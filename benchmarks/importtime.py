@@ -0,0 +1,86 @@
+"""Import-time budget for ``create_app()``.
+
+Starts fresh interpreters with ``-X importtime`` that import the app and call
+``create_app()``, as a new gunicorn master, worker (without ``preload_app``)
+or CLI tool does, and reports the slowest imports and the total::
+
+    python benchmarks/importtime.py
+    python benchmarks/importtime.py --config production --top 40
+    python benchmarks/importtime.py --budget-ms 350
+
+Import times are cumulative (a module includes what it imports) and taken
+from the fastest of ``--runs`` runs. With ``--budget-ms`` the exit status is
+1 when the median startup time exceeds the budget, so it can gate CI.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+# Prints the wall time of the import and create_app() on the last line
+STARTUP_SCRIPT = """
+import time
+started = time.perf_counter()
+from __init__ import create_app
+create_app({config!r})
+print(f'startup_ms={{(time.perf_counter() - started) * 1000:.1f}}')
+"""
+
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def run_once(config, app_dir):
+    """Return (startup ms, {module: (self us, cumulative us, depth)})."""
+    env = dict(
+        os.environ,
+        MONGODB_SERVER_SELECTION_TIMEOUT_MS=os.environ.get('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '200'),
+        LOG_TO_STDOUT='true'
+    )
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT.format(config=config)],
+        cwd=app_dir, env=env, capture_output=True, text=True, check=True
+    )
+    startup = float(result.stdout.strip().rsplit('startup_ms=', 1)[1])
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us), (len(indent) - 1) // 2)
+    return startup, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--config', default='testing', help='config name passed to create_app()')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=25, help='number of imports to list')
+    parser.add_argument('--budget-ms', type=float, help='fail when the median startup exceeds this')
+    parser.add_argument('--app-dir', default=APP_DIR, help='app directory, e.g. of another checkout')
+    args = parser.parse_args()
+
+    runs = [run_once(args.config, args.app_dir) for _ in range(args.runs)]
+    startups = [startup for startup, _ in runs]
+    fastest = min(runs, key=lambda run: run[0])[1]
+
+    print(f'{"cumulative ms":>14} {"self ms":>8}  module')
+    top = sorted(fastest.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us, depth) in top:
+        print(f'{cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {"  " * depth}{name}')
+
+    top_level = [name for name, (_, _, depth) in fastest.items() if depth == 0]
+    print(f'\n{len(fastest)} modules imported, {len(top_level)} at top level')
+    print(f'Startup (import + create_app): median {statistics.median(startups):.1f} ms, '
+          f'min {min(startups):.1f} ms over {len(startups)} runs')
+
+    if args.budget_ms is not None and statistics.median(startups) > args.budget_ms:
+        print(f'Over the {args.budget_ms:.0f} ms budget')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
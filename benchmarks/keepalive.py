@@ -0,0 +1,160 @@
+"""Compare a new connection per request with reused keep-alive connections.
+
+This is what nginx does to gunicorn without and with an ``upstream`` block
+with ``keepalive``. Run it against a gunicorn started with the repository's
+``gunicorn.conf.py`` (the default), or point ``--url`` at any server, e.g.
+nginx, to compare deployed configurations::
+
+    python benchmarks/keepalive.py
+    python benchmarks/keepalive.py --requests 20000 --concurrency 16
+    python benchmarks/keepalive.py --url http://localhost/api/v1/system/status
+
+The report shows throughput, latency percentiles and how many sockets were
+left in ``TIME_WAIT`` on this host (Linux only).
+"""
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+DEFAULT_PATH = '/api/v1/system/status'
+
+
+def count_time_wait():
+    """Return the number of TCP sockets in TIME_WAIT, or None if unknown."""
+    total = 0
+    for path in ('/proc/net/tcp', '/proc/net/tcp6'):
+        try:
+            with open(path) as f:
+                next(f)
+                total += sum(1 for line in f if line.split()[3] == '06')
+        except OSError:
+            return None
+    return total
+
+
+def start_gunicorn(port, workers):
+    env = dict(
+        os.environ,
+        GUNICORN_BIND=f'127.0.0.1:{port}',
+        GUNICORN_WORKERS=str(workers),
+        GUNICORN_LOG_LEVEL='warning',
+        # Worker restarts would close kept-alive connections mid-run
+        GUNICORN_MAX_REQUESTS='0',
+        ACCESS_LOG_ENABLED='false',
+        MONGODB_SERVER_SELECTION_TIMEOUT_MS=os.environ.get('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '500')
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', 'wsgi:app'],
+        cwd=APP_DIR, env=env
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise SystemExit('gunicorn exited during startup')
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit('gunicorn did not start within 30s')
+
+
+def run(host, port, path, requests, concurrency, keepalive):
+    """Send ``requests`` GETs from ``concurrency`` threads; return latencies."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_thread = requests // concurrency
+
+    def worker():
+        local = []
+        local_errors = []
+        connection = None
+        headers = {} if keepalive else {'Connection': 'close'}
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            try:
+                if connection is None:
+                    connection = http.client.HTTPConnection(host, port, timeout=10)
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if not keepalive or response.will_close:
+                    connection.close()
+                    connection = None
+                local.append(time.perf_counter() - started)
+            except (OSError, http.client.HTTPException) as e:
+                local_errors.append(e)
+                if connection is not None:
+                    connection.close()
+                    connection = None
+        if connection is not None:
+            connection.close()
+        with lock:
+            latencies.extend(local)
+            errors.extend(local_errors)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started, errors
+
+
+def report(name, latencies, elapsed, errors, time_wait):
+    latencies.sort()
+    count = len(latencies)
+    if not count:
+        print(f'{name:<12} no successful requests ({len(errors)} errors)')
+        return
+    p50 = latencies[count // 2] * 1000
+    p99 = latencies[min(count - 1, int(count * 0.99))] * 1000
+    time_wait = '-' if time_wait is None else f'{time_wait:+d}'
+    print(f'{name:<12} {count / elapsed:>10.0f} {p50:>9.2f} {p99:>9.2f} {len(errors):>7} {time_wait:>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', help=f'server to test (default: start gunicorn and use {DEFAULT_PATH})')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers when starting one')
+    parser.add_argument('--port', type=int, default=8099, help='gunicorn port when starting one')
+    args = parser.parse_args()
+
+    process = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port, path = url.hostname, url.port or 80, url.path or '/'
+    else:
+        host, port, path = '127.0.0.1', args.port, DEFAULT_PATH
+        process = start_gunicorn(port, args.workers)
+
+    try:
+        # Warm up workers and the app before measuring
+        run(host, port, path, args.concurrency * 10, args.concurrency, True)
+        print(f'{args.requests} x GET {path} from {args.concurrency} threads')
+        print(f"{'mode':<12} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7} {'TIME_WAIT':>10}")
+        for name, keepalive in (('close', False), ('keepalive', True)):
+            before = count_time_wait()
+            latencies, elapsed, errors = run(host, port, path, args.requests, args.concurrency, keepalive)
+            after = count_time_wait()
+            report(name, latencies, elapsed, errors, None if before is None else after - before)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react'
+import React, { useState, useEffect, useRef } from 'react'
 import { Button, Modal, Input, Alert, Loading, Card } from '../components/UI'
 import { contactsService } from '../services/contacts'
 
@@ -22,6 +22,12 @@ function ContactsPage() {
   // Form errors
   const [formErrors, setFormErrors] = useState({})
 
+  // Existing contacts the new one may duplicate (from a 409 response)
+  const [duplicates, setDuplicates] = useState(null)
+
+  // Token of the last delta sync; null means the next load is a full sync
+  const syncToken = useRef(null)
+
   // Load contacts on mount
   useEffect(() => {
     loadContacts()
@@ -29,14 +35,20 @@ function ContactsPage() {
 
   const loadContacts = async () => {
     try {
-      setLoading(true)
-      const response = await contactsService.getAll()
+      if (syncToken.current === null) setLoading(true)
+      const response = await contactsService.getChanges(syncToken.current)
       if (response.status === 'success') {
-        setContacts(response.contacts || [])
+        setContacts(prev => mergeChanges(response.full_sync ? [] : prev, response))
+        syncToken.current = response.next_token
       } else {
         showAlert('Error loading contacts', 'error')
       }
     } catch (error) {
+      if (error.response?.status === 410) {
+        // Sync token expired, start over with a full sync
+        syncToken.current = null
+        return loadContacts()
+      }
       showAlert('Network error. Please try again.', 'error')
       console.error('Error loading contacts:', error)
     } finally {
@@ -44,6 +56,20 @@ function ContactsPage() {
     }
   }
 
+  // Apply a delta sync response to the current list, keeping its order
+  const mergeChanges = (current, { contacts: changed = [], deleted = [] }) => {
+    const changedById = new Map(changed.map(contact => [contact._id, contact]))
+    const removed = new Set(deleted)
+    const merged = current
+      .filter(contact => !removed.has(contact._id))
+      .map(contact => {
+        const update = changedById.get(contact._id)
+        changedById.delete(contact._id)
+        return update || contact
+      })
+    return merged.concat(Array.from(changedById.values()))
+  }
+
   const showAlert = (message, type = 'info') => {
     setAlert({ message, type })
     setTimeout(() => setAlert(null), 5000)
@@ -52,6 +78,7 @@ function ContactsPage() {
   const handleInputChange = (e) => {
     const { name, value } = e.target
     setFormData(prev => ({ ...prev, [name]: value }))
+    setDuplicates(null)
     // Clear error for this field when user starts typing
     if (formErrors[name]) {
       setFormErrors(prev => ({ ...prev, [name]: '' }))
@@ -72,7 +99,19 @@ function ContactsPage() {
     return Object.keys(errors).length === 0
   }
 
-  const handleSubmit = async (e) => {
+  const DUPLICATE_REASONS = {
+    email: 'same email',
+    phone: 'same phone and name',
+    name_company: 'same name and company'
+  }
+
+  const describeDuplicate = ({ contact_id, reason }) => {
+    const match = contacts.find(contact => contact._id === contact_id)
+    const name = match ? `${match.first_name} ${match.last_name} <${match.email}>` : `Contact ${contact_id}`
+    return `${name} (${DUPLICATE_REASONS[reason] || reason})`
+  }
+
+  const handleSubmit = async (e, allowDuplicate = false) => {
     e.preventDefault()
     
     if (!validateForm()) return
@@ -90,7 +129,7 @@ function ContactsPage() {
         }
       } else {
         // Create new contact
-        const response = await contactsService.create(formData)
+        const response = await contactsService.create(formData, { allowDuplicate })
         if (response.status === 'success') {
           showAlert('Contact added successfully!', 'success')
           closeModal()
@@ -100,7 +139,12 @@ function ContactsPage() {
         }
       }
     } catch (error) {
-      showAlert('Network error. Please try again.', 'error')
+      if (error.response?.status === 409) {
+        // Possible duplicate: list the matches and let the user save anyway
+        setDuplicates(error.response.data.duplicates || [])
+        return
+      }
+      showAlert(error.response?.data?.message || 'Network error. Please try again.', 'error')
       console.error('Error saving contact:', error)
     }
   }
@@ -148,6 +192,7 @@ function ContactsPage() {
       notes: ''
     })
     setFormErrors({})
+    setDuplicates(null)
     setShowModal(true)
   }
 
@@ -163,6 +208,7 @@ function ContactsPage() {
       notes: ''
     })
     setFormErrors({})
+    setDuplicates(null)
   }
 
   if (loading) {
@@ -248,13 +294,31 @@ function ContactsPage() {
             <Button onClick={closeModal} variant="secondary">
               Cancel
             </Button>
-            <Button onClick={handleSubmit} variant="primary">
-              {editingContact ? 'Update' : 'Save'} Contact
-            </Button>
+            {duplicates ? (
+              <Button onClick={(e) => handleSubmit(e, true)} variant="primary">
+                Save Anyway
+              </Button>
+            ) : (
+              <Button onClick={handleSubmit} variant="primary">
+                {editingContact ? 'Update' : 'Save'} Contact
+              </Button>
+            )}
           </>
         }
       >
-        <form onSubmit={handleSubmit}>
+        {duplicates && (
+          <div className="duplicate-warning" role="alert">
+            <p>This contact may already exist:</p>
+            <ul>
+              {duplicates.map(duplicate => (
+                <li key={duplicate.contact_id}>{describeDuplicate(duplicate)}</li>
+              ))}
+            </ul>
+            <p>Edit the details, or save it anyway.</p>
+          </div>
+        )}
+
+        <form onSubmit={(e) => handleSubmit(e, duplicates !== null)}>
           <Input
             label="First Name"
             name="first_name"
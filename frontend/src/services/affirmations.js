@@ -7,6 +7,18 @@ export const affirmationsService = {
     return response.data
   },
 
+  // Full-text search, best matches first (one page at a time)
+  search: async (q, page = 1) => {
+    const response = await api.get('/v1/search', { params: { q, type: 'affirmations', page } })
+    return response.data
+  },
+
+  // Get affirmations created, updated or deleted since a sync token
+  getChanges: async (since) => {
+    const response = await api.get('/v1/affirmations/changes', { params: since ? { since } : {} })
+    return response.data
+  },
+
   // Get random affirmation
   getRandom: async () => {
     const response = await api.get('/v1/affirmations/random')
@@ -0,0 +1,17 @@
+import api from './api'
+
+export const batchService = {
+  // Send several API requests in one round trip.
+  // Each request is { method, path, body }, with path relative to /api
+  // (e.g. '/v1/health'). Resolves to one { status, body } per request, in order.
+  send: async (requests) => {
+    const response = await api.post('/v1/batch', {
+      requests: requests.map(({ method = 'GET', path, body }) => ({
+        method,
+        path: `/api${path}`,
+        body
+      }))
+    })
+    return response.data.responses
+  }
+}
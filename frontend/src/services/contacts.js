@@ -7,9 +7,24 @@ export const contactsService = {
     return response.data
   },
 
-  // Create new contact
-  create: async (contactData) => {
-    const response = await api.post('/v1/contacts', contactData)
+  // Full-text search, best matches first (one page at a time)
+  search: async (q, page = 1) => {
+    const response = await api.get('/v1/search', { params: { q, type: 'contacts', page } })
+    return response.data
+  },
+
+  // Get contacts created, updated or deleted since a sync token
+  getChanges: async (since) => {
+    const response = await api.get('/v1/contacts/changes', { params: since ? { since } : {} })
+    return response.data
+  },
+
+  // Create new contact; the API answers 409 with the matches if it may be a
+  // duplicate, unless allowDuplicate is set
+  create: async (contactData, { allowDuplicate = false } = {}) => {
+    const response = await api.post('/v1/contacts', contactData, {
+      params: allowDuplicate ? { allow_duplicate: true } : {}
+    })
     return response.data
   },
 
@@ -39,6 +39,11 @@ if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8000))
     debug = os.environ.get('FLASK_ENV') == 'development'
     
+    # Start the background threads and warm up (the reloader's child
+    # process does both again)
+    import warmup
+    warmup.start_worker(app)
+    
     # Run the application
     print(f"Starting Flask application on {host}:{port}")
     print(f"Debug mode: {debug}")
@@ -0,0 +1,83 @@
+#!/bin/bash
+
+# Check the nginx micro-cache against a running stack:
+#   docker-compose up -d && bash scripts/test-nginx-cache.sh
+# Set BASE_URL to test another host (default http://localhost).
+
+set -e
+
+BASE_URL=${BASE_URL:-http://localhost}
+NGINX_CONF=${NGINX_CONF:-nginx/nginx.conf}
+
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+NC='\033[0m' # No Color
+
+pass() {
+    echo -e "${GREEN}[✓]${NC} $1"
+}
+
+fail() {
+    echo -e "${RED}[✗]${NC} $1"
+    exit 1
+}
+
+cache_status() {
+    curl -s -o /dev/null -D - "$@" | tr -d '\r' | awk -F': ' 'tolower($1) == "x-cache-status" {print $2}'
+}
+
+# 1. Configuration syntax (needs Docker; service names resolve to localhost)
+if command -v docker &> /dev/null; then
+    docker run --rm \
+        -v "$PWD/$NGINX_CONF:/etc/nginx/conf.d/default.conf:ro" \
+        --add-host backend:127.0.0.1 --add-host frontend:127.0.0.1 --add-host web:127.0.0.1 \
+        nginx:alpine nginx -t -q || fail "nginx -t failed for $NGINX_CONF"
+    pass "nginx -t accepts $NGINX_CONF"
+fi
+
+URL="$BASE_URL/api/v1/affirmations"
+
+# 2. Second read within the TTL is served from the cache
+sleep 11  # let any existing entry expire
+first=$(cache_status "$URL")
+sleep 0.5  # an expired entry is served STALE while it updates in the background
+second=$(cache_status "$URL")
+case "$first" in
+    MISS|EXPIRED|STALE|UPDATING) ;;
+    *) fail "first GET: expected a miss, got '$first'" ;;
+esac
+[ "$second" = "HIT" ] || fail "second GET: expected HIT, got '$second'"
+pass "GET /api/v1/affirmations: $first then $second"
+
+# 3. Binary formats bypass the cache
+binary=$(cache_status -H 'Accept: application/msgpack' "$URL")
+[ "$binary" = "BYPASS" ] || fail "msgpack GET: expected BYPASS, got '$binary'"
+pass "Accept: application/msgpack bypasses the cache"
+
+# Query strings bypass the cache: only bare paths are refreshed after writes
+query=$(cache_status "$URL/random?campaign=test")
+[ "$query" = "BYPASS" ] || fail "GET with a query string: expected BYPASS, got '$query'"
+pass "GET with a query string bypasses the cache"
+
+# 4. A write refreshes the cached list before the TTL runs out
+marker="cache-test-$$-$(date +%s)"
+id=$(curl -s -X POST -H 'Content-Type: application/json' \
+    -d "{\"text\": \"$marker\", \"category\": \"test\"}" "$URL" \
+    | python3 -c 'import json, sys; print(json.load(sys.stdin)["id"])')
+[ -n "$id" ] || fail "could not create a test affirmation"
+
+sleep 1  # refreshes run in the background
+body=$(curl -s "$URL")
+status=$(cache_status "$URL")
+echo "$body" | grep -q "$marker" || fail "cached list does not contain the new affirmation"
+[ "$status" = "HIT" ] || fail "refreshed entry: expected HIT, got '$status'"
+pass "POST refreshed the cached list (served as $status)"
+
+# 5. So does a delete
+curl -s -o /dev/null -X DELETE "$URL/$id"
+sleep 1
+curl -s "$URL" | grep -q "$marker" && fail "cached list still contains the deleted affirmation"
+pass "DELETE refreshed the cached list"
+
+echo
+echo "nginx micro-cache OK"
@@ -0,0 +1,76 @@
+#!/bin/bash
+
+# Check replica-set read routing against the stack of docker-compose.replica.yml:
+#   docker-compose -f docker-compose.yml -f docker-compose.replica.yml up -d
+#   bash scripts/test-read-routing.sh
+# Set BASE_URL to test another host (default http://localhost). It uses
+# /api/v1/contacts, which nginx does not cache.
+
+set -e
+
+BASE_URL=${BASE_URL:-http://localhost}
+MEMBERS="openai_outreach_mongodb openai_outreach_mongodb2 openai_outreach_mongodb3"
+READS=${READS:-50}
+
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+NC='\033[0m' # No Color
+
+pass() {
+    echo -e "${GREEN}[✓]${NC} $1"
+}
+
+fail() {
+    echo -e "${RED}[✗]${NC} $1"
+    exit 1
+}
+
+mongo_eval() {
+    docker exec "$1" mongosh --quiet --eval "$2"
+}
+
+# Sum of query counters of the current secondaries and of the primary
+query_counts() {
+    local primary=0 secondaries=0 count
+    for member in $MEMBERS; do
+        count=$(mongo_eval "$member" 'db.serverStatus().opcounters.query')
+        if [ "$(mongo_eval "$member" 'db.hello().isWritablePrimary')" = "true" ]; then
+            primary=$((primary + count))
+        else
+            secondaries=$((secondaries + count))
+        fi
+    done
+    echo "$primary $secondaries"
+}
+
+if ! curl -s -o /dev/null "$BASE_URL/health"; then
+    fail "Backend not reachable at $BASE_URL"
+fi
+
+# 1. Listings are served by secondaries
+read -r primary_before secondaries_before <<< "$(query_counts)"
+for _ in $(seq "$READS"); do
+    curl -s -o /dev/null "$BASE_URL/api/v1/contacts"
+done
+read -r primary_after secondaries_after <<< "$(query_counts)"
+secondary_reads=$((secondaries_after - secondaries_before))
+primary_reads=$((primary_after - primary_before))
+[ "$secondary_reads" -ge "$READS" ] \
+    || fail "Only $secondary_reads of $READS listings went to secondaries ($primary_reads to the primary)"
+pass "$secondary_reads listings served by secondaries, $primary_reads queries on the primary"
+
+# 2. A client reads its own write right after it
+JAR=$(mktemp)
+trap 'rm -f "$JAR"' EXIT
+email="read-routing-$(date +%s%N)@example.com"
+id=$(curl -s -c "$JAR" -X POST "$BASE_URL/api/v1/contacts" \
+    -H "Content-Type: application/json" \
+    -d "{\"first_name\": \"Read\", \"last_name\": \"Routing\", \"email\": \"$email\"}" \
+    | python3 -c 'import json, sys; print(json.load(sys.stdin)["contact_id"])')
+grep -q db_primary_until "$JAR" || fail "No read-your-writes cookie after a write"
+curl -s -b "$JAR" "$BASE_URL/api/v1/contacts" | grep -q "$email" \
+    || fail "Write not visible to its client"
+pass "Write visible to its client immediately (primary read)"
+
+curl -s -o /dev/null -X DELETE "$BASE_URL/api/v1/contacts/$id"
+echo "All read routing checks passed."